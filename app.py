@@ -1,10 +1,16 @@
 import streamlit as st
-import json
 import os
-from rag import ask, generate_hypotheses, vectorstore  
+import sqlite3
+from rag import submit_ask, submit_generate_hypotheses, resources, warm_up, context_stats
+from jobs import job_queue, QueueFullError, QUEUED, DONE, TIMEOUT
+from chat_store import chat_store
+from settings.config import JOB_POLL_INTERVAL, CHAT_LEGACY_FILE
 
 st.set_page_config(page_title="HypGen", layout="wide")
 
+# модель и индекс грузятся в фоне, страница отрисовывается сразу
+warm_up()
+
 
 with open("style.css", "r", encoding="utf-8") as css_file:
     css = css_file.read()
@@ -19,25 +25,15 @@ st.markdown("*   *")
 # система сохранения чатов
 # ============================================================================
 
-CHAT_FILE = "chat_history.json"
-
 def init_chat_history():
-    if 'chat_history' not in st.session_state:
-        if os.path.exists(CHAT_FILE) and os.path.getsize(CHAT_FILE) > 0:
-            try:
-                with open(CHAT_FILE, "r", encoding="utf-8") as f:
-                    st.session_state.chat_history = json.load(f)
-            except (json.JSONDecodeError, Exception):
-                st.session_state.chat_history = {"chat_1": []}
-        else:
-            st.session_state.chat_history = {"chat_1": []}
+    if 'chat_history_ready' not in st.session_state:
+        chat_store.migrate_json(CHAT_LEGACY_FILE)
+        st.session_state.chat_history_ready = True
     
-    if 'current_chat_id' not in st.session_state:
-        if st.session_state.chat_history:
-            st.session_state.current_chat_id = next(iter(st.session_state.chat_history))
-        else:
-            st.session_state.current_chat_id = "chat_1"
-            st.session_state.chat_history["chat_1"] = []
+    # текущий чат мог быть удалён в другой сессии
+    if not chat_store.exists(st.session_state.get('current_chat_id', '')):
+        chats = chat_store.list_chats()
+        st.session_state.current_chat_id = chats[0][0] if chats else chat_store.create_chat()
     
     # Состояние для хранения результатов последней операции
     if 'last_operation' not in st.session_state:
@@ -48,13 +44,12 @@ def init_chat_history():
         st.session_state.last_sources = None    
     if 'last_raw_hypotheses' not in st.session_state:
         st.session_state.last_raw_hypotheses = None  
-
-def save_chat_history():
-    try:
-        with open(CHAT_FILE, "w", encoding="utf-8") as f:
-            json.dump(st.session_state.chat_history, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        st.error(f"Ошибка сохранения чата: {e}")
+    
+    # фоновые задачи текущей сессии: [{"id": ..., "chat_id": ...}]
+    if 'pending_jobs' not in st.session_state:
+        st.session_state.pending_jobs = []
+    if 'job_error' not in st.session_state:
+        st.session_state.job_error = None
 
 def create_new_chat():
     st.session_state.last_operation = None
@@ -62,20 +57,15 @@ def create_new_chat():
     st.session_state.last_sources = None
     st.session_state.last_raw_hypotheses = None
     
-    new_id = f"chat_{len(st.session_state.chat_history) + 1}"
-    st.session_state.chat_history[new_id] = []
-    st.session_state.current_chat_id = new_id
-    save_chat_history()
-    st.success(f"Создан новый чат: {new_id}")
+    st.session_state.current_chat_id = chat_store.create_chat()
+    st.success("Создан новый чат")
 
 def delete_chat(chat_id):
-    if chat_id in st.session_state.chat_history:
-        del st.session_state.chat_history[chat_id]
-        save_chat_history()
-
+    if chat_store.delete_chat(chat_id):
         if st.session_state.current_chat_id == chat_id:
-            if st.session_state.chat_history:
-                st.session_state.current_chat_id = next(iter(st.session_state.chat_history))
+            chats = chat_store.list_chats()
+            if chats:
+                st.session_state.current_chat_id = chats[0][0]
             else:
                 create_new_chat()
         
@@ -89,6 +79,90 @@ def delete_chat(chat_id):
 
 init_chat_history()
 
+# ============================================================================
+# фоновые задачи
+# ============================================================================
+
+def submit_job(kind, fn, **payload):
+    try:
+        job_id = job_queue.submit(kind, fn, **payload)
+    except QueueFullError as e:
+        st.warning(str(e))
+        return
+    st.session_state.pending_jobs.append({"id": job_id, "chat_id": st.session_state.current_chat_id})
+
+def finish_job(job, chat_id):
+    if job.status != DONE:
+        reason = "превышено время ожидания" if job.status == TIMEOUT else job.error
+        st.session_state.job_error = (job.kind, reason)
+        return
+    
+    if job.kind == "generate":
+        final_hypotheses, raw_hypotheses, docs = job.result
+        user_content = f"**Проблема:** {job.payload['problem']}"
+        assistant_content = f"**Гипотезы:**\n\n{final_hypotheses}"
+    else:
+        answer = job.result
+        user_content = f"**Вопрос:** {job.payload['question']}"
+        assistant_content = f"**Ответ:**\n\n{answer}"
+    
+    # чат могли удалить, пока задача выполнялась, — тогда append ничего не запишет
+    try:
+        chat_store.append(chat_id, [
+            {"role": "user", "content": user_content},
+            {"role": "assistant", "content": assistant_content},
+        ])
+    except sqlite3.Error as e:
+        st.error(f"Ошибка сохранения чата: {e}")
+    
+    if chat_id == st.session_state.current_chat_id:
+        if job.kind == "generate":
+            st.session_state.last_operation = 'generate'
+            st.session_state.last_results = final_hypotheses
+            st.session_state.last_sources = docs
+            st.session_state.last_raw_hypotheses = raw_hypotheses
+        else:
+            st.session_state.last_operation = 'qa'
+            st.session_state.last_results = answer
+    
+    st.toast("✓ Гипотезы успешно сгенерированы!" if job.kind == "generate" else "✓ Ответ получен!")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_pending_jobs():
+    finished = False
+    for entry in list(st.session_state.pending_jobs):
+        job = job_queue.get(entry["id"])
+        if job is None:
+            st.session_state.pending_jobs.remove(entry)
+            continue
+        if job.finished:
+            finish_job(job, entry["chat_id"])
+            st.session_state.pending_jobs.remove(entry)
+            finished = True
+            continue
+        
+        if job.status == QUEUED:
+            st.info(f"В очереди... ожидание {job.wait_time:.0f} с")
+        elif job.kind == "generate":
+            if job.partial.get("final"):
+                st.info(f"Критический отбор гипотез... {job.run_time:.0f} с")
+            elif job.partial.get("raw"):
+                st.info(f"Генерация гипотез... {job.run_time:.0f} с")
+            else:
+                st.info(f"Поиск релевантных статей... {job.run_time:.0f} с")
+            if job.partial.get("raw"):
+                st.markdown(job.partial["raw"])
+            if job.partial.get("final"):
+                st.markdown(job.partial["final"])
+        else:
+            st.info(f"Подготовка ответа... {job.run_time:.0f} с")
+            if job.partial.get("answer"):
+                st.markdown(job.partial["answer"])
+    
+    if finished:
+        st.rerun()
+
+
 # ============================================================================
 # боковая панель
 # ============================================================================
@@ -107,26 +181,17 @@ with st.sidebar:
     
     chats_to_delete = []
     
-    if not st.session_state.chat_history:
+    # в списке только заголовки; сообщения читаются для открытого чата
+    chats = chat_store.list_chats()
+    if not chats:
         st.info("Нет сохранённых чатов")
     else:
-        chat_ids = list(st.session_state.chat_history.keys())
-        
-        for chat_id in chat_ids:
-            if chat_id not in st.session_state.chat_history:
-                continue
-                
-            messages = st.session_state.chat_history[chat_id]
-            
-            # название чата
-            if messages:
-                first_user_msg = next((m for m in messages if m.get("role") == "user"), None)
-                if first_user_msg:
-                    chat_name = first_user_msg.get("content", "Чат")[:30]
-                    if len(first_user_msg.get("content", "")) > 30:
-                        chat_name += "..."
-                else:
-                    chat_name = "Пустой чат"
+        for chat_id, title in chats:
+            # название чата — первое сообщение пользователя
+            if title:
+                chat_name = title[:30]
+                if len(title) > 30:
+                    chat_name += "..."
             else:
                 chat_name = "..."
             
@@ -158,6 +223,25 @@ with st.sidebar:
     
     st.markdown("---")
     
+    if resources.is_ready():
+        st.caption("● База знаний загружена")
+    elif resources.error:
+        st.caption(f"✕ Ошибка загрузки базы знаний: {resources.error}")
+    elif resources.lexical_ready():
+        st.caption("○ База знаний загружается, пока работает поиск по ключевым словам...")
+    else:
+        st.caption("○ База знаний загружается...")
+    
+    queue_stats = job_queue.stats()
+    st.caption(
+        f"Очередь: {queue_stats['queued']}/{queue_stats['max_queue']} · "
+        f"выполняется: {queue_stats['running']}/{queue_stats['max_workers']} · "
+        f"среднее время: {queue_stats['avg_run_time']:.0f} с"
+    )
+    packing = context_stats()
+    if packing["requests"]:
+        st.caption(f"Контекст: сэкономлено {packing['tokens_saved']} токенов за {packing['requests']} запросов")
+    
     with st.expander("О системе", expanded=False):
         st.markdown("""
         **HypGen** — интеллектуальный помощник металлурга
@@ -180,6 +264,32 @@ with st.sidebar:
 # генеация гипотез / вопрос-ответ
 # ============================================================================
 
+def render_filters():
+    if not resources.is_available() or not resources.filters_ready():
+        return None
+    filter_index = resources.filter_index
+    years = filter_index.options("year")
+    year_range = None
+    
+    with st.expander("⚲ Фильтры источников", expanded=False):
+        if len(years) > 1:
+            year_range = st.slider("Год публикации", min_value=years[0], max_value=years[-1],
+                                   value=(years[0], years[-1]), key="filter_year")
+        countries = st.multiselect("Страна", filter_index.options("country"), key="filter_country")
+        source_types = st.multiselect("Источник", filter_index.options("source_type"), key="filter_source_type")
+    
+    filters = {}
+    # полный диапазон лет не сужаем: иначе отсеются статьи без года
+    if year_range and year_range != (years[0], years[-1]):
+        filters["year"] = year_range
+    if countries:
+        filters["country"] = countries
+    if source_types:
+        filters["source_type"] = source_types
+    return filters or None
+
+filters = render_filters()
+
 tab1, tab2 = st.tabs(["! | Генерация гипотез ", "? | Вопрос-ответ "])
 
 with tab1:
@@ -195,33 +305,10 @@ with tab1:
         generate_btn = st.button("▷ Сгенерировать", type="primary", key="generate_hypotheses", use_container_width=True)
     
     if generate_btn and problem:
-        if not vectorstore:
+        if not resources.is_available():
             st.error("База знаний не загружена. Пожалуйста, проверьте наличие файлов FAISS индекса.")
         else:
-            with st.spinner("Загрузка..."):
-                try:
-                    final_hypotheses, raw_hypotheses, docs = generate_hypotheses(problem)
-                    
-                    st.session_state.chat_history[st.session_state.current_chat_id].append({
-                        "role": "user", 
-                        "content": f"**Проблема:** {problem}"
-                    })
-                    st.session_state.chat_history[st.session_state.current_chat_id].append({
-                        "role": "assistant", 
-                        "content": f"**Гипотезы:**\n\n{final_hypotheses}"
-                    })
-                    save_chat_history()
-                    
-                    st.session_state.last_operation = 'generate'
-                    st.session_state.last_results = final_hypotheses
-                    st.session_state.last_sources = docs
-                    st.session_state.last_raw_hypotheses = raw_hypotheses
-                    
-                    st.success("✓ Гипотезы успешно сгенерированы!")
-                    
-                except Exception as e:
-                    st.error(f"Ошибка при генерации гипотез: {str(e)}")
-                    st.info("Попробуйте переформулировать проблему или проверьте подключение к GigaChat.")
+            submit_job("generate", submit_generate_hypotheses, problem=problem, filters=filters)
 
 with tab2:
 
@@ -237,30 +324,23 @@ with tab2:
         qa_btn = st.button("▷ Ответить", type="primary", key="qa_answer", use_container_width=True)
     
     if qa_btn and question:
-        if not vectorstore:
+        if not resources.is_available():
             st.error("База знаний не загружена. Пожалуйста, проверьте наличие файлов FAISS индекса.")
         else:
-            with st.spinner("Загрузка..."):
-                try:
-                    answer = ask(question)
-                    st.session_state.chat_history[st.session_state.current_chat_id].append({
-                        "role": "user", 
-                        "content": f"**Вопрос:** {question}"
-                    })
-                    st.session_state.chat_history[st.session_state.current_chat_id].append({
-                        "role": "assistant", 
-                        "content": f"**Ответ:**\n\n{answer}"
-                    })
-                    save_chat_history()
-                    
-                    st.session_state.last_operation = 'qa'
-                    st.session_state.last_results = answer
-                    
-                    st.success("✓ Ответ получен!")
-                    
-                except Exception as e:
-                    st.error(f"Ошибка при поиске ответа: {str(e)}")
-                    st.info("Попробуйте переформулировать вопрос или проверьте подключение к GigaChat.")
+            submit_job("qa", submit_ask, question=question, filters=filters)
+
+if st.session_state.pending_jobs:
+    render_pending_jobs()
+
+if st.session_state.job_error:
+    kind, reason = st.session_state.job_error
+    st.session_state.job_error = None
+    if kind == "generate":
+        st.error(f"Ошибка при генерации гипотез: {reason}")
+        st.info("Попробуйте переформулировать проблему или проверьте подключение к GigaChat.")
+    else:
+        st.error(f"Ошибка при поиске ответа: {reason}")
+        st.info("Попробуйте переформулировать вопрос или проверьте подключение к GigaChat.")
 
 # ============================================================================
 # отображение результатов
@@ -327,7 +407,7 @@ elif st.session_state.last_operation == 'qa':
 # история диалога
 # ============================================================================
 
-current_messages = st.session_state.chat_history.get(st.session_state.current_chat_id, [])
+current_messages = chat_store.messages(st.session_state.current_chat_id)
 
 if current_messages:
     st.markdown("---")
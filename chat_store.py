@@ -0,0 +1,169 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple
+from settings.config import CHAT_DB_FILE
+
+logger = logging.getLogger(__name__)
+
+# История чатов в SQLite (WAL): сообщение — одна вставка строки вместо перезаписи всего файла,
+# сообщения читаются только для открытого чата, а несколько сессий и процессов пишут в одну базу,
+# не затирая чаты друг друга. Порядок чатов — порядок создания (seq).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_chat ON messages(chat_id, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def new_chat_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ChatStore:
+    """Чаты и сообщения в одной базе SQLite; соединение общее для потоков процесса, под блокировкой."""
+
+    def __init__(self, path: Path, timeout: float = 10.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # isolation_level=None: транзакции открываются явно через BEGIN IMMEDIATE
+            conn = sqlite3.connect(str(self.path), timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _write(self, fn):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _read(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def list_chats(self) -> List[Tuple[str, str]]:
+        """[(chat_id, заголовок)] в порядке создания; заголовок — первое сообщение пользователя или ''."""
+        return self._read("SELECT id, title FROM chats ORDER BY seq")
+
+    def exists(self, chat_id: str) -> bool:
+        return bool(self._read("SELECT 1 FROM chats WHERE id = ?", (chat_id,)))
+
+    def create_chat(self) -> str:
+        chat_id = new_chat_id()
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO chats (id, created) VALUES (?, ?)", (chat_id, time.time())))
+        return chat_id
+
+    def delete_chat(self, chat_id: str) -> bool:
+        return self._write(lambda conn: conn.execute(
+            "DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount > 0)
+
+    def messages(self, chat_id: str) -> List[Dict]:
+        rows = self._read("SELECT role, content FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,))
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, chat_id: str, messages: List[Dict]) -> bool:
+        """Дописывает сообщения в чат одной транзакцией; False, если чат уже удалён."""
+        def insert(conn):
+            if not conn.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone():
+                return False
+            self._insert_messages(conn, chat_id, messages)
+            return True
+        return self._write(insert)
+
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, chat_id: str, messages: List[Dict]):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO messages (chat_id, role, content, created) VALUES (?, ?, ?, ?)",
+            [(chat_id, m.get("role", "user"), m.get("content", ""), now) for m in messages])
+        title = next((m.get("content", "") for m in messages if m.get("role") == "user"), None)
+        if title:
+            conn.execute("UPDATE chats SET title = ? WHERE id = ? AND title = ''", (title, chat_id))
+
+    def migrate_json(self, path: Path) -> int:
+        """Переносит chat_history.json прежнего формата {chat_id: [сообщения]}; возвращает число чатов.
+
+        Перенос выполняется один раз на базу (отметка в meta), файл после этого переименовывается в *.migrated.
+        """
+        path = Path(path)
+        if not path.exists() or path.stat().st_size == 0:
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать {path} для переноса чатов: {e}")
+            return 0
+        if not isinstance(history, dict):
+            logger.warning(f"Неожиданный формат {path}, перенос чатов пропущен")
+            return 0
+
+        def migrate(conn):
+            marker = f"migrated:{path.resolve()}"
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return None
+            now = time.time()
+            for old_id, messages in history.items():
+                # прежние id вида chat_N сохраняются, если не заняты
+                taken = conn.execute("SELECT 1 FROM chats WHERE id = ?", (old_id,)).fetchone()
+                chat_id = new_chat_id() if taken else str(old_id)
+                conn.execute("INSERT INTO chats (id, created) VALUES (?, ?)", (chat_id, now))
+                self._insert_messages(conn, chat_id, [m for m in messages or [] if isinstance(m, dict)])
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(now)))
+            return len(history)
+
+        migrated = self._write(migrate)
+        if migrated is not None:
+            logger.info(f"Перенесено чатов из {path}: {migrated}")
+        try:
+            path.replace(path.with_name(path.name + ".migrated"))
+        except OSError as e:
+            logger.warning(f"Не удалось переименовать {path}: {e}")
+        return migrated or 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+chat_store = ChatStore(CHAT_DB_FILE)
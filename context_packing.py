@@ -0,0 +1,175 @@
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+from langchain_core.documents import Document
+from lexical_index import tokenize
+from settings.config import CONTEXT_MMR_LAMBDA, CONTEXT_MIN_FRAGMENT_TOKENS
+from truncation import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Сборка контекста под бюджет токенов:
+#   1. дубли (один и тот же чанк, найденный дважды) отбрасываются;
+#   2. соседние и перекрывающиеся чанки одного source склеиваются по start_token / end_token —
+#      перекрытие OVERLAP_TOKENS попадает в промпт один раз;
+#   3. фрагменты отбираются MMR: релевантность — позиция в выдаче поиска, разнообразие —
+#      косинус по словам, пока не заполнен бюджет;
+#   4. фрагмент, который не влезает целиком, обрезается по предложениям под остаток бюджета
+#      (если остаток не меньше CONTEXT_MIN_FRAGMENT_TOKENS, а для первого фрагмента — всегда).
+
+
+def _tokens(doc: Document) -> int:
+    # chunk_tokens посчитан при нарезке; для старых индексов без него — грубая оценка
+    return int(doc.metadata.get("chunk_tokens") or 0) or max(1, len(doc.page_content) // 4)
+
+
+def _merge_text(left: str, right: str) -> str:
+    """Склеивает тексты соседних чанков, убирая общий фрагмент на стыке."""
+    probe = right[:64]
+    position = left.rfind(probe) if probe else -1
+    while position != -1:
+        if right.startswith(left[position:]):
+            return left + right[len(left) - position:]
+        position = left.rfind(probe, 0, position)
+    return left + " " + right
+
+
+def _merge(group: List[Tuple[int, Document]]) -> Tuple[int, Document]:
+    rank, first = group[0]
+    text = first.page_content
+    tokens = _tokens(first)
+    end = int(first.metadata.get("end_token") or 0)
+    for _, doc in group[1:]:
+        text = _merge_text(text, doc.page_content)
+        tokens += _tokens(doc) - max(0, end - int(doc.metadata.get("start_token") or 0))
+        end = int(doc.metadata.get("end_token") or 0)
+    metadata = dict(first.metadata)
+    metadata.update({
+        "chunk_id": "+".join(str(d.metadata.get("chunk_id", "")) for _, d in group),
+        "chunk_tokens": tokens,
+        "end_token": end,
+        "merged_chunks": len(group),
+    })
+    return min(r for r, _ in group), Document(page_content=text, metadata=metadata)
+
+
+def merge_adjacent(docs: List[Document]) -> List[Tuple[int, Document]]:
+    """[(лучший ранг, документ)]: чанки одного source с пересекающимися или смежными диапазонами склеены."""
+    by_source = {}
+    for rank, doc in enumerate(docs):
+        by_source.setdefault(doc.metadata.get("source") or f"#{rank}", []).append((rank, doc))
+    spans = []
+    for items in by_source.values():
+        items.sort(key=lambda item: int(item[1].metadata.get("start_token") or 0))
+        group = [items[0]]
+        for rank, doc in items[1:]:
+            previous = group[-1][1]
+            mergeable = not previous.metadata.get("is_full_text") and not doc.metadata.get("is_full_text")
+            if mergeable and int(doc.metadata.get("start_token") or 0) <= int(previous.metadata.get("end_token") or 0):
+                group.append((rank, doc))
+                continue
+            spans.append(_merge(group) if len(group) > 1 else group[0])
+            group = [(rank, doc)]
+        spans.append(_merge(group) if len(group) > 1 else group[0])
+    spans.sort(key=lambda span: span[0])
+    return spans
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+class ContextPacker:
+    def __init__(self, mmr_lambda: float = CONTEXT_MMR_LAMBDA, min_fragment_tokens: int = CONTEXT_MIN_FRAGMENT_TOKENS):
+        self.mmr_lambda = mmr_lambda
+        self.min_fragment_tokens = min_fragment_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_retrieved = 0
+        self.tokens_packed = 0
+        self.tokens_saved = 0
+
+    def pack(self, docs: List[Document], budget: int, prompts: int = 1) -> Tuple[List[Document], Dict]:
+        """Возвращает документы для контекста и отчёт об экономии токенов.
+
+        prompts — во сколько промптов попадёт контекст (генератор и критик получают один и тот же).
+        """
+        unique = []
+        seen = set()
+        for doc in docs:
+            key = (doc.metadata.get("chunk_id"), doc.page_content)
+            if key not in seen:
+                seen.add(key)
+                unique.append(doc)
+
+        spans = merge_adjacent(unique)
+        words = [Counter(tokenize(doc.page_content)) for _, doc in spans]
+        candidates = list(range(len(spans)))
+        selected = []
+        used = 0
+        truncated = 0
+        while candidates:
+            def score(i):
+                relevance = 1.0 - spans[i][0] / max(1, len(docs))
+                redundancy = max((_cosine(words[i], words[j]) for j in selected), default=0.0)
+                return self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+
+            best = max(candidates, key=score)
+            candidates.remove(best)
+            tokens = _tokens(spans[best][1])
+            if used + tokens <= budget:
+                selected.append(best)
+                used += tokens
+                continue
+            # самый релевантный фрагмент берём всегда, при необходимости обрезав под бюджет
+            if selected and budget - used < self.min_fragment_tokens:
+                continue
+            rank, doc = spans[best]
+            text, tokens = truncate_to_tokens(doc.page_content, budget - used)
+            if not text:
+                continue
+            spans[best] = (rank, Document(page_content=text, metadata={
+                **doc.metadata, "chunk_tokens": tokens, "truncated": True,
+            }))
+            selected.append(best)
+            used += tokens
+            truncated += 1
+
+        packed = [spans[i][1] for i in selected]
+        retrieved = sum(_tokens(doc) for doc in docs)
+        report = {
+            "chunks_retrieved": len(docs),
+            "duplicates": len(docs) - len(unique),
+            "merged": len(unique) - len(spans),
+            "dropped": len(spans) - len(selected),
+            "truncated": truncated,
+            "tokens_retrieved": retrieved,
+            "tokens_packed": used,
+            "tokens_saved": max(0, retrieved - used) * prompts,
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens_retrieved += retrieved * prompts
+            self.tokens_packed += used * prompts
+            self.tokens_saved += report["tokens_saved"]
+        logger.info(
+            f"Контекст: фрагментов {len(packed)}, токенов {used}/{budget}, "
+            f"сэкономлено {report['tokens_saved']} (дубли: {report['duplicates']}, "
+            f"склеено: {report['merged']}, отброшено: {report['dropped']}, обрезано: {truncated})"
+        )
+        return packed, report
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "tokens_retrieved": self.tokens_retrieved,
+            "tokens_packed": self.tokens_packed,
+            "tokens_saved": self.tokens_saved,
+        }
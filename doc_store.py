@@ -0,0 +1,237 @@
+import json
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+# Колоночное хранилище чанков вместо index.pkl.
+# Для каждого текстового поля: <поле>.dat — склеенные UTF-8 строки, <поле>.off — смещения uint64 (n + 1).
+# Целочисленные поля лежат массивом int64 в <поле>.i64. Строка i соответствует вектору i в index.faiss.
+# Файлы открываются через memory-map, поэтому несколько процессов делят одну копию в page cache ОС.
+
+TEXT_FIELDS = ("page_content", "chunk_id", "title", "source", "pdf_url", "doi", "country", "type")
+JSON_FIELDS = ("authors", "year")
+INT_FIELDS = ("total_tokens", "chunk_tokens", "start_token", "end_token", "is_full_text")
+BOOL_FIELDS = ("is_full_text",)
+DOCSTORE_DIRNAME = "docstore"
+FILTERS_FILENAME = "filters.npz"
+FILTER_FIELDS = ("year", "country", "source_type")
+SOURCE_TYPES = {"arxiv:": "arxiv", "https://openalex.org/": "openalex", "semanticscholar:": "semanticscholar"}
+
+
+def _field_value(doc: Document, field: str):
+    if field == "page_content":
+        return doc.page_content
+    return doc.metadata.get(field)
+
+
+def source_type(source: str) -> str:
+    for prefix, name in SOURCE_TYPES.items():
+        if (source or "").startswith(prefix):
+            return name
+    return "other"
+
+
+def _filter_value(doc: Document, field: str):
+    if field == "source_type":
+        return source_type(doc.metadata.get("source", ""))
+    value = doc.metadata.get(field)
+    if field == "year":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value or None
+
+
+class FilterIndex:
+    """Битовые карты по значениям year / country / source_type.
+
+    Для каждого значения поля хранится битовая карта строк (бит i — вектор i индекса),
+    фильтр собирается OR внутри поля и AND между полями, а результат передаётся
+    в FAISS как IDSelectorBitmap — поиск сразу идёт только по подходящим векторам.
+    """
+
+    def __init__(self, size: int, bitmaps: Dict[str, Dict[object, np.ndarray]]):
+        self.size = size
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def build(cls, documents: Iterable[Document]) -> "FilterIndex":
+        documents = list(documents)
+        masks = {field: {} for field in FILTER_FIELDS}
+        for row, doc in enumerate(documents):
+            for field in FILTER_FIELDS:
+                value = _filter_value(doc, field)
+                if value is None:
+                    continue
+                if value not in masks[field]:
+                    masks[field][value] = np.zeros(len(documents), dtype=bool)
+                masks[field][value][row] = True
+        bitmaps = {field: {value: np.packbits(mask, bitorder="little") for value, mask in values.items()}
+                   for field, values in masks.items()}
+        return cls(len(documents), bitmaps)
+
+    def save(self, path: Path):
+        arrays = {"size": np.array([self.size])}
+        for field, values in self.bitmaps.items():
+            keys = sorted(values)
+            arrays[f"{field}__values"] = np.array(keys)
+            arrays[f"{field}__bits"] = np.stack([values[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.uint8)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "FilterIndex":
+        with np.load(path) as data:
+            size = int(data["size"][0])
+            bitmaps = {}
+            for field in FILTER_FIELDS:
+                values = data[f"{field}__values"].tolist()
+                bits = data[f"{field}__bits"]
+                bitmaps[field] = {value: bits[i] for i, value in enumerate(values)}
+        return cls(size, bitmaps)
+
+    def options(self, field: str) -> list:
+        return sorted(self.bitmaps.get(field, {}))
+
+    def bitmap(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Упакованная битовая карта подходящих строк или None, если фильтр пустой.
+
+        filters: {"year": (от, до), "country": [...], "source_type": [...]}
+        """
+        if not filters:
+            return None
+        result = None
+        for field, wanted in filters.items():
+            values = self.bitmaps.get(field, {})
+            if field == "year":
+                low, high = wanted
+                selected = [bits for year, bits in values.items() if low <= year <= high]
+            else:
+                selected = [values[v] for v in wanted if v in values]
+            combined = np.bitwise_or.reduce(selected) if selected else np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            result = combined if result is None else result & combined
+        return result
+
+    def count(self, bitmap: np.ndarray) -> int:
+        return int(np.unpackbits(bitmap, bitorder="little")[:self.size].sum())
+
+
+def write_docstore(documents: List[Document], directory: Path):
+    """Записывает документы в порядке векторов индекса; существующее хранилище заменяется целиком."""
+    directory = Path(directory)
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    for field in TEXT_FIELDS + JSON_FIELDS:
+        offsets = np.zeros(len(documents) + 1, dtype=np.uint64)
+        with open(tmp_dir / f"{field}.dat", "wb") as f:
+            position = 0
+            for i, doc in enumerate(documents):
+                value = _field_value(doc, field)
+                if field in JSON_FIELDS:
+                    data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+                else:
+                    data = ("" if value is None else str(value)).encode("utf-8")
+                f.write(data)
+                position += len(data)
+                offsets[i + 1] = position
+        offsets.tofile(tmp_dir / f"{field}.off")
+
+    for field in INT_FIELDS:
+        values = np.array([int(_field_value(doc, field) or 0) for doc in documents], dtype=np.int64)
+        values.tofile(tmp_dir / f"{field}.i64")
+
+    FilterIndex.build(documents).save(tmp_dir / FILTERS_FILENAME)
+
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"num_documents": len(documents), "text_fields": TEXT_FIELDS,
+                   "json_fields": JSON_FIELDS, "int_fields": INT_FIELDS}, f, ensure_ascii=False)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    tmp_dir.rename(directory)
+
+
+def _memmap(path: Path, dtype) -> np.ndarray:
+    # np.memmap не открывает файлы нулевой длины
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class RowIds(Mapping):
+    """index_to_docstore_id без словаря на каждый вектор: id документа — номер строки."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return str(i)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class ReadOnlyDocstoreError(RuntimeError):
+    pass
+
+
+class MmapDocstore(Docstore):
+    """Docstore только для чтения: Document собирается лишь для найденных строк."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.size = meta["num_documents"]
+        self._text = {}
+        for field in meta["text_fields"] + meta["json_fields"]:
+            self._text[field] = (
+                _memmap(self.directory / f"{field}.off", np.uint64),
+                _memmap(self.directory / f"{field}.dat", np.uint8),
+            )
+        self._json_fields = set(meta["json_fields"])
+        self._ints = {field: _memmap(self.directory / f"{field}.i64", np.int64) for field in meta["int_fields"]}
+
+    def __len__(self):
+        return self.size
+
+    def _get(self, row: int, field: str):
+        if field in self._ints:
+            value = int(self._ints[field][row])
+            return bool(value) if field in BOOL_FIELDS else value
+        offsets, data = self._text[field]
+        text = data[int(offsets[row]):int(offsets[row + 1])].tobytes().decode("utf-8")
+        return json.loads(text) if field in self._json_fields else text
+
+    def get_field(self, row: int, field: str):
+        return self._get(row, field)
+
+    def document(self, row: int) -> Document:
+        metadata = {field: self._get(row, field) for field in list(self._text) + list(self._ints)
+                    if field != "page_content"}
+        return Document(page_content=self._get(row, "page_content"), metadata=metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            row = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        if not 0 <= row < self.size:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise ReadOnlyDocstoreError("MmapDocstore доступен только для чтения, пересоберите индекс")
+
+    def delete(self, ids: List) -> None:
+        raise ReadOnlyDocstoreError("MmapDocstore доступен только для чтения, пересоберите индекс")
@@ -0,0 +1,360 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EVICTION_POLICIES = ("lru", "lfu", "fifo")
+
+
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def query_key(text: str, model_name: str) -> str:
+    return hashlib.sha1(f"{model_name}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """Ограниченный кэш в памяти с вытеснением lru / lfu / fifo."""
+
+    def __init__(self, max_entries: int = 1024, policy: str = "lru"):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Неизвестная политика вытеснения: {policy}")
+        self.max_entries = max_entries
+        self.policy = policy
+        self._data = OrderedDict()
+        self._freq = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        if key not in self._data:
+            return None
+        if self.policy == "lru":
+            self._data.move_to_end(key)
+        elif self.policy == "lfu":
+            self._freq[key] += 1
+        return self._data[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        if key in self._data:
+            self._data[key] = value
+            if self.policy == "lru":
+                self._data.move_to_end(key)
+            return
+        while len(self._data) >= self.max_entries:
+            self._evict()
+        self._data[key] = value
+        self._freq[key] = 1
+
+    def pop(self, key):
+        self._freq.pop(key, None)
+        return self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self._freq.clear()
+
+    def _evict(self):
+        if self.policy == "lfu":
+            # при равной частоте вытесняется более старая запись
+            victim = min(self._data, key=lambda k: self._freq[k])
+        else:
+            victim = next(iter(self._data))
+        self.pop(victim)
+
+
+class DiskVectorStore:
+    """Кольцевой буфер векторов float32 в memory-mapped файле, общий для нескольких процессов.
+
+    vectors.f32 — матрица до capacity x dim, keys.jsonl — журнал записей (ключ, порядковый номер).
+    Запись с номером seq лежит в строке seq % capacity, поэтому при заполнении
+    новые записи перезаписывают самые старые. Файл векторов растёт удвоением по мере записи,
+    а не выделяется на всю ёмкость сразу.
+
+    Несколько процессов Streamlit работают с одним каталогом: get и put выполняются под файловой
+    блокировкой, и перед ними дочитывается хвост журнала, записанный другими процессами, —
+    номер seq и строка выдаются по общему журналу, а не по счётчику процесса.
+    """
+
+    INITIAL_ROWS = 1024
+
+    def __init__(self, directory: Path, dim: int, capacity: int = 100_000):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.capacity = capacity
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.directory / "vectors.f32"
+        self._keys_path = self.directory / "keys.jsonl"
+        self._meta_path = self.directory / "meta.json"
+        self._file_lock = FileLock(str(self.directory / "store.lock"))
+        self._vectors = None
+        self._rows = 0
+        self._seqs = {}
+        self._row_keys = {}
+        self._next_seq = 0
+        self._log_offset = 0
+        self._log_id = None
+        with self._file_lock:
+            self._open()
+
+    def _open(self):
+        meta = {}
+        if self._meta_path.exists():
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("capacity") != self.capacity:
+            if meta:
+                logger.info(f"Параметры кэша {self.directory} изменились, кэш сброшен")
+            self._vectors_path.unlink(missing_ok=True)
+            self._keys_path.unlink(missing_ok=True)
+            with open(self._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "capacity": self.capacity}, f)
+        self._vectors_path.touch()
+        self._remap()
+
+        log_lines = self._sync()
+        if log_lines > 2 * max(len(self._seqs), 1):
+            self._compact_log()
+
+    def _remap(self, rows: int = 0):
+        """Отображает файл векторов; при rows больше текущего размера файл сначала растёт."""
+        # отображение закрывается до изменения размера файла (на Windows иначе truncate не пройдёт)
+        self._vectors = None
+        row_bytes = self.dim * 4
+        size = self._vectors_path.stat().st_size
+        if rows * row_bytes > size:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(rows * row_bytes)
+            size = rows * row_bytes
+        self._rows = size // row_bytes
+        if self._rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._rows, self.dim))
+
+    def _sync(self) -> int:
+        """Дочитывает записи журнала, добавленные другими процессами; возвращает число прочитанных строк."""
+        try:
+            stat = self._keys_path.stat()
+        except FileNotFoundError:
+            stat = None
+        log_id = (stat.st_dev, stat.st_ino) if stat else None
+        if log_id != self._log_id or (stat and stat.st_size < self._log_offset):
+            # журнал сжат или очищен другим процессом — читаем заново
+            self._seqs.clear()
+            self._next_seq = 0
+            self._log_offset = 0
+            self._log_id = log_id
+        if stat is None or stat.st_size == self._log_offset:
+            self._drop_overwritten()
+            return 0
+
+        log_lines = 0
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # строка ещё дописывается
+                    break
+                self._log_offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._seqs[record["key"]] = record["seq"]
+                self._next_seq = max(self._next_seq, record["seq"] + 1)
+                log_lines += 1
+        self._drop_overwritten()
+        return log_lines
+
+    def _drop_overwritten(self):
+        oldest_live = self._next_seq - self.capacity
+        if oldest_live > 0:
+            self._seqs = {k: s for k, s in self._seqs.items() if s >= oldest_live}
+        self._row_keys = {s % self.capacity: k for k, s in self._seqs.items()}
+
+    def _compact_log(self):
+        tmp_path = self._keys_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, seq in sorted(self._seqs.items(), key=lambda item: item[1]):
+                f.write(json.dumps({"key": key, "seq": seq}) + "\n")
+        tmp_path.replace(self._keys_path)
+        stat = self._keys_path.stat()
+        self._log_id = (stat.st_dev, stat.st_ino)
+        self._log_offset = stat.st_size
+
+    def __len__(self):
+        return len(self._seqs)
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        seq = self._seqs.get(key)
+        if seq is None or seq < self._next_seq - self.capacity:
+            return None
+        row = seq % self.capacity
+        if row >= self._rows:
+            # файл вырос в другом процессе
+            self._remap()
+            if row >= self._rows:
+                return None
+        return np.array(self._vectors[row])
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._file_lock:
+            self._sync()
+            return self._get(key)
+
+    def put(self, key: str, vector):
+        with self._file_lock:
+            self._sync()
+            if self._get(key) is not None:
+                return
+            seq = self._next_seq
+            row = seq % self.capacity
+            if row >= self._rows:
+                self._remap(min(self.capacity, max(row + 1, 2 * self._rows, self.INITIAL_ROWS)))
+            self._vectors[row] = np.asarray(vector, dtype=np.float32)
+            self._vectors.flush()
+            line = (json.dumps({"key": key, "seq": seq}) + "\n").encode("utf-8")
+            with open(self._keys_path, "ab") as f:
+                f.write(line)
+            self._log_offset += len(line)
+            if self._log_id is None:
+                stat = self._keys_path.stat()
+                self._log_id = (stat.st_dev, stat.st_ino)
+            overwritten = self._row_keys.get(row)
+            if overwritten is not None and self._seqs.get(overwritten) == seq - self.capacity:
+                del self._seqs[overwritten]
+            self._seqs[key] = seq
+            self._row_keys[row] = key
+            self._next_seq = seq + 1
+
+    def clear(self):
+        with self._file_lock:
+            self._seqs.clear()
+            self._row_keys.clear()
+            self._next_seq = 0
+            self._keys_path.unlink(missing_ok=True)
+            self._log_offset = 0
+            self._log_id = None
+
+
+class QueryEmbeddingCache:
+    """Двухуровневый кэш эмбеддингов запросов: LRU в памяти + memory-mapped файл на диске."""
+
+    def __init__(self, model_name: str, cache_dir: Optional[Path] = None, max_entries: int = 1024,
+                 disk_capacity: int = 100_000, policy: str = "lru"):
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_capacity = disk_capacity
+        self.memory = MemoryCache(max_entries=max_entries, policy=policy)
+        self.disk = None
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _disk_for(self, dim: int) -> Optional[DiskVectorStore]:
+        if self.cache_dir is None or self.disk_capacity <= 0:
+            return None
+        if self.disk is None:
+            model_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name)
+            try:
+                self.disk = DiskVectorStore(self.cache_dir / model_slug, dim=dim, capacity=self.disk_capacity)
+            except OSError as e:
+                logger.warning(f"Дисковый кэш эмбеддингов недоступен: {e}")
+                self.disk_capacity = 0
+                return None
+        return self.disk
+
+    def _open_existing_disk(self) -> Optional[DiskVectorStore]:
+        if self.disk is not None or self.cache_dir is None or self.disk_capacity <= 0:
+            return self.disk
+        model_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name)
+        meta_path = self.cache_dir / model_slug / "meta.json"
+        if not meta_path.exists():
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                dim = json.load(f)["dim"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            return None
+        return self._disk_for(dim)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = query_key(text, self.model_name)
+        with self._lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.hits_memory += 1
+                return list(vector)
+            disk = self._open_existing_disk()
+            if disk is not None:
+                stored = disk.get(key)
+                if stored is not None:
+                    self.hits_disk += 1
+                    vector = stored.tolist()
+                    self.memory.put(key, vector)
+                    return list(vector)
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector: List[float]):
+        key = query_key(text, self.model_name)
+        with self._lock:
+            self.memory.put(key, list(vector))
+            disk = self._disk_for(len(vector))
+            if disk is not None:
+                disk.put(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            if self._open_existing_disk() is not None:
+                self.disk.clear()
+            self.hits_memory = self.hits_disk = self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "policy": self.memory.policy,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Обёртка над моделью эмбеддингов: запросы берутся из кэша, документы считаются как обычно."""
+
+    def __init__(self, embeddings: Embeddings, cache: QueryEmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(text, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
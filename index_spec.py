@@ -0,0 +1,126 @@
+# Тип FAISS индекса задаётся строкой "<тип>[:параметр=значение,...]", например:
+#     flat
+#     hnsw:M=32,efConstruction=200,efSearch=64
+#     ivf:nlist=64,nprobe=8
+#     ivfpq:nlist=64,m=64,nbits=8,nprobe=8
+from typing import Dict
+import faiss
+import numpy as np
+
+INDEX_TYPES = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivf": {"nlist": 64, "nprobe": 8},
+    "ivfpq": {"nlist": 64, "m": 64, "nbits": 8, "nprobe": 8},
+}
+# параметры, которые задаются при поиске, а не при построении
+SEARCH_PARAMS = ("efSearch", "nprobe")
+
+
+def parse_spec(spec: str) -> Dict:
+    kind, _, params_str = (spec or "flat").strip().partition(":")
+    kind = kind.lower().replace("-", "").replace("_", "")
+    if kind == "ivfflat":
+        kind = "ivf"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный тип индекса: {kind}. Доступны: {', '.join(INDEX_TYPES)}")
+    params = dict(INDEX_TYPES[kind])
+    for item in filter(None, (p.strip() for p in params_str.split(","))):
+        name, _, value = item.partition("=")
+        if name not in params:
+            raise ValueError(f"Параметр {name} не поддерживается индексом {kind}")
+        params[name] = int(value)
+    return {"type": kind, **params}
+
+
+def format_spec(parsed: Dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in parsed.items() if k != "type")
+    return f"{parsed['type']}:{params}" if params else parsed["type"]
+
+
+def min_training_vectors(parsed: Dict) -> int:
+    # PQ обучает 2**nbits центроидов в каждом подпространстве, и обучающих векторов должно быть не меньше;
+    # nlist, в отличие от nbits, урезается до числа векторов в build_index
+    return 2 ** parsed["nbits"] if parsed["type"] == "ivfpq" else 0
+
+
+def check_training_size(parsed: Dict, n: int):
+    required = min_training_vectors(parsed)
+    if n < required:
+        raise ValueError(f"Индексу {format_spec(parsed)} нужно не меньше {required} векторов для обучения "
+                         f"(2**nbits), а их {n}: уменьшите nbits или выберите flat / ivf")
+
+
+def build_index(parsed: Dict, vectors: np.ndarray) -> faiss.Index:
+    """Создаёт, обучает (если нужно) и заполняет индекс векторами."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    check_training_size(parsed, n)
+    kind = parsed["type"]
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, parsed["M"])
+        index.hnsw.efConstruction = parsed["efConstruction"]
+    else:
+        # число кластеров не может превышать число обучающих векторов
+        nlist = max(1, min(parsed["nlist"], n))
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % parsed["m"] != 0:
+                raise ValueError(f"Размерность {dim} должна делиться на m={parsed['m']}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, parsed["m"], parsed["nbits"])
+        index.train(vectors)
+        # quantizer должен жить столько же, сколько индекс
+        index.own_fields = True
+        quantizer.this.disown()
+    apply_search_params(index, parsed)
+    if n:
+        index.add(vectors)
+    return index
+
+
+def apply_search_params(index: faiss.Index, parsed: Dict):
+    space = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS:
+        if name in parsed:
+            space.set_index_parameter(index, name, parsed[name])
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    # параметры поиска при передаче params берутся из них, а не из индекса — переносим efSearch / nprobe
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def supports_removal(parsed: Dict) -> bool:
+    # HNSW не умеет удалять векторы, а IVF после remove_ids не перенумеровывает оставшиеся,
+    # на что рассчитывает FAISS.delete из langchain
+    return parsed["type"] == "flat"
+
+
+def read_index(path, mmap: bool = False) -> faiss.Index:
+    """Читает индекс; при mmap=True — только для чтения через memory-map.
+
+    Векторы тогда не копируются в память процесса: несколько процессов
+    на одной машине работают с одной копией файла в page cache ОС.
+    """
+    if not mmap:
+        return faiss.read_index(str(path))
+    # IO_FLAG_MMAP_IFC отображает коды flat/HNSW/IVF-хранилищ, IO_FLAG_MMAP — списки IVF
+    for flag in (faiss.IO_FLAG_MMAP_IFC, faiss.IO_FLAG_MMAP):
+        try:
+            return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(str(path))
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
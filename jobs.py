@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+from settings.config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_TIMEOUT, JOB_HISTORY_SIZE
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+FINISHED_STATUSES = (DONE, FAILED, TIMEOUT)
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str = QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # промежуточный текст по этапам; после запуска — общий словарь future.partial конвейера
+    partial: Dict[str, str] = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    future: Optional[Future] = field(default=None, repr=False)
+    timer: Optional[threading.Timer] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def wait_time(self) -> float:
+        return (self.started_at or time.time()) - self.submitted_at
+
+    @property
+    def run_time(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobQueue:
+    """Очередь фоновых задач поверх общего конвейера rag.pipeline, переживающая перезапуски скрипта Streamlit.
+
+    Задача — функция, запускающая запрос в конвейере и возвращающая его PipelineFuture
+    (submit_ask, submit_generate_hypotheses), поэтому одинаковые задачи склеиваются.
+    Одновременно выполняется не больше max_workers задач, остальные ждут в очереди;
+    срок JOB_TIMEOUT отсчитывается таймером с момента запуска и не зависит от того,
+    пришёл ли от модели хоть один токен. UI опрашивает статус и partial по id.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE,
+                 timeout: float = JOB_TIMEOUT, history_size: int = JOB_HISTORY_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._waiting = deque()
+
+    def submit(self, kind: str, start: Callable[..., Future], **payload) -> str:
+        with self._lock:
+            if self._count(QUEUED) >= self.max_queue:
+                raise QueueFullError(f"Очередь заполнена ({self.max_queue} задач), попробуйте позже")
+            job = Job(id=uuid.uuid4().hex, kind=kind, payload=payload)
+            self._jobs[job.id] = job
+            self._waiting.append((job, start))
+            self._trim_history()
+        logger.info(f"Задача {job.id} ({kind}) поставлена в очередь")
+        self._dispatch()
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if not self._waiting or self._count(RUNNING) >= self.max_workers:
+                    return
+                job, start = self._waiting.popleft()
+                job.started_at = time.time()
+                job.status = RUNNING
+            self._start(job, start)
+
+    def _start(self, job: Job, start: Callable[..., Future]):
+        try:
+            future = start(**job.payload)
+        except Exception as e:
+            logger.exception(f"Задача {job.id} не запустилась")
+            self._finish(job, FAILED, error=str(e))
+            return
+        job.future = future
+        job.partial = future.partial
+        if self.timeout:
+            job.timer = threading.Timer(self.timeout, self._expire, args=(job,))
+            job.timer.daemon = True
+            job.timer.start()
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+    def _on_done(self, job: Job, future: Future):
+        if future.cancelled():
+            # отменяет только _expire, статус уже выставлен
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Задача {job.id} завершилась с ошибкой: {error!r}")
+            self._finish(job, FAILED, error=str(error))
+        else:
+            self._finish(job, DONE, result=future.result())
+
+    def _expire(self, job: Job):
+        if self._finish(job, TIMEOUT, error=f"Превышено время выполнения задачи ({self.timeout} с)"):
+            # снимает ожидание задачи; общий запрос конвейера отменится, если его больше никто не ждёт
+            job.future.cancel()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: str = None) -> bool:
+        with self._lock:
+            if job.finished:
+                return False
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            job.status = status
+        if job.timer is not None:
+            job.timer.cancel()
+        logger.info(f"Задача {job.id}: {job.status}, ожидание {job.wait_time:.1f} с, выполнение {job.run_time:.1f} с")
+        self._dispatch()
+        return True
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.finished]
+            run_times = [job.run_time for job in finished]
+            return {
+                "queued": self._count(QUEUED),
+                "running": self._count(RUNNING),
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "finished": len(finished),
+                "avg_run_time": sum(run_times) / len(run_times) if run_times else 0.0,
+            }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,115 @@
+import json
+import math
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+
+# BM25 по тексту чанков. Строка i соответствует вектору i в index.faiss и строке i колоночного хранилища.
+# На диске: terms.json — словарь, postings.off — смещения (uint64, n_terms + 1),
+# postings.doc / postings.tf — номера строк (uint32) и частоты термина (uint16), doc_len.u32 — длины чанков.
+# Списки постингов открываются через memory-map, в памяти держится только словарь.
+
+LEXICAL_DIRNAME = "bm25"
+TOKEN_RE = re.compile(r"[0-9a-zа-яё]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    # химические формулы и марки (Al2O3, TiN, 08Ю) остаются одним токеном
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def write_lexical_index(texts: Iterable[str], directory: Path):
+    directory = Path(directory)
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    postings = {}
+    doc_lens = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_lens.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, min(tf, np.iinfo(np.uint16).max)))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    docs = []
+    tfs = []
+    for i, term in enumerate(terms):
+        rows, freqs = zip(*postings[term])
+        docs.extend(rows)
+        tfs.extend(freqs)
+        offsets[i + 1] = len(docs)
+
+    offsets.tofile(tmp_dir / "postings.off")
+    np.asarray(docs, dtype=np.uint32).tofile(tmp_dir / "postings.doc")
+    np.asarray(tfs, dtype=np.uint16).tofile(tmp_dir / "postings.tf")
+    np.asarray(doc_lens, dtype=np.uint32).tofile(tmp_dir / "doc_len.u32")
+    with open(tmp_dir / "terms.json", "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False)
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "num_documents": len(doc_lens),
+            "avg_doc_len": float(np.mean(doc_lens)) if doc_lens else 0.0,
+            "k1": BM25_K1,
+            "b": BM25_B,
+        }, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    tmp_dir.rename(directory)
+
+
+def _memmap(path: Path, dtype) -> np.ndarray:
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class LexicalIndex:
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(self.directory / "terms.json", "r", encoding="utf-8") as f:
+            self._term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.size = meta["num_documents"]
+        self.avg_doc_len = meta["avg_doc_len"] or 1.0
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self._offsets = _memmap(self.directory / "postings.off", np.uint64)
+        self._docs = _memmap(self.directory / "postings.doc", np.uint32)
+        self._tfs = _memmap(self.directory / "postings.tf", np.uint16)
+        self._doc_lens = np.fromfile(self.directory / "doc_len.u32", dtype=np.uint32).astype(np.float32)
+        # нормировка длины документа не зависит от запроса — считаем один раз
+        self._len_norm = self.k1 * (1 - self.b + self.b * self._doc_lens / self.avg_doc_len)
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Возвращает [(строка, BM25)] по убыванию; mask — булев массив допустимых строк."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            rows = np.asarray(self._docs[start:end], dtype=np.int64)
+            tf = np.asarray(self._tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            # каждая строка встречается в списке термина один раз, поэтому += безопасен
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self._len_norm[rows])
+        if mask is not None:
+            scores[~mask[:self.size]] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(row), float(scores[row])) for row in ranked]
@@ -1,49 +1,730 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+import faiss
+import httpx
+import numpy as np
+from gigachat.api import post_auth
+from gigachat.context import authorization_cvar
+from gigachat.exceptions import AuthenticationError
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import PromptTemplate
 from langchain_community.chat_models import GigaChat
-from settings.config import GIGACHAT_TOKEN
+from settings.config import (
+    GIGACHAT_TOKEN, QUERY_CACHE_DIR, QUERY_CACHE_SIZE, QUERY_CACHE_DISK_SIZE, QUERY_CACHE_POLICY,
+    GIGACHAT_BASE_URL, GIGACHAT_AUTH_URL, GIGACHAT_SCOPE, GIGACHAT_TIMEOUT, GIGACHAT_VERIFY_SSL,
+    GIGACHAT_MAX_IN_FLIGHT, GIGACHAT_TOKEN_REFRESH_MARGIN, INDEX_MMAP,
+    RETRIEVAL_MODE, RETRIEVAL_CANDIDATES, RRF_K, LEXICAL_FALLBACK, QA_CONTEXT_TOKENS, HYPOTHESES_CONTEXT_TOKENS,
+    RERANK_ENABLED, RERANK_CANDIDATES
+)
 from settings.prompts import generator_prompt, critic_prompt, qa_prompt
+from embedding_cache import CachedEmbeddings, QueryEmbeddingCache, normalize_query
+from response_cache import ResponseCache
+from index_spec import parse_spec, apply_search_params, read_index, search_parameters
+from doc_store import MmapDocstore, RowIds, FilterIndex, DOCSTORE_DIRNAME, FILTERS_FILENAME
+from lexical_index import LexicalIndex, LEXICAL_DIRNAME
+from context_packing import ContextPacker
+from reranker import CrossEncoderReranker
 
-embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
-vectorstore = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = Path("faiss_index")
+DEFAULT_EMBEDDING_MODEL = "intfloat/multilingual-e5-large-instruct"
 CREDENTIALS = GIGACHAT_TOKEN
+DEFAULT_AUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
 
 QA_PROMPT = PromptTemplate.from_template(qa_prompt)
 GENERATOR_PROMPT = PromptTemplate.from_template(generator_prompt)
 CRITIC_PROMPT = PromptTemplate.from_template(critic_prompt)
 
 
+# ============================================================================
+# ленивая загрузка модели эмбеддингов и индекса (один раз на процесс)
+# ============================================================================
+
+class RetrievalResources:
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.RLock()
+        self._embeddings = None
+        self._query_cache = None
+        self._vectorstore = None
+        self._filter_index = None
+        self._docstore = None
+        self._lexical_index = None
+        self._warmup_thread = None
+        self._error = None
+
+    def index_info(self) -> dict:
+        info_path = self.index_dir / "index_info.json"
+        if not info_path.exists():
+            return {}
+        try:
+            with open(info_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать {info_path}: {e}")
+            return {}
+
+    @property
+    def model_name(self) -> str:
+        return self.index_info().get("model_name") or DEFAULT_EMBEDDING_MODEL
+
+    def is_available(self) -> bool:
+        return (self.index_dir / "index.faiss").exists()
+
+    def is_ready(self) -> bool:
+        return self._vectorstore is not None
+
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def query_cache(self) -> QueryEmbeddingCache:
+        if self._query_cache is None:
+            with self._lock:
+                if self._query_cache is None:
+                    self._query_cache = QueryEmbeddingCache(
+                        self.model_name,
+                        cache_dir=QUERY_CACHE_DIR,
+                        max_entries=QUERY_CACHE_SIZE,
+                        disk_capacity=QUERY_CACHE_DISK_SIZE,
+                        policy=QUERY_CACHE_POLICY,
+                    )
+        return self._query_cache
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    logger.info(f"Загрузка модели эмбеддингов {self.model_name}")
+                    model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    self._embeddings = CachedEmbeddings(model, self.query_cache)
+        return self._embeddings
+
+    @property
+    def vectorstore(self) -> FAISS:
+        if self._vectorstore is None:
+            with self._lock:
+                if self._vectorstore is None:
+                    try:
+                        logger.info(f"Загрузка FAISS индекса из {self.index_dir}")
+                        vectorstore = self._load_vectorstore()
+                        # efSearch / nprobe берутся из index_info.json, их можно менять без пересборки индекса
+                        apply_search_params(vectorstore.index, parse_spec(self.index_info().get("index_spec", "flat")))
+                        self._vectorstore = vectorstore
+                        self._error = None
+                    except Exception as e:
+                        self._error = e
+                        raise
+        return self._vectorstore
+
+    def _load_vectorstore(self) -> FAISS:
+        docstore_dir = self.index_dir / DOCSTORE_DIRNAME
+        if docstore_dir.exists():
+            index = read_index(self.index_dir / "index.faiss", mmap=INDEX_MMAP)
+            docstore = MmapDocstore(docstore_dir)
+            if index.ntotal == len(docstore):
+                return FAISS(self.embeddings, index, docstore, RowIds(len(docstore)))
+            logger.warning(f"Хранилище чанков ({len(docstore)}) не совпадает с индексом ({index.ntotal}), читаю index.pkl")
+        # старый формат: весь docstore в pickle
+        return FAISS.load_local(str(self.index_dir), self.embeddings, allow_dangerous_deserialization=True)
+
+    def filters_ready(self) -> bool:
+        """Фильтры доступны без загрузки модели, если при сборке сохранён filters.npz."""
+        return self._filter_index is not None or self.is_ready() or self._filters_path().exists()
+
+    def _filters_path(self) -> Path:
+        return self.index_dir / DOCSTORE_DIRNAME / FILTERS_FILENAME
+
+    @property
+    def filter_index(self) -> FilterIndex:
+        filter_index = self._filter_index
+        if filter_index is None or filter_index.size != self._filter_rows():
+            with self._lock:
+                if self._filter_index is None or self._filter_index.size != self._filter_rows():
+                    self._filter_index = self._load_filter_index()
+                filter_index = self._filter_index
+        return filter_index
+
+    def _filter_rows(self) -> int:
+        """Сколько строк должно быть в битовых картах: векторов в загруженном индексе, а до его загрузки — чанков в хранилище."""
+        if self._vectorstore is None and (self.index_dir / DOCSTORE_DIRNAME).exists():
+            return len(self.docstore)
+        return self.vectorstore.index.ntotal
+
+    def _load_filter_index(self) -> FilterIndex:
+        rows = self._filter_rows()
+        if self._filters_path().exists():
+            filter_index = FilterIndex.load(self._filters_path())
+            if filter_index.size == rows:
+                return filter_index
+            # индекс пересобран без хранилища чанков или загружен из index.pkl
+            logger.warning(f"{self._filters_path()} собран для {filter_index.size} строк, а их {rows}: "
+                           f"битовые карты строятся заново")
+        if self._vectorstore is None:
+            return FilterIndex.build(self.docstore.document(i) for i in range(rows))
+        # старый формат индекса: строим битовые карты по docstore в памяти
+        vectorstore = self._vectorstore
+        return FilterIndex.build(
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in range(rows)
+        )
+
+    def lexical_ready(self) -> bool:
+        """BM25 и колоночное хранилище читаются без модели эмбеддингов."""
+        return (self.index_dir / LEXICAL_DIRNAME / "meta.json").exists() and (self.index_dir / DOCSTORE_DIRNAME).exists()
+
+    @property
+    def docstore(self) -> MmapDocstore:
+        if self._docstore is None:
+            with self._lock:
+                if self._docstore is None:
+                    self._docstore = MmapDocstore(self.index_dir / DOCSTORE_DIRNAME)
+        return self._docstore
+
+    @property
+    def lexical_index(self):
+        """Индекс BM25 или None, если его нет или он собран не для текущего хранилища чанков."""
+        if self._lexical_index is None and self.lexical_ready():
+            with self._lock:
+                if self._lexical_index is None:
+                    lexical_index = LexicalIndex(self.index_dir / LEXICAL_DIRNAME)
+                    if len(lexical_index) != len(self.docstore):
+                        logger.warning(f"Индекс BM25 ({len(lexical_index)}) не совпадает с хранилищем чанков "
+                                       f"({len(self.docstore)}), лексический поиск отключён")
+                        return None
+                    self._lexical_index = lexical_index
+        return self._lexical_index
+
+    def document(self, row: int):
+        if self._vectorstore is not None:
+            return self._vectorstore.docstore.search(self._vectorstore.index_to_docstore_id[row])
+        return self.docstore.document(row)
+
+    def warm_up(self, background: bool = True):
+        """Загружает модель и индекс заранее; по умолчанию в фоновом потоке."""
+        if self.is_ready():
+            return None
+        if not background:
+            self.vectorstore
+            return None
+        with self._lock:
+            if self._warmup_thread is None or not self._warmup_thread.is_alive():
+                self._warmup_thread = threading.Thread(target=self._warm_up_safe, name="rag-warmup", daemon=True)
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    def _warm_up_safe(self):
+        try:
+            self.vectorstore
+        except Exception as e:
+            logger.error(f"Ошибка прогрева ресурсов поиска: {e}")
+
+
+resources = RetrievalResources()
+
+
+def get_vectorstore() -> FAISS:
+    return resources.vectorstore
+
+
+def warm_up(background: bool = True):
+    if reranker is not None:
+        if background:
+            reranker.load_in_background()
+        else:
+            reranker.load()
+    return resources.warm_up(background=background)
+
+
+def query_cache_stats() -> dict:
+    return resources.query_cache.stats()
+
+
+# ============================================================================
+# пул клиентов GigaChat
+# ============================================================================
+
+class GigaChatTokenCache:
+    """Общий OAuth-токен для всех клиентов; обновляется заранее, до истечения срока."""
+
+    def __init__(self, credentials: str, auth_url: str = None, scope: str = GIGACHAT_SCOPE,
+                 refresh_margin: float = GIGACHAT_TOKEN_REFRESH_MARGIN, verify_ssl_certs: bool = GIGACHAT_VERIFY_SSL):
+        self.credentials = credentials
+        self.auth_url = auth_url or DEFAULT_AUTH_URL
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.verify_ssl_certs = verify_ssl_certs
+        self._lock = threading.Lock()
+        self._http = None
+        self._token = None
+        self._expires_at = 0.0
+        self.refreshes = 0
+
+    def get(self) -> str:
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+                self._refresh()
+            return self._token
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _refresh(self):
+        if self._http is None:
+            self._http = httpx.Client(verify=self.verify_ssl_certs, timeout=httpx.Timeout(GIGACHAT_TIMEOUT))
+        access_token = post_auth.sync(self._http, url=self.auth_url, credentials=self.credentials, scope=self.scope)
+        self._token = access_token.access_token
+        # expires_at приходит в миллисекундах
+        self._expires_at = access_token.expires_at / 1000
+        self.refreshes += 1
+        logger.info("Получен новый токен GigaChat")
+
+
+class GigaChatClientPool:
+    """Переиспользуемые клиенты GigaChat по ключу (модель, температура).
+
+    Клиент держит свои keep-alive соединения, токен берётся из общего кэша,
+    а число одновременных запросов к одной модели ограничено семафором.
+    Все запросы идут из цикла событий конвейера, поэтому семафоры асинхронные:
+    ожидание слота не занимает поток.
+    """
+
+    def __init__(self, credentials: str = CREDENTIALS, base_url: str = GIGACHAT_BASE_URL,
+                 auth_url: str = GIGACHAT_AUTH_URL, scope: str = GIGACHAT_SCOPE,
+                 max_in_flight: int = GIGACHAT_MAX_IN_FLIGHT, timeout: float = GIGACHAT_TIMEOUT,
+                 verify_ssl_certs: bool = GIGACHAT_VERIFY_SSL):
+        self.credentials = credentials
+        self.base_url = base_url
+        self.auth_url = auth_url
+        self.scope = scope
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.verify_ssl_certs = verify_ssl_certs
+        self.token_cache = GigaChatTokenCache(credentials, auth_url=auth_url, scope=scope,
+                                              verify_ssl_certs=verify_ssl_certs)
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._semaphores = {}
+        self._in_flight = {}
+
+    def get(self, model: str, temperature: float) -> GigaChat:
+        key = (model, temperature)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = GigaChat(
+                    credentials=self.credentials,
+                    base_url=self.base_url,
+                    auth_url=self.auth_url,
+                    scope=self.scope,
+                    model=model,
+                    temperature=temperature,
+                    verify_ssl_certs=self.verify_ssl_certs,
+                    timeout=self.timeout,
+                )
+            return self._clients[key]
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = asyncio.Semaphore(self.max_in_flight)
+                self._in_flight[model] = 0
+            return self._semaphores[model]
+
+    def _track(self, model: str, delta: int):
+        with self._lock:
+            self._in_flight[model] += delta
+
+    @asynccontextmanager
+    async def alease(self, model: str, temperature: float):
+        """Выдаёт клиент на время запроса: ждёт свободный слот модели и подставляет актуальный токен."""
+        semaphore = self._semaphore(model)
+        async with semaphore:
+            self._track(model, 1)
+            try:
+                access_token = await asyncio.to_thread(self.token_cache.get)
+                # при заданном authorization_cvar SDK не ходит за токеном сам, а берёт заголовок из контекста
+                cvar_token = authorization_cvar.set(f"Bearer {access_token}")
+                try:
+                    yield self.get(model, temperature)
+                except AuthenticationError:
+                    self.token_cache.invalidate()
+                    raise
+                finally:
+                    authorization_cvar.reset(cvar_token)
+            finally:
+                self._track(model, -1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "in_flight": dict(self._in_flight),
+                "max_in_flight": self.max_in_flight,
+                "token_refreshes": self.token_cache.refreshes,
+            }
+
+
+client_pool = GigaChatClientPool()
+
+
+GENERATOR_MODEL = ("GigaChat-Pro", 0.7)
+CRITIC_MODEL = ("GigaChat-Max", 0.2)
+QA_MODEL = ("GigaChat-Pro", 0.4)
+
+
 def get_generator_llm():
-    return GigaChat(credentials=CREDENTIALS, model="GigaChat-Pro", temperature=0.7, verify_ssl_certs=False, timeout=120)
+    return client_pool.get(*GENERATOR_MODEL)
 
 def get_critic_llm():
-    return GigaChat(credentials=CREDENTIALS, model="GigaChat-Max", temperature=0.2, verify_ssl_certs=False, timeout=120)
+    return client_pool.get(*CRITIC_MODEL)
 
 def get_qa_llm():
-    return GigaChat(credentials=CREDENTIALS, model="GigaChat-Pro", temperature=0.4, verify_ssl_certs=False, timeout=120)
+    return client_pool.get(*QA_MODEL)
+
+
+# ============================================================================
+# асинхронный конвейер: общий цикл событий и склейка одинаковых запросов
+# ============================================================================
+
+class PipelineFuture(concurrent.futures.Future):
+    """Результат одного запроса к конвейеру.
+
+    partial — промежуточный текст по этапам ("answer", "raw", "final"), общий для всех
+    склеенных запросов. Отмена снимает только этого ожидающего; общая задача отменяется,
+    когда ожидающих не осталось.
+    """
+
+    def __init__(self, partial: dict):
+        super().__init__()
+        self.partial = partial
+
+
+class AsyncPipeline:
+    """Цикл событий в отдельном потоке, живущий вне перезапусков скрипта Streamlit.
 
+    Одинаковые запросы, поступившие, пока первый ещё выполняется,
+    получают результат и промежуточный текст одной и той же задачи.
+    """
 
-def ask(question: str):
-    docs = vectorstore.similarity_search(question, k=5)
-    context = "\n\n".join([f"Источник: {d.metadata.get('title','?')}\n{d.page_content}" for d in docs])
-    llm = get_qa_llm()
-    response = (QA_PROMPT | llm).invoke({"context": context, "question": question})
-    return response.content
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        # RLock: колбэк уже завершённой задачи вызывается сразу, внутри submit
+        self._lock = threading.RLock()
+        self._in_flight = {}
+        self.submitted = 0
+        self.coalesced = 0
 
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="rag-pipeline", daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
 
-def generate_hypotheses(problem: str):
-    docs = vectorstore.similarity_search(problem, k=10)
-    context = "\n\n".join([f"[{i+1}] {d.metadata.get('title','?')}\n{d.page_content}" for i, d in enumerate(docs)])
+    def submit(self, key, coro_factory) -> PipelineFuture:
+        """coro_factory(partial) создаёт корутину, которая дописывает промежуточный текст в partial."""
+        loop = self.loop
+        with self._lock:
+            self.submitted += 1
+            entry = self._in_flight.get(key)
+            if entry is None:
+                partial = {}
+                task = asyncio.run_coroutine_threadsafe(coro_factory(partial), loop)
+                entry = {"task": task, "partial": partial, "waiters": 0}
+                self._in_flight[key] = entry
+                task.add_done_callback(lambda _: self._forget(key, entry))
+            else:
+                self.coalesced += 1
+            entry["waiters"] += 1
+        waiter = PipelineFuture(entry["partial"])
+        waiter.add_done_callback(lambda w: w.cancelled() and self._release(key, entry))
+        entry["task"].add_done_callback(lambda task: self._deliver(task, waiter))
+        return waiter
+
+    @staticmethod
+    def _deliver(task: concurrent.futures.Future, waiter: PipelineFuture):
+        # False — ожидающий уже отменён
+        if not waiter.set_running_or_notify_cancel():
+            return
+        if task.cancelled():
+            waiter.set_exception(concurrent.futures.CancelledError())
+        elif task.exception() is not None:
+            waiter.set_exception(task.exception())
+        else:
+            waiter.set_result(task.result())
+
+    def _forget(self, key, entry):
+        with self._lock:
+            if self._in_flight.get(key) is entry:
+                del self._in_flight[key]
+
+    def _release(self, key, entry):
+        with self._lock:
+            entry["waiters"] -= 1
+            if entry["waiters"] > 0:
+                return
+            self._forget(key, entry)
+        entry["task"].cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+
+pipeline = AsyncPipeline()
+STREAM_POLL_INTERVAL = 0.05  # секунд между проверками промежуточного текста в потоковых вариантах
+response_cache = ResponseCache()
+context_packer = ContextPacker()
+reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+
+
+def build_qa_context(docs) -> str:
+    return "\n\n".join([f"Источник: {d.metadata.get('title','?')}\n{d.page_content}" for d in docs])
+
+
+def build_hypotheses_context(docs) -> str:
+    return "\n\n".join([f"[{i+1}] {d.metadata.get('title','?')}\n{d.page_content}" for i, d in enumerate(docs)])
+
+
+# ============================================================================
+# вызовы GigaChat через кэш ответов
+# ============================================================================
+
+def _cache_args(prompt: PromptTemplate, spec, docs, inputs: dict):
+    # контекст в ключе представлен упорядоченным списком chunk_id
+    model, temperature = spec
+    key_inputs = {k: v for k, v in inputs.items() if k != "context"}
+    chunk_ids = [d.metadata.get("chunk_id", "") for d in docs]
+    return prompt.template, model, temperature, chunk_ids, key_inputs
+
+
+def _query_vector(spec, query):
+    if query is None or response_cache.similarity_threshold is None or not response_cache.enabled_for(spec[1]):
+        return None
+    if not resources.is_ready():
+        # ответ по BM25, пока модель грузится: embed_query ждал бы загрузки — ищем только по точному ключу
+        return None
+    # при гибридном и плотном поиске эмбеддинг вопроса уже посчитан и лежит в кэше эмбеддингов
+    return resources.embeddings.embed_query(query)
+
+
+def _appender(partial: dict, stage: str):
+    if partial is None:
+        return None
+
+    def append(text: str):
+        partial[stage] = partial.get(stage, "") + text
+    return append
+
+
+async def _ainvoke(prompt: PromptTemplate, spec, docs, inputs: dict, query: str = None, on_token=None) -> str:
+    args = _cache_args(prompt, spec, docs, inputs)
+    vector = await asyncio.to_thread(_query_vector, spec, query)
+    cached = response_cache.lookup(*args, query_vector=vector)
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached)
+        return cached
+    parts = []
+    async with client_pool.alease(*spec) as llm:
+        async for chunk in (prompt | llm).astream(inputs):
+            if chunk.content:
+                parts.append(chunk.content)
+                if on_token is not None:
+                    on_token(chunk.content)
+    content = "".join(parts)
+    response_cache.store(*args, content, query_vector=vector)
+    return content
+
+
+def _follow(future: PipelineFuture, stages):
+    """Отдаёт (этап, фрагмент) по мере появления текста в future.partial; в конце пробрасывает ошибку задачи."""
+    sent = dict.fromkeys(stages, 0)
+    try:
+        while True:
+            concurrent.futures.wait([future], timeout=STREAM_POLL_INTERVAL)
+            # partial дописан до завершения задачи: после done() текст уже полный
+            finished = future.done()
+            for stage in stages:
+                text = future.partial.get(stage, "")
+                if len(text) > sent[stage]:
+                    yield stage, text[sent[stage]:]
+                    sent[stage] = len(text)
+            if finished:
+                break
+    finally:
+        # потребитель бросил генератор — снимаем ожидание, общая задача останется у других
+        if not future.done():
+            future.cancel()
+    future.result()
+
+
+def response_cache_stats() -> dict:
+    return response_cache.stats()
+
+
+def context_stats() -> dict:
+    return context_packer.stats()
+
+
+def rerank_stats() -> dict:
+    return reranker.stats() if reranker is not None else {}
+
+
+def normalize_filters(filters) -> dict:
+    """Убирает пустые условия; None, если фильтровать нечего."""
+    if not filters:
+        return None
+    normalized = {}
+    for field, value in filters.items():
+        if not value:
+            continue
+        normalized[field] = tuple(value) if field == "year" else tuple(sorted(value))
+    return normalized or None
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Сливает ранжированные списки строк: score = sum(1 / (k + rank)); при равенстве раньше идёт первый список."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda row: -scores[row])
+
+
+def _dense_rows(query: str, k: int, filters: dict = None) -> list:
+    vectorstore = get_vectorstore()
+    vector = np.asarray([vectorstore.embedding_function.embed_query(query)], dtype=np.float32)
+    params = None
+    if filters:
+        # битовая карта берётся после загрузки индекса, чтобы filter_index был сверен с его векторами
+        filter_index = resources.filter_index
+        assert filter_index.size == vectorstore.index.ntotal, "битовые карты фильтров не совпадают с индексом"
+        bitmap = filter_index.bitmap(filters)
+        # фильтр применяется внутри FAISS: поиск идёт только по векторам из битовой карты;
+        # n у IDSelectorBitmap — длина карты в байтах, а не число строк
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        params = search_parameters(vectorstore.index, selector)
+    _, ids = vectorstore.index.search(vector, k, params=params)
+    return [int(i) for i in ids[0] if i != -1]
+
+
+def _lexical_rows(lexical_index: LexicalIndex, query: str, k: int, filters: dict = None) -> list:
+    mask = None
+    if filters:
+        bitmap = resources.filter_index.bitmap(filters)
+        mask = np.unpackbits(bitmap, bitorder="little")[:len(lexical_index)].astype(bool)
+    return [row for row, _ in lexical_index.search(query, k, mask=mask)]
+
+
+def _search(query: str, k: int, filters: dict = None):
+    filters = normalize_filters(filters)
+    lexical_index = resources.lexical_index if RETRIEVAL_MODE != "dense" else None
+    if lexical_index is None:
+        return [resources.document(row) for row in _dense_rows(query, k, filters)]
+
+    if RETRIEVAL_MODE == "lexical" or (LEXICAL_FALLBACK and not resources.is_ready()):
+        # BM25 отвечает за миллисекунды и не требует модели — пока она загружается, обходимся им
+        rows = _lexical_rows(lexical_index, query, k, filters)
+        if rows or RETRIEVAL_MODE == "lexical":
+            return [resources.document(row) for row in rows]
+        resources.warm_up()
+
+    candidates = max(k, RETRIEVAL_CANDIDATES)
+    dense = _dense_rows(query, candidates, filters)
+    if len(lexical_index) != get_vectorstore().index.ntotal:
+        # индекс BM25 от другой сборки: номера строк не совпадают с векторами
+        return [resources.document(row) for row in dense[:k]]
+    lexical = _lexical_rows(lexical_index, query, candidates, filters)
+    return [resources.document(row) for row in reciprocal_rank_fusion([dense, lexical])[:k]]
+
+
+def _retrieve(query: str, k: int, filters: dict = None):
+    if reranker is None:
+        return _search(query, k, filters)
+    # берём больше кандидатов, чем нужно, и оставляем k лучших по оценке cross-encoder
+    return reranker.rerank(query, _search(query, max(k, RERANK_CANDIDATES), filters), k)
+
+
+async def aask(question: str, filters: dict = None, partial: dict = None):
+    docs = await asyncio.to_thread(_retrieve, question, 5, filters)
+    docs, _ = context_packer.pack(docs, QA_CONTEXT_TOKENS)
+    context = build_qa_context(docs)
+    return await _ainvoke(QA_PROMPT, QA_MODEL, docs, {"context": context, "question": question}, query=question,
+                          on_token=_appender(partial, "answer"))
+
+
+def ask(question: str, filters: dict = None):
+    return submit_ask(question, filters).result()
+
+
+def submit_ask(question: str, filters: dict = None) -> PipelineFuture:
+    """Запускает ask в общем цикле событий; фрагменты ответа копятся в future.partial["answer"]."""
+    key = ("ask", normalize_query(question), repr(normalize_filters(filters)))
+    return pipeline.submit(key, lambda partial: aask(question, filters, partial))
+
+
+def ask_stream(question: str, filters: dict = None):
+    """Потоковый вариант ask: отдаёт фрагменты ответа по мере генерации."""
+    for _, token in _follow(submit_ask(question, filters), ("answer",)):
+        yield token
+
+
+async def agenerate_hypotheses(problem: str, filters: dict = None, partial: dict = None):
+    docs = await asyncio.to_thread(_retrieve, problem, 10, filters)
+    # один и тот же контекст уходит и генератору, и критику
+    docs, _ = context_packer.pack(docs, HYPOTHESES_CONTEXT_TOKENS, prompts=2)
+    context = build_hypotheses_context(docs)
     
-    raw_hypotheses = (GENERATOR_PROMPT | get_generator_llm()).invoke({
+    raw_hypotheses = await _ainvoke(GENERATOR_PROMPT, GENERATOR_MODEL, docs, {
         "problem": problem,
         "context": context
-    }).content
+    }, query=problem, on_token=_appender(partial, "raw"))
     
-    final_hypotheses = (CRITIC_PROMPT | get_critic_llm()).invoke({
+    final_hypotheses = await _ainvoke(CRITIC_PROMPT, CRITIC_MODEL, docs, {
         "raw_hypotheses": raw_hypotheses,
         "context": context
-    }).content
+    }, on_token=_appender(partial, "final"))
     
-    return final_hypotheses, raw_hypotheses, docs
\ No newline at end of file
+    return final_hypotheses, raw_hypotheses, docs
+
+
+def generate_hypotheses(problem: str, filters: dict = None):
+    return submit_generate_hypotheses(problem, filters).result()
+
+
+def submit_generate_hypotheses(problem: str, filters: dict = None) -> PipelineFuture:
+    """Запускает generate_hypotheses в общем цикле событий; фрагменты копятся в future.partial["raw"] и ["final"]."""
+    key = ("generate", normalize_query(problem), repr(normalize_filters(filters)))
+    return pipeline.submit(key, lambda partial: agenerate_hypotheses(problem, filters, partial))
+
+
+def generate_hypotheses_stream(problem: str, filters: dict = None):
+    """Потоковый вариант generate_hypotheses.
+
+    Отдаёт события (stage, payload): ("raw", фрагмент) от генератора и ("final", фрагмент)
+    от критика, затем ("docs", docs) — найденные статьи.
+    """
+    future = submit_generate_hypotheses(problem, filters)
+    yield from _follow(future, ("raw", "final"))
+    yield "docs", future.result()[2]
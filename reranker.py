@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+from langchain_core.documents import Document
+from embedding_cache import normalize_query
+from settings.config import (
+    RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_TIME_BUDGET, RERANK_CACHE_SIZE, RERANK_MAX_LENGTH, RERANK_PAIR_TIME
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Переранжирование кандидатов поиска локальным cross-encoder на CPU.
+
+    Пары (запрос, чанк) оцениваются батчами; перед каждым батчем проверяется,
+    укладывается ли он в бюджет времени запроса — по времени на пару, измеренному
+    на прошлых батчах (до первого — по настройке), с учётом ожидания модели,
+    занятой другим запросом. Если нет — возвращается исходный порядок поиска.
+    Оценки кэшируются по (запрос, chunk_id), поэтому повторный запрос обходится без модели.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 time_budget: float = RERANK_TIME_BUDGET, cache_size: int = RERANK_CACHE_SIZE,
+                 max_length: int = RERANK_MAX_LENGTH, pair_time: float = RERANK_PAIR_TIME):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self.pair_time = pair_time
+        self._model = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+        self._load_thread = None
+        self._scores = OrderedDict()
+        self.reranked = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        if self._model is not None or self._error is not None:
+            return self._model
+        with self._lock:
+            if self._model is None and self._error is None:
+                try:
+                    # sentence-transformers приходит вместе с langchain_huggingface, но без него поиск работает и так
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Загрузка cross-encoder {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+                except Exception as e:
+                    self._error = e
+                    logger.error(f"Переранжирование отключено, не удалось загрузить {self.model_name}: {e}")
+        return self._model
+
+    def load_in_background(self):
+        with self._lock:
+            if self._model is None and self._error is None and (self._load_thread is None or not self._load_thread.is_alive()):
+                self._load_thread = threading.Thread(target=self.load, name="rag-reranker", daemon=True)
+                self._load_thread.start()
+
+    def _cache_get(self, key):
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _cache_put(self, key, score: float):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def rerank(self, query: str, docs: List[Document], k: int) -> List[Document]:
+        deadline = time.monotonic() + self.time_budget
+        if not docs:
+            return docs
+        if self._model is None:
+            # модель не грузим на пути запроса — это заняло бы весь бюджет
+            self.load_in_background()
+            self.fallbacks += 1
+            return docs[:k]
+
+        normalized = normalize_query(query)
+        keys = [(normalized, doc.metadata.get("chunk_id") or doc.page_content) for doc in docs]
+        scores = [self._cache_get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.cache_hits += len(docs) - len(missing)
+        self.cache_misses += len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            # батч не прерывается на середине, поэтому не начинаем его, если он не успеет закончиться;
+            # модель ждём не дольше, чем бюджет оставляет на сам батч
+            wait = deadline - time.monotonic() - len(batch) * self.pair_time
+            if wait < 0 or not self._predict_lock.acquire(timeout=wait):
+                return self._fallback(docs, k)
+            try:
+                if time.monotonic() + len(batch) * self.pair_time > deadline:
+                    return self._fallback(docs, k)
+                batch_start = time.monotonic()
+                predicted = self._model.predict([(query, docs[i].page_content) for i in batch],
+                                                batch_size=self.batch_size, show_progress_bar=False)
+                # оценка на следующие батчи: скользящее среднее времени на пару
+                self.pair_time = (self.pair_time + (time.monotonic() - batch_start) / len(batch)) / 2
+            finally:
+                self._predict_lock.release()
+            for i, score in zip(batch, predicted):
+                scores[i] = float(score)
+                self._cache_put(keys[i], scores[i])
+
+        self.reranked += 1
+        order = sorted(range(len(docs)), key=lambda i: -scores[i])
+        return [docs[i] for i in order[:k]]
+
+    def _fallback(self, docs: List[Document], k: int) -> List[Document]:
+        self.fallbacks += 1
+        logger.info(f"Переранжирование не уложилось в {self.time_budget} с, оставлен порядок поиска")
+        return docs[:k]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "cache_entries": len(self._scores),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "pair_time_ms": round(self.pair_time * 1000, 2),
+        }
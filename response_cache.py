@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from embedding_cache import normalize_query
+from settings.config import (
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_TEMPERATURE, RESPONSE_CACHE_SIMILARITY
+)
+
+
+def _digest(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов GigaChat.
+
+    Группа записей определяется шаблоном промпта, моделью, температурой и
+    упорядоченным списком chunk_id контекста. Внутри группы ответ ищется
+    сначала точно (по остальным входам промпта), затем — если задан порог —
+    по косинусной близости эмбеддинга вопроса к ранее заданным вопросам.
+    Близкий вопрос засчитывается, только если контекст состоит из тех же чанков.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 max_temperature: float = RESPONSE_CACHE_MAX_TEMPERATURE,
+                 similarity_threshold: Optional[float] = RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._groups = {}
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def enabled_for(self, temperature: float) -> bool:
+        return self.max_entries > 0 and temperature <= self.max_temperature
+
+    @staticmethod
+    def group_key(template: str, model: str, temperature: float, chunk_ids: Sequence[str]) -> str:
+        return _digest([template, model, temperature, list(chunk_ids)])
+
+    @staticmethod
+    def entry_key(group: str, inputs: Dict[str, str]) -> str:
+        return _digest([group, {k: normalize_query(v) for k, v in inputs.items()}])
+
+    def lookup(self, template: str, model: str, temperature: float, chunk_ids: Sequence[str],
+               inputs: Dict[str, str], query_vector: Optional[List[float]] = None) -> Optional[str]:
+        if not self.enabled_for(temperature):
+            self.bypassed += 1
+            return None
+        group = self.group_key(template, model, temperature, chunk_ids)
+        key = self.entry_key(group, inputs)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits_exact += 1
+                return entry["response"]
+            if query_vector is not None and self.similarity_threshold is not None:
+                similar_key = self._nearest(group, query_vector)
+                if similar_key is not None:
+                    self._entries.move_to_end(similar_key)
+                    self.hits_semantic += 1
+                    return self._entries[similar_key]["response"]
+            self.misses += 1
+            return None
+
+    def store(self, template: str, model: str, temperature: float, chunk_ids: Sequence[str],
+              inputs: Dict[str, str], response: str, query_vector: Optional[List[float]] = None):
+        if not self.enabled_for(temperature) or not response:
+            return
+        group = self.group_key(template, model, temperature, chunk_ids)
+        key = self.entry_key(group, inputs)
+        vector = None
+        if query_vector is not None:
+            vector = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = {"response": response, "created_at": time.time(), "group": group, "vector": vector}
+            self._groups.setdefault(group, set()).add(key)
+
+    def _nearest(self, group: str, query_vector) -> Optional[str]:
+        keys = [k for k in self._groups.get(group, ()) if self._entries[k]["vector"] is not None]
+        if not keys:
+            return None
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        matrix = np.stack([self._entries[k]["vector"] for k in keys])
+        scores = matrix @ (query / norm)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        # записи упорядочены по последнему использованию, а не по созданию — проверяем все
+        expired = [k for k, entry in self._entries.items() if entry["created_at"] < cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        keys = self._groups.get(entry["group"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry["group"]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+        }
@@ -0,0 +1,105 @@
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from settings.config import CHAT_LEGACY_FILE
+from chat_store import ChatStore
+
+# Сохранение истории чатов: прежняя перезапись chat_history.json целиком после каждого сообщения
+# против вставки строк в SQLite; затем параллельная запись из нескольких процессов и перенос JSON.
+
+MESSAGE = {"role": "assistant", "content": "**Ответ:**\n\n" + "Содержание ответа модели. " * 80}
+
+
+def legacy_save(path: Path, history: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=4)
+
+
+def measure_growth(directory: Path, chats: int, messages: int, checkpoints: int):
+    history = {f"chat_{i + 1}": [] for i in range(chats)}
+    store = ChatStore(directory / "growth.db")
+    chat_ids = [store.create_chat() for _ in range(chats)]
+    total = chats * messages
+    step = max(1, total // checkpoints)
+    legacy_time = store_time = 0.0
+    print(f"{'сообщений':>10} {'JSON, мс/сообщ.':>16} {'SQLite, мс/сообщ.':>18}")
+    for n in range(total):
+        history[f"chat_{n % chats + 1}"].append(MESSAGE)
+        started = time.perf_counter()
+        legacy_save(directory / "growth.json", history)
+        legacy_time += time.perf_counter() - started
+        started = time.perf_counter()
+        store.append(chat_ids[n % chats], [MESSAGE])
+        store_time += time.perf_counter() - started
+        if (n + 1) % step == 0:
+            print(f"{n + 1:>10} {legacy_time / step * 1000:>16.2f} {store_time / step * 1000:>18.2f}")
+            legacy_time = store_time = 0.0
+    started = time.perf_counter()
+    loaded = store.messages(chat_ids[0])
+    print(f"Загрузка одного чата ({len(loaded)} сообщений): {(time.perf_counter() - started) * 1000:.2f} мс")
+    store.close()
+
+
+def _writer(args):
+    path, worker, count = args
+    store = ChatStore(path)
+    chat_id = store.create_chat()
+    for i in range(count):
+        store.append(chat_id, [{"role": "user", "content": f"{worker}:{i}"}])
+    store.close()
+    return chat_id
+
+
+def measure_concurrency(directory: Path, workers: int, count: int):
+    path = directory / "concurrent.db"
+    started = time.perf_counter()
+    with Pool(workers) as pool:
+        chat_ids = pool.map(_writer, [(path, w, count) for w in range(workers)])
+    elapsed = time.perf_counter() - started
+    store = ChatStore(path)
+    saved = sum(len(store.messages(chat_id)) for chat_id in chat_ids)
+    print(f"\n{workers} процессов по {count} сообщений: сохранено {saved} из {workers * count}, "
+          f"уникальных чатов {len(set(chat_ids))}, {elapsed:.2f} с")
+    store.close()
+
+
+def check_migration(directory: Path, legacy_file: Path):
+    if not legacy_file.exists():
+        print(f"\n{legacy_file} не найден, перенос не проверяется")
+        return
+    copy = directory / legacy_file.name
+    shutil.copy(legacy_file, copy)
+    with open(copy, "r", encoding="utf-8") as f:
+        history = json.load(f)
+    store = ChatStore(directory / "migrated.db")
+    migrated = store.migrate_json(copy)
+    same = all(store.messages(chat_id) == [{"role": m.get("role", "user"), "content": m.get("content", "")}
+                                           for m in messages]
+               for chat_id, messages in history.items())
+    print(f"\nПеренос {legacy_file}: чатов {migrated}, сообщения совпадают: {same}, "
+          f"повторный перенос: {store.migrate_json(copy)} чатов")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость сохранения истории чатов: JSON целиком против SQLite")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=100, help="сообщений на чат")
+    parser.add_argument("--checkpoints", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--legacy-file", type=Path, default=CHAT_LEGACY_FILE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        measure_growth(directory, args.chats, args.messages, args.checkpoints)
+        measure_concurrency(directory, args.workers, args.messages)
+        check_migration(directory, args.legacy_file)
+
+
+if __name__ == "__main__":
+    main()
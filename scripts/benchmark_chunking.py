@@ -0,0 +1,113 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+from settings.config import RAW_FILE
+from scripts.clean_and_split import (
+    ENCODER, MAX_TOKENS_PER_CHUNK, OVERLAP_TOKENS, build_full_text, clean_text, split_into_chunks
+)
+
+
+def legacy_split_into_chunks(text: str, metadata: Dict, max_tokens: int = MAX_TOKENS_PER_CHUNK,
+                             overlap: int = OVERLAP_TOKENS) -> List[Dict]:
+    """Прежняя нарезка (decode окна + encode обрезанного текста) — эталон для сравнения.
+
+    Отличие от исходной версии одно: обрезка по предложению не применяется, если окно
+    после неё не сдвинется дальше перекрытия, — исходная версия на таких текстах зацикливалась.
+    """
+    if not text.strip():
+        return []
+    tokens = ENCODER.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return [{"chunk_id": f"{metadata['source']}_0", "chunk_text": text.strip(),
+                 "chunk_tokens": len(tokens), "total_tokens": len(tokens), "is_full_text": True}]
+    chunks = []
+    i = 0
+    while i < len(tokens):
+        end = i + max_tokens
+        chunk_tokens = tokens[i:end]
+        chunk_text = ENCODER.decode(chunk_tokens)
+        last_sentence_end = max(chunk_text.rfind(". "), chunk_text.rfind("? "), chunk_text.rfind("! "))
+        if last_sentence_end > len(chunk_text) * 0.7:
+            cut_text = chunk_text[:last_sentence_end + 1]
+            cut_tokens = ENCODER.encode(cut_text)
+            if i + len(cut_tokens) - overlap > i:
+                chunk_text, chunk_tokens = cut_text, cut_tokens
+                end = i + len(chunk_tokens)
+        chunks.append({"chunk_id": f"{metadata['source']}_{len(chunks)}", "chunk_text": chunk_text.strip(),
+                       "chunk_tokens": len(chunk_tokens), "total_tokens": len(tokens),
+                       "start_token": i, "end_token": end, "is_full_text": False})
+        i = end - overlap
+        if i >= len(tokens):
+            break
+    return chunks
+
+
+def load_texts(path: Path) -> List[tuple]:
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            article = json.loads(line)
+            cleaned = clean_text(build_full_text(article, line_num, []))
+            if len(cleaned) >= 200:
+                texts.append((cleaned, {"source": article.get("source", f"unknown_{line_num}")}))
+    return texts
+
+
+def run(split, texts, max_tokens: int, overlap: int, repeats: int):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = [split(text, metadata, max_tokens, overlap) for text, metadata in texts]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def compare(legacy: List[List[Dict]], current: List[List[Dict]]) -> dict:
+    fields = ("chunk_id", "chunk_text", "chunk_tokens", "total_tokens", "start_token", "end_token", "is_full_text")
+    total = identical = 0
+    examples = []
+    for old_chunks, new_chunks in zip(legacy, current):
+        total += max(len(old_chunks), len(new_chunks))
+        for old, new in zip(old_chunks, new_chunks):
+            if all(old.get(f) == new.get(f) for f in fields):
+                identical += 1
+            elif len(examples) < 3:
+                examples.append({f: (old.get(f), new.get(f)) for f in fields if old.get(f) != new.get(f)})
+    return {"total": total, "identical": identical, "examples": examples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость и эквивалентность нарезки на чанки: прежняя и по смещениям токенов")
+    parser.add_argument("--input", type=Path, default=RAW_FILE)
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS_PER_CHUNK)
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_texts(args.input)
+    total_chars = sum(len(text) for text, _ in texts)
+    long_texts = sum(1 for text, _ in texts if len(ENCODER.encode(text, disallowed_special=())) > args.max_tokens)
+    print(f"Статей: {len(texts)} ({total_chars / 2**20:.1f} МБ текста), длиннее окна: {long_texts}, "
+          f"окно {args.max_tokens} / перекрытие {args.overlap} токенов")
+
+    legacy, legacy_time = run(legacy_split_into_chunks, texts, args.max_tokens, args.overlap, args.repeats)
+    current, current_time = run(split_into_chunks, texts, args.max_tokens, args.overlap, args.repeats)
+
+    print(f"\n{'нарезка':<22} {'время, с':>9} {'статей/с':>10}")
+    print(f"{'decode + encode':<22} {legacy_time:>9.3f} {len(texts) / legacy_time:>10.0f}")
+    print(f"{'смещения токенов':<22} {current_time:>9.3f} {len(texts) / current_time:>10.0f}")
+    print(f"Ускорение: {legacy_time / current_time:.2f}x")
+
+    result = compare(legacy, current)
+    print(f"\nСовпадающих чанков: {result['identical']}/{result['total']}")
+    for example in result["examples"]:
+        print(f"  расхождение: {example}")
+
+
+if __name__ == "__main__":
+    main()
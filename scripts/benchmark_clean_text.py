@@ -0,0 +1,72 @@
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import List
+from settings.config import RAW_FILE
+from scripts.clean_and_split import build_full_text, clean_text
+
+
+def legacy_clean_text(text: str) -> str:
+    """Прежняя очистка в восемь проходов re.sub — эталон для сравнения."""
+    if not text:
+        return ""
+    text = re.sub(r'\$.*?\$', ' ', text)
+    text = re.sub(r'\\\(.*?\\\)', ' ', text)
+    text = re.sub(r'\\\[.*?\\\]', ' ', text)
+    text = re.sub(r'\\begin\{.*?\}.*?\\end\{.*?\}', ' ', text, flags=re.DOTALL)
+    text = re.sub(r'\[[0-9,\s]+\]', ' ', text)
+    text = re.sub(r'\[[0-9]+[-\s][0-9]+\]', ' ', text)
+    text = re.sub(r'\([A-Z][a-z]+(?:\s+et al\.)?(?:,\s*\d{4}[a-z]?)?\)', ' ', text)
+    allowed_chars = r'A-Za-zА-Яа-яёЁ0-9\s.,;:!?\-\(\)%/°≈≤≥±→←↑↓×÷'
+    text = re.sub(f'[^{allowed_chars}]', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def load_texts(path: Path) -> List[str]:
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if line.strip():
+                texts.append(build_full_text(json.loads(line), line_num, []))
+    return texts
+
+
+def throughput(clean, texts: List[str], repeats: int) -> float:
+    size = sum(len(text.encode("utf-8")) for text in texts)
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in texts:
+            clean(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size / 2**20 / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Эквивалентность и скорость clean_text (МБ/с) против прежней версии")
+    parser.add_argument("--input", type=Path, default=RAW_FILE)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = load_texts(args.input)
+    mismatches = [(i, text) for i, text in enumerate(texts) if clean_text(text) != legacy_clean_text(text)]
+    print(f"Статей: {len(texts)}, совпадает с прежней очисткой: {len(texts) - len(mismatches)}/{len(texts)}")
+    for i, text in mismatches[:3]:
+        print(f"  статья {i}:\n    было:  {legacy_clean_text(text)[:200]}\n    стало: {clean_text(text)[:200]}")
+
+    before = throughput(legacy_clean_text, texts, args.repeats)
+    after = throughput(clean_text, texts, args.repeats)
+    print(f"\n{'очистка':<22} {'МБ/с':>8}")
+    print(f"{'8 проходов re.sub':<22} {before:>8.1f}")
+    print(f"{'2 прохода':<22} {after:>8.1f}")
+    print(f"Ускорение: {after / before:.2f}x")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import random
+import time
+from itertools import combinations
+from pathlib import Path
+from typing import List, Set, Tuple
+from settings.config import CHUNKS_FILE, NEAR_DUP_THRESHOLD
+from scripts.near_duplicates import find_clusters, jaccard, load_articles, shingles
+
+# Поиск почти-дубликатов: LSH против полного перебора пар на корпусе clean.jsonl,
+# в который добавлены искажённые копии статей (выброшены и переставлены слова).
+
+
+def perturb(text: str, rng: random.Random, rate: float) -> str:
+    words = text.split()
+    kept = [w for w in words if rng.random() >= rate]
+    for _ in range(int(len(kept) * rate / 2)):
+        i = rng.randrange(len(kept) - 1)
+        kept[i], kept[i + 1] = kept[i + 1], kept[i]
+    return " ".join(kept)
+
+
+def brute_force_pairs(texts: List[str], threshold: float) -> Tuple[Set[Tuple[int, int]], float]:
+    started = time.perf_counter()
+    sets = [shingles(text) for text in texts]
+    pairs = {(i, j) for i, j in combinations(range(len(texts)), 2) if jaccard(sets[i], sets[j]) >= threshold}
+    return pairs, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSH против полного перебора пар при поиске почти-дубликатов")
+    parser.add_argument("--input", type=Path, default=CHUNKS_FILE)
+    parser.add_argument("--copies", type=float, default=0.2, help="доля статей, получающих искажённую копию")
+    parser.add_argument("--noise", type=float, default=0.05, help="доля выброшенных слов в копии")
+    parser.add_argument("--multiply", type=int, default=1, help="повторить корпус (с шумом) для оценки роста")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base = [" ".join(a["texts"]) for a in load_articles(args.input)]
+    texts = list(base)
+    for _ in range(args.multiply - 1):
+        texts.extend(perturb(text, rng, 0.5) for text in base)
+    texts.extend(perturb(text, rng, args.noise) for text in base if rng.random() < args.copies)
+    print(f"Текстов: {len(texts)} (исходных статей {len(base)})")
+
+    started = time.perf_counter()
+    clusters, similar, stats = find_clusters(texts, NEAR_DUP_THRESHOLD)
+    lsh_time = time.perf_counter() - started
+    print(f"LSH: {lsh_time:.3f} с, пар-кандидатов {stats['candidate_pairs']} из {stats['all_pairs']}, "
+          f"похожих {len(similar)}, кластеров {len(clusters)}")
+
+    exact, brute_time = brute_force_pairs(texts, NEAR_DUP_THRESHOLD)
+    found = set(similar)
+    recall = len(found & exact) / len(exact) if exact else 1.0
+    print(f"Перебор: {brute_time:.3f} с, похожих пар {len(exact)}")
+    print(f"Полнота LSH: {recall:.3f}, ложных пар: {len(found - exact)}, ускорение: {brute_time / lsh_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+import requests
+from scripts.parse import (
+    KEYWORDS, SOURCES, SEARCHES, ArticleStore, HarvestState, TokenBucket, dedup_keys, harvest, make_clients
+)
+
+# Сбор статей против локального сервера-заглушки, который отвечает как arXiv / OpenAlex /
+# Semantic Scholar, держит лимит частоты каждого источника (сверх лимита — 429) и с заданной
+# вероятностью отдаёт 503. Сравниваются прежний последовательный сбор (requests.get + пауза
+# 1.5–3.5 с после каждого запроса, только первая страница) и параллельный постраничный harvest,
+# а также сбор, прерванный на середине и продолженный с чекпоинта.
+#
+# Каждый источник отдаёт по запросу results_per_query записей; DOI у части записей общий для всех
+# источников, поэтому одна статья приходит из разных мест и должна попасть в корпус один раз.
+
+LEGACY_PAGE_SIZES = {"arxiv": 50, "openalex": 50, "semantic_scholar": 30}
+SHARED_DOI_EVERY = 5
+
+
+def _doi(query: str, i: int) -> str:
+    return f"10.1000/{abs(hash(query)) % 10**6}.{i}" if i % SHARED_DOI_EVERY == 0 else ""
+
+
+def arxiv_feed(query: str, items: range, total: int) -> str:
+    entries = "".join(
+        f"<entry><id>http://arxiv.org/abs/{abs(hash(query)) % 10**6}.{i:05d}v1</id>"
+        f"<published>2021-01-01T00:00:00Z</published><title>{query} study {i}</title>"
+        f"<summary>Abstract {i} about {query}.</summary><author><name>Author {i}</name></author>"
+        + (f"<arxiv:doi>{_doi(query, i)}</arxiv:doi>" if _doi(query, i) else "") + "</entry>"
+        for i in items
+    )
+    return ('<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom" '
+            f'xmlns:arxiv="http://arxiv.org/schemas/atom">{entries}</feed>')
+
+
+def openalex_page(query: str, items: range, total: int) -> Dict:
+    return {"meta": {"next_cursor": str(items.stop) if items.stop < total else None}, "results": [{
+        "id": f"https://openalex.org/W{abs(hash(query)) % 10**6}{i:03d}",
+        "display_name": f"{query} work {i}",
+        "abstract_inverted_index": {"Abstract": [0], str(i): [1], "about": [2], query: [3]},
+        "publication_year": 2020,
+        "authorships": [{"author": {"display_name": f"Author {i}"}, "institutions": [{"country_code": "DE"}]}],
+        "primary_location": {"pdf_url": None},
+        "doi": f"https://doi.org/{_doi(query, i)}" if _doi(query, i) else None,
+    } for i in items]}
+
+
+def semantic_scholar_page(query: str, items: range, total: int) -> Dict:
+    page = {"data": [{
+        "paperId": f"{abs(hash(query)) % 10**6}{i:03d}",
+        "title": f"{query} paper {i}",
+        "abstract": f"Abstract {i} about {query}.",
+        "year": 2019,
+        "authors": [{"name": f"Author {i}"}],
+        "openAccessPdf": {"url": ""},
+        "externalIds": {"DOI": _doi(query, i)} if _doi(query, i) else {},
+    } for i in items]}
+    if items.stop < total:
+        page["next"] = items.stop
+    return page
+
+
+def page_items(source: str, params: Dict, total: int) -> range:
+    if source == "arxiv":
+        start, size = params.get("start", ["0"])[0], params.get("max_results", ["50"])[0]
+    elif source == "openalex":
+        start, size = params.get("cursor", ["*"])[0].replace("*", "0"), params.get("per_page", ["25"])[0]
+    else:
+        start, size = params.get("offset", ["0"])[0], params.get("limit", ["10"])[0]
+    return range(min(int(start), total), min(int(start) + int(size), total))
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # клиент закрывает keep-alive соединения, когда сессия больше не нужна
+        pass
+
+
+class StubServer:
+    """HTTP-заглушка трёх источников с их лимитами частоты, задержкой ответа и случайными 503."""
+
+    PAGES = {"arxiv": arxiv_feed, "openalex": openalex_page, "semantic_scholar": semantic_scholar_page}
+
+    def __init__(self, sources: Dict[str, Dict], latency: float, error_rate: float, results_per_query: int,
+                 seed: int = 0):
+        self.latency = latency
+        self.results_per_query = results_per_query
+        self.error_rate = error_rate
+        self.sources = sources
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        handler = self._handler()
+        self.httpd = _QuietServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def reset(self):
+        # сервер чуть терпимее клиента, чтобы погрешность таймеров не давала ложных 429
+        self.buckets = {name: TokenBucket(spec["rate"] * 1.05, spec.get("burst", 1)) for name, spec in self.sources.items()}
+        self.counts = {}
+
+    def count(self, source: str, status: int):
+        with self.lock:
+            self.counts[(source, status)] = self.counts.get((source, status), 0) + 1
+
+    def _allowed(self, source: str) -> bool:
+        bucket = self.buckets[source]
+        with bucket._lock:
+            now = time.monotonic()
+            bucket.tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True
+            return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str, headers: Dict = None):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                source = url.path.strip("/")
+                params = parse_qs(url.query)
+                query = (params.get("search_query") or params.get("search") or params.get("query") or [""])[0]
+                query = query.removeprefix('all:"').removesuffix('"')
+                if source not in server.PAGES:
+                    server.count(source, 404)
+                    return self._send(404, "{}", "application/json")
+                if not server._allowed(source):
+                    server.count(source, 429)
+                    return self._send(429, "{}", "application/json", {"Retry-After": "1"})
+                time.sleep(server.latency)
+                with server.lock:
+                    failed = server.random.random() < server.error_rate
+                if failed:
+                    server.count(source, 503)
+                    return self._send(503, "{}", "application/json")
+                server.count(source, 200)
+                page = server.PAGES[source](query, page_items(source, params, server.results_per_query),
+                                            server.results_per_query)
+                if isinstance(page, str):
+                    return self._send(200, page, "application/atom+xml")
+                return self._send(200, json.dumps(page), "application/json")
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class LegacyClient:
+    """Прежний способ запроса: отдельный requests.get на каждый вызов, без повторов."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+
+    def get(self, params: Dict, stream: bool = False) -> requests.Response:
+        resp = requests.get(self.url, params=params, timeout=20, stream=stream)
+        resp.raise_for_status()
+        return resp
+
+
+def legacy_harvest(keywords: List[str], urls: Dict[str, str], delay: tuple) -> List[Dict]:
+    articles = []
+    for keyword in keywords:
+        for name, url in urls.items():
+            try:
+                articles.extend(SEARCHES[name](LegacyClient(name, url), keyword, None, LEGACY_PAGE_SIZES[name])[0])
+            except Exception as e:
+                print(f"{name} ошибка: {e}")
+            time.sleep(random.uniform(*delay))
+    # прежний save_jsonl убирал дубли только по заголовку и аннотации
+    seen = set()
+    return [a for a in articles if not (a["title"], a["abstract"][:100]) in seen and not seen.add((a["title"], a["abstract"][:100]))]
+
+
+def unique_articles(keywords: List[str], sources: Dict, total: int) -> int:
+    """Сколько разных статей отдаёт заглушка: все записи минус повторы DOI между источниками."""
+    shared = sum(1 for i in range(total) if i % SHARED_DOI_EVERY == 0)
+    return len(keywords) * (len(sources) * total - (len(sources) - 1) * shared)
+
+
+def read_corpus(path: Path) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def duplicates(articles: List[Dict]) -> int:
+    seen = set()
+    count = 0
+    for article in articles:
+        keys = dedup_keys(article)
+        count += any(key in seen for key in keys)
+        seen.update(keys)
+    return count
+
+
+def report(title: str, elapsed: float, collected: int, expected: int, counts: Dict):
+    statuses = sorted({status for _, status in counts})
+    by_status = ", ".join(f"{status}: {sum(v for (_, s), v in counts.items() if s == status)}" for status in statuses)
+    print(f"{title:<34} {elapsed:>8.1f} {collected:>6}/{expected:<6} {by_status}")
+
+
+def run_harvest(keywords: List[str], sources: Dict, directory: Path, target: int = None) -> ArticleStore:
+    store = ArticleStore(directory / "raw.jsonl", directory / "dedup_index.u64", HarvestState(directory / "state.json"))
+    clients = make_clients(sources)
+    try:
+        harvest(keywords, clients, store, target=target)
+    finally:
+        for client in clients.values():
+            client.close()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сбор статей против локальной заглушки API: последовательный и параллельный")
+    parser.add_argument("--keywords", type=int, default=3, help="сколько ключевых слов из KEYWORDS опросить")
+    parser.add_argument("--results", type=int, default=300, help="записей в выдаче заглушки на запрос")
+    parser.add_argument("--latency", type=float, default=0.3, help="время ответа заглушки, с")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="доля ответов 503")
+    parser.add_argument("--legacy-delay", type=float, nargs=2, default=(1.5, 3.5),
+                        help="пауза прежнего сбора после каждого запроса, с")
+    args = parser.parse_args()
+
+    keywords = KEYWORDS[:args.keywords]
+    expected = unique_articles(keywords, SOURCES, args.results)
+    with StubServer(SOURCES, args.latency, args.error_rate, args.results) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        sources = {name: dict(spec, url=f"{server.base_url}/{name}") for name, spec in SOURCES.items()}
+        print(f"Ключевых слов: {len(keywords)}, источников: {len(sources)}, записей на запрос: {args.results}, "
+              f"ответ заглушки {args.latency} с, 503 в {args.error_rate:.0%} ответов")
+        print(f"\n{'сбор':<34} {'время, с':>8} {'статьи':>13} ответы заглушки")
+
+        start = time.perf_counter()
+        legacy = legacy_harvest(keywords, {name: spec["url"] for name, spec in sources.items()}, args.legacy_delay)
+        report("последовательный, 1 страница", time.perf_counter() - start, len(legacy), expected, server.counts)
+        print(f"  дублей по DOI в корпусе: {duplicates(legacy)}")
+
+        server.reset()
+        full_dir = Path(tmp) / "full"
+        full_dir.mkdir()
+        start = time.perf_counter()
+        store = run_harvest(keywords, sources, full_dir)
+        report("параллельный, постранично", time.perf_counter() - start, store.articles, expected, server.counts)
+        full = read_corpus(full_dir / "raw.jsonl")
+        print(f"  дублей в корпусе: {duplicates(full)}")
+
+        # прерываем на половине, затем продолжаем новым процессом сбора с того же чекпоинта
+        server.reset()
+        resumed_dir = Path(tmp) / "resumed"
+        resumed_dir.mkdir()
+        start = time.perf_counter()
+        run_harvest(keywords, sources, resumed_dir, target=expected // 2)
+        store = run_harvest(keywords, sources, resumed_dir)
+        report("прерванный + продолженный", time.perf_counter() - start, store.articles, expected, server.counts)
+        resumed = read_corpus(resumed_dir / "raw.jsonl")
+        same = {a["source"] for a in resumed} == {a["source"] for a in full}
+        print(f"  дублей в корпусе: {duplicates(resumed)}, тот же набор статей, что без прерывания: {same}")
+        # повторный запуск после завершения не делает ни одного запроса и ничего не дописывает
+        server.reset()
+        store = run_harvest(keywords, sources, resumed_dir)
+        print(f"  повторный запуск: запросов {sum(server.counts.values())}, статей {store.articles}")
+
+
+if __name__ == "__main__":
+    main()
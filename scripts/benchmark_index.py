@@ -0,0 +1,165 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+import faiss
+import numpy as np
+from settings.config import FAISS_DIR
+from index_spec import parse_spec, format_spec, build_index, index_memory_bytes, read_index
+
+
+DEFAULT_SPECS = [
+    "flat",
+    "hnsw:M=32,efSearch=64",
+    "hnsw:M=32,efSearch=128",
+    "ivf:nlist=64,nprobe=4",
+    "ivf:nlist=64,nprobe=16",
+    "ivfpq:nlist=64,m=64,nbits=8,nprobe=16",
+]
+
+
+def load_vectors(index_dir: Path) -> np.ndarray:
+    index = faiss.read_index(str(index_dir / "index.faiss"))
+    if not isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+        raise SystemExit("Для эталона нужен flat индекс (соберите его с --index-spec flat) или --synthetic")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # несколько кластеров, чтобы данные были ближе к реальным эмбеддингам, чем равномерный шум
+    centers = rng.normal(size=(max(1, n // 100), dim))
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    queries = picked + 0.05 * rng.normal(size=picked.shape)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries.astype(np.float32)
+
+
+def benchmark(spec: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    parsed = parse_spec(spec)
+    start = time.perf_counter()
+    index = build_index(parsed, vectors)
+    build_time = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    return {
+        "spec": format_spec(parsed),
+        "recall": recall,
+        "p50_ms": np.percentile(latencies, 50) * 1000,
+        "p99_ms": np.percentile(latencies, 99) * 1000,
+        "memory_mb": index_memory_bytes(index) / 2**20,
+        "build_s": build_time,
+    }
+
+
+def memory_mb() -> dict:
+    # Rss включает страницы файла, общие с другими процессами; Anonymous — только собственную память процесса
+    stats = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss", "Anonymous"):
+                stats[name.lower()] = int(value.split()[0]) / 1024
+    return stats
+
+
+def load_child(index_path: Path, mmap: bool):
+    """Замер в отдельном процессе: время открытия индекса и прирост памяти."""
+    before = memory_mb()
+    start = time.perf_counter()
+    index = read_index(index_path, mmap=mmap)
+    load_time = time.perf_counter() - start
+    loaded = memory_mb()
+
+    queries = np.random.default_rng(0).normal(size=(20, index.d)).astype(np.float32)
+    start = time.perf_counter()
+    index.search(queries, 10)
+    first_search = time.perf_counter() - start
+    searched = memory_mb()
+
+    print(json.dumps({
+        "load_s": load_time,
+        "first_search_s": first_search,
+        "rss_mb": loaded.get("rss", 0) - before.get("rss", 0),
+        "anon_mb": loaded.get("anonymous", 0) - before.get("anonymous", 0),
+        "rss_after_search_mb": searched.get("rss", 0) - before.get("rss", 0),
+        "anon_after_search_mb": searched.get("anonymous", 0) - before.get("anonymous", 0),
+    }))
+
+
+def benchmark_load(index_path: Path, repeats: int = 3):
+    print(f"\nЗагрузка {index_path} ({index_path.stat().st_size / 2**20:.1f} МБ), каждый замер в новом процессе")
+    print(f"{'режим':<8} {'открытие, с':>12} {'1-й поиск, с':>13} {'RSS, МБ':>9} {'своя, МБ':>9} {'RSS после поиска':>17} {'своя после поиска':>18}")
+    root = Path(__file__).resolve().parent.parent
+    for mode in ("read", "mmap"):
+        runs = []
+        for _ in range(repeats):
+            cmd = [sys.executable, "-m", "scripts.benchmark_index", "--load-child", mode, "--index-path", str(index_path)]
+            output = subprocess.run(cmd, cwd=root, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        r = {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+        print(f"{mode:<8} {r['load_s']:>12.4f} {r['first_search_s']:>13.4f} {r['rss_mb']:>9.1f} {r['anon_mb']:>9.1f} "
+              f"{r['rss_after_search_mb']:>17.1f} {r['anon_after_search_mb']:>18.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение типов FAISS индекса: recall@k, задержка, память")
+    parser.add_argument("--index-dir", type=Path, default=FAISS_DIR)
+    parser.add_argument("--synthetic", type=int, default=0, help="вместо векторов индекса взять N синтетических")
+    parser.add_argument("--dim", type=int, default=1024, help="размерность синтетических векторов")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--spec", action="append", help="тип индекса (можно несколько раз)")
+    parser.add_argument("--load", action="store_true", help="сравнить время открытия и память: обычное чтение и memory-map")
+    parser.add_argument("--index-path", type=Path, help="файл индекса для --load (по умолчанию index.faiss из --index-dir)")
+    parser.add_argument("--load-child", choices=("read", "mmap"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    index_path = args.index_path or args.index_dir / "index.faiss"
+    if args.load_child:
+        load_child(index_path, mmap=args.load_child == "mmap")
+        return
+    if args.load:
+        benchmark_load(index_path)
+        return
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_vectors(args.index_dir)
+    queries = make_queries(vectors, args.queries)
+    print(f"Векторов: {len(vectors)} x {vectors.shape[1]}, запросов: {len(queries)}, k={args.k}")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"\n{'индекс':<42} {'recall@k':>9} {'p50, мс':>9} {'p99, мс':>9} {'память, МБ':>11} {'сборка, с':>10}")
+    for spec in args.spec or DEFAULT_SPECS:
+        try:
+            r = benchmark(spec, vectors, queries, truth, args.k)
+        except (ValueError, RuntimeError) as e:
+            print(f"{spec:<42} ошибка: {e}")
+            continue
+        print(f"{r['spec']:<42} {r['recall']:>9.3f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['memory_mb']:>11.2f} {r['build_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import html
+import io
+import json
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+from xml.sax.saxutils import escape
+from settings.config import DATA_DIR, RAW_FILE
+from scripts.parse import (
+    COUNTRY_CODES, KEYWORDS, extract_arxiv_year, extract_country_from_affiliation, iter_arxiv_feed, loads_json,
+    make_clients, parse_openalex_page
+)
+
+# Разбор ответов источников на записанных лентах. Ленты сохраняются с --record (нужен доступ к API)
+# в fixtures/<источник>/; если их нет, они собираются из статей raw.jsonl в формате ответа API.
+
+FIXTURES_DIR = DATA_DIR / "fixtures"
+ARXIV_FIELDS = ("title", "abstract", "source", "pdf_url", "year", "authors", "doi")
+OPENALEX_FIELDS = ("title", "abstract", "source", "pdf_url", "year", "country", "authors")
+OPENALEX_SELECT = "id,display_name,abstract_inverted_index,publication_year,authorships,primary_location,doi"
+
+
+def legacy_parse_arxiv(data: bytes, query: str) -> List[Dict]:
+    """Прежний разбор: resp.text целиком, re.findall по <entry> и re.search по каждому полю."""
+    articles = []
+    content = data.decode("utf-8")
+    entries = re.findall(r'<entry>(.*?)</entry>', content, re.DOTALL)
+    for entry in entries:
+        try:
+            title = re.search(r'<title>(.*?)</title>', entry, re.DOTALL)
+            abstract = re.search(r'<summary>(.*?)</summary>', entry, re.DOTALL)
+            arxiv_id = re.search(r'<id>http://arxiv.org/abs/([^<]+)</id>', entry)
+            published = re.search(r'<published>([^<]+)</published>', entry)
+            doi = re.search(r'<arxiv:doi[^>]*>([^<]+)</arxiv:doi>', entry)
+            authors = re.findall(r'<name>([^<]+)</name>', entry)
+            if title and abstract and arxiv_id:
+                year = extract_arxiv_year(published.group(1)) if published else None
+                articles.append({
+                    "title": title.group(1).strip().replace("\n", " "),
+                    "abstract": abstract.group(1).strip().replace("\n", " "),
+                    "source": f"arxiv:{arxiv_id.group(1)}",
+                    "pdf_url": f"https://arxiv.org/pdf/{arxiv_id.group(1)}.pdf",
+                    "year": year,
+                    "authors": authors[:5],
+                    "doi": doi.group(1).strip() if doi else "",
+                })
+        except:
+            continue
+    return articles
+
+
+def streaming_parse_arxiv(data: bytes, query: str) -> List[Dict]:
+    return [
+        record for record in iter_arxiv_feed(io.BytesIO(data), query)
+        if record["title"] and record["abstract"] and record["source"]
+    ]
+
+
+def legacy_parse_openalex(data: bytes, query: str) -> List[Dict]:
+    """Прежний разбор OpenAlex: аннотация — заполнение массива после поиска максимальной позиции,
+    country_map создаётся заново для каждого автора."""
+    articles = []
+    for work in json.loads(data).get("results", []):
+        abstract = ""
+        if work.get("abstract_inverted_index"):
+            inv_idx = work["abstract_inverted_index"]
+            max_pos = max(max(positions) for positions in inv_idx.values())
+            words = [""] * (max_pos + 1)
+            for word, positions in inv_idx.items():
+                for pos in positions:
+                    words[pos] = word
+            abstract = " ".join(words)
+        countries = []
+        for authorship in work.get("authorships", [])[:3]:
+            if authorship.get("institutions"):
+                country_code = authorship["institutions"][0].get("country_code", "")
+                country_map = {'US': 'USA', 'GB': 'UK', 'CN': 'China', 'JP': 'Japan', 'DE': 'Germany', 'RU': 'Russia'}
+                countries.append(country_map.get(country_code, country_code))
+        articles.append({
+            "title": work.get("display_name", ""),
+            "abstract": abstract,
+            "source": work.get("id", ""),
+            "pdf_url": work.get("primary_location", {}).get("pdf_url", ""),
+            "year": work.get("publication_year"),
+            "country": countries[0] if countries else "Unknown",
+            "authors": [a["author"]["display_name"] for a in work.get("authorships", [])[:5]],
+        })
+    return articles
+
+
+def current_parse_openalex(data: bytes, query: str) -> List[Dict]:
+    return parse_openalex_page(loads_json(data), query)
+
+
+def openalex_schema(record: Dict, legacy: bool) -> Dict:
+    # прежние записи могли содержать None вместо строк и "" вместо Unknown у страны;
+    # новые сравниваются как есть — они уже приведены к схеме normalize_record
+    if not legacy:
+        return record
+    return {k: ("Unknown" if k == "country" else "") if v is None or v == "" else v for k, v in record.items()}
+
+
+def legacy_extract_country(affiliation: str) -> str:
+    country_keywords = {
+        'USA': ['united states', 'usa', 'u.s.', 'america'],
+        'China': ['china', 'beijing', 'shanghai'],
+        'Japan': ['japan', 'tokyo', 'osaka'],
+        'Germany': ['germany', 'berlin', 'munich'],
+        'Russia': ['russia', 'moscow', 'saint petersburg'],
+        'India': ['india', 'delhi', 'mumbai'],
+        'South Korea': ['south korea', 'korea', 'seoul'],
+        'UK': ['united kingdom', 'uk', 'england', 'london'],
+        'Sweden': ['sweden', 'stockholm'],
+        'Finland': ['finland', 'helsinki'],
+        'Austria': ['austria', 'vienna'],
+        'Canada': ['canada', 'toronto', 'vancouver'],
+        'Australia': ['australia', 'sydney', 'melbourne'],
+        'Brazil': ['brazil', 'sao paulo', 'rio de janeiro']
+    }
+    if not affiliation:
+        return "Unknown"
+    affiliation_lower = affiliation.lower()
+    for country, keywords in country_keywords.items():
+        if any(keyword in affiliation_lower for keyword in keywords):
+            return country
+    return "Other"
+
+
+AFFILIATION_TEMPLATES = [
+    "Department of Materials Science and Engineering, {}",
+    "State Key Laboratory of Advanced Metallurgy, University of Science and Technology, {}",
+    "Institute for Ferrous Metallurgy, {}",
+]
+AFFILIATION_PLACES = [
+    "Beijing, China", "Tokyo, Japan", "Aachen, Germany", "Moscow, Russia", "Mumbai, India", "Seoul, South Korea",
+    "London, United Kingdom", "Stockholm, Sweden", "Espoo, Finland", "Leoben, Austria", "Hamilton, Canada",
+    "Wollongong, Australia", "Sao Paulo, Brazil", "Pittsburgh, PA, USA", "Kyiv, Ukraine", "Bloomington, Indiana",
+    "Jerusalem, Israel", "Trondheim, Norway", "Lyon, France", "Ghent, Belgium",
+]
+
+
+def _wrap(text: str, width: int = 80) -> str:
+    # arXiv переносит длинные заголовки и аннотации по строкам
+    return "\n  ".join(text[i:i + width] for i in range(0, len(text), width))
+
+
+def arxiv_feed(articles: List[Dict], query: str, start: int) -> bytes:
+    """Лента в формате ответа export.arxiv.org/api/query."""
+    arxiv = 'xmlns:arxiv="http://arxiv.org/schemas/atom"'
+    opensearch = 'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"'
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n',
+        f'  <link href="http://arxiv.org/api/query?search_query%3Dall%3A%22{escape(query)}%22" rel="self" type="application/atom+xml"/>\n',
+        f'  <title type="html">ArXiv Query: search_query=all:"{escape(query)}"&amp;start={start}</title>\n',
+        '  <id>http://arxiv.org/api/Qx1bqDLPxQD8fOw4Vy8Y1Q2qr6U</id>\n  <updated>2024-05-01T00:00:00-04:00</updated>\n',
+        f'  <opensearch:totalResults {opensearch}>{start + len(articles)}</opensearch:totalResults>\n',
+        f'  <opensearch:startIndex {opensearch}>{start}</opensearch:startIndex>\n',
+        f'  <opensearch:itemsPerPage {opensearch}>{len(articles)}</opensearch:itemsPerPage>\n',
+    ]
+    for i, article in enumerate(articles):
+        arxiv_id = f"{2000 + (start + i) // 1000 % 100}.{(start + i) % 100000:05d}v1"
+        year = article.get("year") or 2020
+        authors = "".join(
+            f"    <author>\n      <name>{escape(name)}</name>\n"
+            f"      <arxiv:affiliation {arxiv}>Institute of Metallurgy</arxiv:affiliation>\n    </author>\n"
+            for name in [a for a in article.get("authors") or [] if a] or ["Anonymous"]
+        )
+        doi = f"10.1000/fixture.{start + i}"
+        parts.append(
+            f"  <entry>\n    <id>http://arxiv.org/abs/{arxiv_id}</id>\n"
+            f"    <updated>{year}-06-01T12:00:00Z</updated>\n    <published>{year}-05-01T12:00:00Z</published>\n"
+            f"    <title>{escape(_wrap(article['title']))}</title>\n"
+            f"    <summary>  {escape(_wrap(article['abstract']))}\n</summary>\n{authors}"
+            f"    <arxiv:doi {arxiv}>{doi}</arxiv:doi>\n"
+            f'    <link title="doi" href="http://dx.doi.org/{doi}" rel="related"/>\n'
+            f"    <arxiv:comment {arxiv}>12 pages, 5 figures</arxiv:comment>\n"
+            f'    <link href="http://arxiv.org/abs/{arxiv_id}" rel="alternate" type="text/html"/>\n'
+            f'    <link title="pdf" href="http://arxiv.org/pdf/{arxiv_id}" rel="related" type="application/pdf"/>\n'
+            f'    <arxiv:primary_category {arxiv} term="cond-mat.mtrl-sci" scheme="http://arxiv.org/schemas/atom"/>\n'
+            f'    <category term="cond-mat.mtrl-sci" scheme="http://arxiv.org/schemas/atom"/>\n  </entry>\n'
+        )
+    parts.append("</feed>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def load_articles(path: Path) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        articles = [json.loads(line) for line in f if line.strip()]
+    return [a for a in articles if a.get("title") and a.get("abstract")]
+
+
+def build_arxiv_fixtures(articles: List[Dict], page_size: int, large_size: int) -> Dict[str, bytes]:
+    feeds = {}
+    for start in range(0, len(articles), page_size):
+        feeds[f"page_{start:05d}.xml"] = arxiv_feed(articles[start:start + page_size], KEYWORDS[0], start)
+    repeated = (articles * (large_size // max(1, len(articles)) + 1))[:large_size]
+    feeds[f"large_{large_size}.xml"] = arxiv_feed(repeated, KEYWORDS[0], 0)
+    return feeds
+
+
+def openalex_page(articles: List[Dict], cursor: str) -> bytes:
+    """Страница в формате ответа api.openalex.org/works с select=OPENALEX_SELECT."""
+    codes = {name: code for code, name in COUNTRY_CODES.items()}
+    results = []
+    for i, article in enumerate(articles):
+        inverted = {}
+        for position, word in enumerate(article["abstract"].split()):
+            inverted.setdefault(word, []).append(position)
+        code = codes.get(article.get("country"), "FR" if i % 3 else None)
+        results.append({
+            "id": article["source"] if article["source"].startswith("https://openalex.org/") else f"https://openalex.org/W{i}",
+            "display_name": article["title"],
+            "abstract_inverted_index": inverted or None,
+            "publication_year": article.get("year"),
+            "authorships": [
+                {"author_position": "first" if n == 0 else "middle",
+                 "author": {"id": f"https://openalex.org/A{i}{n}", "display_name": name},
+                 "institutions": [{"id": f"https://openalex.org/I{n}", "display_name": "University",
+                                   "country_code": code}] if code else [],
+                 "raw_affiliation_strings": ["University"]}
+                for n, name in enumerate(a for a in article.get("authors") or [] if a)
+            ],
+            "primary_location": {"is_oa": bool(article.get("pdf_url")), "pdf_url": article.get("pdf_url") or None},
+            "doi": article.get("doi") or None,
+        })
+    meta = {"count": 10000, "db_response_time_ms": 40, "page": None, "per_page": len(results), "next_cursor": cursor}
+    return json.dumps({"meta": meta, "results": results, "group_by": []}, ensure_ascii=False).encode("utf-8")
+
+
+def build_openalex_fixtures(articles: List[Dict], page_size: int) -> Dict[str, bytes]:
+    return {
+        f"page_{start:05d}.json": openalex_page(articles[start:start + page_size], f"cursor{start + page_size}")
+        for start in range(0, len(articles), page_size)
+    }
+
+
+def record_openalex_fixtures(directory: Path, keywords: List[str], page_size: int):
+    client = make_clients()["openalex"]
+    directory.mkdir(parents=True, exist_ok=True)
+    for n, keyword in enumerate(keywords):
+        params = {"search": keyword, "per_page": page_size, "cursor": "*", "filter": "type:article",
+                  "select": OPENALEX_SELECT}
+        (directory / f"page_{n:05d}.json").write_bytes(client.get(params).content)
+        print(f"Записана страница OpenAlex '{keyword}'")
+    client.close()
+
+
+def benchmark_affiliations(repeats: int):
+    affiliations = [template.format(place) for template in AFFILIATION_TEMPLATES for place in AFFILIATION_PLACES]
+    lookups = affiliations * 200
+    uncached = extract_country_from_affiliation.__wrapped__
+    timings = {}
+    for name, extract in (("прежний", legacy_extract_country), ("таблица", uncached),
+                          ("таблица + кэш", extract_country_from_affiliation)):
+        best = None
+        for _ in range(repeats):
+            extract_country_from_affiliation.cache_clear()
+            start = time.perf_counter()
+            for affiliation in lookups:
+                extract(affiliation)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    print(f"\nСтрана по аффилиации: {len(lookups)} вызовов, {len(affiliations)} разных строк")
+    for name, elapsed in timings.items():
+        print(f"{name:<24} {elapsed * 1e6 / len(lookups):>9.2f} мкс/вызов")
+    changed = [(a, legacy_extract_country(a), uncached(a)) for a in affiliations
+               if legacy_extract_country(a) != uncached(a)]
+    print(f"Расходится с прежним: {len(changed)} из {len(affiliations)} (подстрока вместо целого слова)")
+    for affiliation, old, new in changed[:4]:
+        print(f"  {affiliation!r}: {old} -> {new}")
+
+
+def record_arxiv_fixtures(directory: Path, keywords: List[str], page_size: int):
+    client = make_clients()["arxiv"]
+    directory.mkdir(parents=True, exist_ok=True)
+    for n, keyword in enumerate(keywords):
+        params = {"search_query": f'all:"{keyword}"', "start": 0, "max_results": page_size,
+                  "sortBy": "relevance", "sortOrder": "descending"}
+        (directory / f"page_{n:05d}.xml").write_bytes(client.get(params).content)
+        print(f"Записана лента arXiv '{keyword}'")
+    client.close()
+
+
+def load_fixtures(directory: Path, pattern: str) -> Dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in sorted(directory.glob(pattern))} if directory.exists() else {}
+
+
+def measure(parse, feeds: Dict[str, bytes], repeats: int) -> Dict:
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = {name: parse(data, KEYWORDS[0]) for name, data in feeds.items()}
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # пик памяти — на самой большой ленте, сами байты ленты в него не входят
+    largest = max(feeds, key=lambda name: len(feeds[name]))
+    tracemalloc.start()
+    parse(feeds[largest], KEYWORDS[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"results": results, "time": best, "peak": peak, "largest": largest}
+
+
+def unescape_entities(record: Dict, legacy: bool) -> Dict:
+    # прежний разбор оставлял XML-сущности (&amp;, &lt;) и \r в тексте как есть, а XML-парсер
+    # раскрывает сущности и приводит \r к \n — сравниваем с раскрытыми сущностями и с точностью до пробелов
+    return {
+        k: " ".join((html.unescape(v) if legacy else v).split()) if isinstance(v, str) else v
+        for k, v in record.items()
+    }
+
+
+def compare(legacy: Dict[str, List[Dict]], current: Dict[str, List[Dict]], fields, normalize=None) -> Dict:
+    total = identical = normalized = 0
+    examples = []
+    for name in legacy:
+        old_records, new_records = legacy[name], current[name]
+        total += max(len(old_records), len(new_records))
+        for old, new in zip(old_records, new_records):
+            if all(old.get(f) == new.get(f) for f in fields):
+                identical += 1
+                continue
+            if normalize and all(normalize(old, True).get(f) == normalize(new, False).get(f) for f in fields):
+                normalized += 1
+            elif len(examples) < 3:
+                examples.append({f: (old.get(f), new.get(f)) for f in fields if old.get(f) != new.get(f)})
+    return {"total": total, "identical": identical, "normalized": normalized, "examples": examples}
+
+
+def report(title: str, legacy: Dict, current: Dict, feeds: Dict[str, bytes], fields, normalize=None,
+           normalize_note: str = ""):
+    size = sum(len(data) for data in feeds.values())
+    print(f"\n{title}: лент {len(feeds)}, {size / 2**20:.1f} МБ, самая большая — {current['largest']} "
+          f"({len(feeds[current['largest']]) / 2**20:.1f} МБ)")
+    print(f"{'разбор':<24} {'время, с':>9} {'МБ/с':>8} {'пик памяти, МБ':>15}")
+    for name, result in (("прежний", legacy), ("новый", current)):
+        print(f"{name:<24} {result['time']:>9.3f} {size / 2**20 / result['time']:>8.1f} {result['peak'] / 2**20:>15.1f}")
+    print(f"Ускорение: {legacy['time'] / current['time']:.2f}x")
+    result = compare(legacy["results"], current["results"], fields, normalize)
+    print(f"Совпадающих записей: {result['identical']}/{result['total']}")
+    if result["normalized"]:
+        print(f"  ещё {result['normalized']} отличаются только тем, что {normalize_note}")
+    for example in result["examples"]:
+        print(f"  расхождение: {example}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость, память и эквивалентность разбора ответов источников")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--input", type=Path, default=RAW_FILE, help="статьи для лент, если записанных нет")
+    parser.add_argument("--record", action="store_true", help="записать ленты с API в --fixtures")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--large-size", type=int, default=5000, help="записей в большой ленте")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.record:
+        record_arxiv_fixtures(args.fixtures / "arxiv", KEYWORDS[:5], args.page_size)
+        record_openalex_fixtures(args.fixtures / "openalex", KEYWORDS[:5], args.page_size)
+    articles = None
+
+    feeds = load_fixtures(args.fixtures / "arxiv", "*.xml")
+    if feeds:
+        print(f"Ленты arXiv из {args.fixtures / 'arxiv'}")
+    else:
+        articles = load_articles(args.input)
+        feeds = build_arxiv_fixtures(articles, args.page_size, args.large_size)
+        print(f"Записанных лент нет, ленты arXiv собраны из {args.input}")
+    legacy = measure(legacy_parse_arxiv, feeds, args.repeats)
+    current = measure(streaming_parse_arxiv, feeds, args.repeats)
+    report("arXiv", legacy, current, feeds, ARXIV_FIELDS, unescape_entities,
+           "в прежнем разборе остались XML-сущности (&amp;, &lt; ...) и \\r")
+
+    pages = load_fixtures(args.fixtures / "openalex", "*.json")
+    if pages:
+        print(f"\nСтраницы OpenAlex из {args.fixtures / 'openalex'}")
+    else:
+        articles = articles or load_articles(args.input)
+        pages = build_openalex_fixtures(articles, args.page_size)
+        print(f"\nЗаписанных страниц нет, страницы OpenAlex собраны из {args.input}")
+    legacy = measure(legacy_parse_openalex, pages, args.repeats)
+    current = measure(current_parse_openalex, pages, args.repeats)
+    report("OpenAlex", legacy, current, pages, OPENALEX_FIELDS, openalex_schema,
+           "прежняя запись содержала None или пустую страну вместо Unknown")
+
+    benchmark_affiliations(args.repeats)
+
+
+if __name__ == "__main__":
+    main()
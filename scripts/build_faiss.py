@@ -1,14 +1,24 @@
+import argparse
+import hashlib
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 import logging
+import pickle
 import sys
+import uuid
+import faiss
+import numpy as np
 import torch
 from datetime import datetime
-from settings.config import FAISS_DIR, CHUNKS_FILE
+from settings.config import FAISS_DIR, DEDUP_CHUNKS_FILE, INDEX_SPEC
+from index_spec import parse_spec, format_spec, build_index, check_training_size, supports_removal
+from doc_store import write_docstore, DOCSTORE_DIRNAME
+from lexical_index import write_lexical_index, LEXICAL_DIRNAME
 
 
 logging.basicConfig(
@@ -22,9 +32,9 @@ logger = logging.getLogger(__name__)
 FAISS_DIR.mkdir(exist_ok=True, parents=True)
 
 
-if not CHUNKS_FILE.exists():
-    logger.error(f"Файл не найден: {CHUNKS_FILE}")
-    logger.info("Сначала запустите clean_and_split.py")
+if not DEDUP_CHUNKS_FILE.exists():
+    logger.error(f"Файл не найден: {DEDUP_CHUNKS_FILE}")
+    logger.info("Сначала запустите clean_and_split.py, затем near_duplicates.py")
     sys.exit(1)
 
 def load_chunks(file_path: Path, min_length: int = 100) -> List[Document]:
@@ -95,7 +105,11 @@ def load_chunks(file_path: Path, min_length: int = 100) -> List[Document]:
     
     return documents
 
-def create_faiss_index(documents: List[Document], faiss_dir: Path):
+def content_hash(doc: Document) -> str:
+    payload = json.dumps([doc.page_content, doc.metadata], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def load_embeddings():
     logger.info("Загрузка модели эмбеддингов...")
     
     model_name = "intfloat/multilingual-e5-large-instruct"
@@ -113,36 +127,165 @@ def create_faiss_index(documents: List[Document], faiss_dir: Path):
     except Exception as e:
         logger.error(f"Ошибка загрузки модели: {e}")
         logger.info("Переключаюсь на альтернативную модель...")
+        model_name = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
         embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            model_name=model_name,
             model_kwargs={'device': device}
         )
-    
-    logger.info("Создание FAISS индекса...")
-    
-    vectorstore = FAISS.from_documents(documents, embeddings)
+    return embeddings, model_name, device
+
+def read_index_info(faiss_dir: Path) -> Dict:
+    info_path = faiss_dir / "index_info.json"
+    if not info_path.exists():
+        return {}
+    with open(info_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_index_info(faiss_dir: Path, index_info: Dict):
+    with open(faiss_dir / "index_info.json", "w", encoding="utf-8") as f:
+        json.dump(index_info, f, indent=2, ensure_ascii=False)
+
+def export_docstore(vectorstore: FAISS, faiss_dir: Path):
+    # rag.py читает чанки из колоночного хранилища через memory-map, index.pkl нужен только для обновлений
+    documents = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in range(vectorstore.index.ntotal)]
+    write_docstore(documents, faiss_dir / DOCSTORE_DIRNAME)
+    logger.info(f"Колоночное хранилище чанков записано: {faiss_dir / DOCSTORE_DIRNAME}")
+    # BM25 строится по тем же строкам, что и векторы, — гибридный поиск сливает результаты по номеру строки
+    write_lexical_index((doc.page_content for doc in documents), faiss_dir / LEXICAL_DIRNAME)
+    logger.info(f"Инвертированный индекс BM25 записан: {faiss_dir / LEXICAL_DIRNAME}")
+
+def save_index(vectorstore: FAISS, faiss_dir: Path, model_name: str, device: str, spec: Dict, **build_stats):
     vectorstore.save_local(str(faiss_dir))
+    export_docstore(vectorstore, faiss_dir)
+    previous = read_index_info(faiss_dir)
     index_info = {
         "model_name": model_name,
-        "num_documents": len(documents),
-        "embedding_dimension": len(embeddings.embed_query("test")),
+        "index_spec": format_spec(spec),
+        "num_documents": len(vectorstore.index_to_docstore_id),
+        "embedding_dimension": vectorstore.index.d,
         "created_at": datetime.now().isoformat(),
-        "device": device
+        "device": device,
+        "generation": previous.get("generation", 0) + 1,
+        **build_stats
     }
+    write_index_info(faiss_dir, index_info)
+    return index_info
+
+def create_faiss_index(documents: List[Document], faiss_dir: Path, spec: Dict):
+    # проверяем до расчёта эмбеддингов, а не после
+    check_training_size(spec, len(documents))
+    embeddings, model_name, device = load_embeddings()
     
-    with open(faiss_dir / "index_info.json", "w", encoding="utf-8") as f:
-        json.dump(index_info, f, indent=2, ensure_ascii=False)
+    logger.info(f"Создание FAISS индекса ({format_spec(spec)})...")
+    
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+    index = build_index(spec, vectors)
+    ids = [str(uuid.uuid4()) for _ in documents]
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+    save_index(vectorstore, faiss_dir, model_name, device, spec,
+               mode="full", added=len(documents), removed=0)
     
     logger.info(f"FAISS индекс создан: {len(documents)} документов")
     return vectorstore
 
+def update_faiss_index(documents: List[Document], faiss_dir: Path, spec: Dict) -> Optional[FAISS]:
+    """Обновляет существующий индекс: эмбеддинги считаются только для новых и изменённых чанков.
+
+    Возвращает None, если инкрементальное обновление невозможно и нужна полная пересборка.
+    """
+    if not (faiss_dir / "index.faiss").exists():
+        logger.info("Индекс не найден, будет выполнена полная сборка")
+        return None
+    
+    previous_info = read_index_info(faiss_dir)
+    previous_spec = previous_info.get("index_spec", "flat")
+    if parse_spec(previous_spec) != spec:
+        logger.info(f"Тип индекса ({previous_spec}) отличается от заданного ({format_spec(spec)}), нужна полная сборка")
+        return None
+    
+    embeddings, model_name, device = load_embeddings()
+    previous_model = previous_info.get("model_name")
+    if previous_model != model_name:
+        logger.info(f"Модель индекса ({previous_model}) отличается от текущей ({model_name}), нужна полная сборка")
+        return None
+    
+    vectorstore = FAISS.load_local(str(faiss_dir), embeddings, allow_dangerous_deserialization=True)
+    
+    # chunk_id в clean.jsonl не уникален (одна статья может прийти из нескольких запросов),
+    # поэтому сопоставляем пары (chunk_id, хеш содержимого) с учётом повторов
+    stored = {}
+    for docstore_id in vectorstore.index_to_docstore_id.values():
+        doc = vectorstore.docstore.search(docstore_id)
+        if isinstance(doc, Document):
+            stored.setdefault((doc.metadata.get("chunk_id"), content_hash(doc)), []).append(docstore_id)
+    
+    to_add = []
+    for doc in documents:
+        matches = stored.get((doc.metadata["chunk_id"], content_hash(doc)))
+        if matches:
+            matches.pop()
+        else:
+            to_add.append(doc)
+    to_remove = [docstore_id for ids in stored.values() for docstore_id in ids]
+    
+    removed_chunks = {chunk_id for (chunk_id, _), ids in stored.items() if ids}
+    changed = min(len(to_remove), sum(1 for doc in to_add if doc.metadata["chunk_id"] in removed_chunks))
+    logger.info(f"Новых чанков: {len(to_add) - changed}, изменённых: {changed}, удалённых: {len(to_remove) - changed}")
+    
+    if not to_add and not to_remove:
+        logger.info("Индекс актуален, изменений нет")
+        return vectorstore
+    
+    if to_remove and not supports_removal(spec):
+        logger.info(f"Индекс {spec['type']} не поддерживает удаление, нужна полная сборка")
+        return None
+    
+    if to_remove:
+        vectorstore.delete(to_remove)
+    if to_add:
+        vectorstore.add_documents(to_add)
+    
+    save_index(vectorstore, faiss_dir, model_name, device, spec,
+               mode="incremental", added=len(to_add), removed=len(to_remove))
+    logger.info(f"FAISS индекс обновлён: {len(vectorstore.index_to_docstore_id)} документов")
+    return vectorstore
+
 def main():
+    parser = argparse.ArgumentParser(description="Сборка FAISS индекса из чанков")
+    parser.add_argument("--full", action="store_true", help="пересобрать индекс с нуля вместо инкрементального обновления")
+    parser.add_argument("--index-spec", default=INDEX_SPEC,
+                        help="тип индекса: flat, hnsw:M=32,efSearch=64, ivf:nlist=64,nprobe=8, ivfpq:nlist=64,m=64,nbits=8,nprobe=8")
+    parser.add_argument("--docstore-only", action="store_true",
+                        help="только перезаписать колоночное хранилище и индекс BM25 из index.pkl, без эмбеддингов")
+    args = parser.parse_args()
+    spec = parse_spec(args.index_spec)
+    
+    if args.docstore_only:
+        index = faiss.read_index(str(FAISS_DIR / "index.faiss"))
+        with open(FAISS_DIR / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        export_docstore(FAISS(None, index, docstore, index_to_docstore_id), FAISS_DIR)
+        return
+    
     logger.info("СОЗДАНИЕ ВЕКТОРНОГО ИНДЕКСА ДЛЯ RAG-СИСТЕМЫ")
-    documents = load_chunks(CHUNKS_FILE)
-    vectorstore = create_faiss_index(documents, FAISS_DIR)
+    documents = load_chunks(DEDUP_CHUNKS_FILE)
+    vectorstore = None
+    if not args.full:
+        vectorstore = update_faiss_index(documents, FAISS_DIR, spec)
+    if vectorstore is None:
+        try:
+            vectorstore = create_faiss_index(documents, FAISS_DIR, spec)
+        except ValueError as e:
+            logger.error(f"Индекс не собран: {e}")
+            sys.exit(1)
     logger.info("\nИндекс создан.")
     logger.info(f"Папка: {FAISS_DIR}")
-    logger.info(f"Документов: {len(documents)}")
+    logger.info(f"Документов: {len(vectorstore.index_to_docstore_id)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,66 +1,46 @@
+import argparse
 import json
+import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
 import tiktoken
-from settings.config import DATA_DIR, RAW_FILE, CHUNKS_FILE
+from settings.config import RAW_FILE, CHUNKS_FILE
+from truncation import token_byte_lengths
 
 
 MAX_TOKENS_PER_CHUNK = 1500  
 OVERLAP_TOKENS = 200
 ENCODER = tiktoken.encoding_for_model("gpt-4o")
 
-def count_tokens(text: str) -> int:
-    return len(ENCODER.encode(text, disallowed_special=()))
+# формулы LaTeX, ссылки вида [1, 2] / [3-5] и цитаты (Smith et al., 2020) удаляются за один проход;
+# DOTALL только внутри \\begin...\\end, как и раньше
+MARKUP_RE = re.compile(
+    r'\$.*?\$'
+    r'|\\\(.*?\\\)'
+    r'|\\\[.*?\\\]'
+    r'|\\begin\{(?s:.*?)\}(?s:.*?)\\end\{(?s:.*?)\}'
+    r'|\[[0-9,\s]+\]'
+    r'|\[[0-9]+[-\s][0-9]+\]'
+    r'|\([A-Z][a-z]+(?:\s+et al\.)?(?:,\s*\d{4}[a-z]?)?\)'
+)
+ALLOWED_CHARS = r'A-Za-zА-Яа-яёЁ0-9.,;:!?\-\(\)%/°≈≤≥±→←↑↓×÷'
+# недопустимые символы и пробельные серии за один проход: любая серия из недопустимых
+# и пробельных символов становится одним пробелом; одиночный пробел между словами не трогается
+JUNK_RE = re.compile(f'[^{ALLOWED_CHARS} ][^{ALLOWED_CHARS}]*| [^{ALLOWED_CHARS}]+')
 
 def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    text = re.sub(r'\$.*?\$', ' ', text)  
-    text = re.sub(r'\\\(.*?\\\)', ' ', text)  
-    text = re.sub(r'\\\[.*?\\\]', ' ', text)  
-    text = re.sub(r'\\begin\{.*?\}.*?\\end\{.*?\}', ' ', text, flags=re.DOTALL)  
-    text = re.sub(r'\[[0-9,\s]+\]', ' ', text)  
-    text = re.sub(r'\[[0-9]+[-\s][0-9]+\]', ' ', text)  
-    text = re.sub(r'\([A-Z][a-z]+(?:\s+et al\.)?(?:,\s*\d{4}[a-z]?)?\)', ' ', text)
-    allowed_chars = r'A-Za-zА-Яа-яёЁ0-9\s.,;:!?\-\(\)%/°≈≤≥±→←↑↓×÷'
-    text = re.sub(f'[^{allowed_chars}]', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
-    
+    text = MARKUP_RE.sub(' ', text)
+    text = JUNK_RE.sub(' ', text)
     return text.strip()
 
-def smart_truncate(text: str, max_tokens: int) -> str:
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    result = []
-    current_tokens = 0
-    
-    for sentence in sentences:
-        sentence_tokens = count_tokens(sentence)
-        
-        if current_tokens + sentence_tokens <= max_tokens:
-            result.append(sentence)
-            current_tokens += sentence_tokens
-        else:
-            if not result:
-                words = sentence.split()
-                word_result = []
-                word_tokens = 0
-                
-                for word in words:
-                    word_token_count = count_tokens(word + " ")
-                    if word_tokens + word_token_count <= max_tokens:
-                        word_result.append(word)
-                        word_tokens += word_token_count
-                    else:
-                        break
-                
-                if word_result:
-                    return " ".join(word_result) + "..."
-            break
-    
-    return " ".join(result)
-
 def split_into_chunks(text: str, metadata: Dict, max_tokens: int = MAX_TOKENS_PER_CHUNK, overlap: int = OVERLAP_TOKENS) -> List[Dict]:
     if not text.strip():
         return []
@@ -83,24 +63,39 @@ def split_into_chunks(text: str, metadata: Dict, max_tokens: int = MAX_TOKENS_PE
             "is_full_text": True
         }]
     
+    # текст токенизируется один раз: границы чанков считаются по байтовым смещениям токенов,
+    # без decode окна токенизатором и повторного encode обрезанного текста
+    data = text.encode("utf-8")
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(token_byte_lengths(ENCODER)[tokens], out=offsets[1:])
+    
     chunks = []
     i = 0
     chunk_id = 0
     
     while i < len(tokens):
         end = i + max_tokens
-        chunk_tokens = tokens[i:end]
-        chunk_text = ENCODER.decode(chunk_tokens)
+        start_byte = int(offsets[i])
+        window = data[start_byte:int(offsets[min(end, len(tokens))])]
+        # так же декодирует окно и ENCODER.decode: неполные символы на краях заменяются на U+FFFD
+        chunk_text = window.decode("utf-8", errors="replace")
+        # ASCII-разделитель в байтах и в декодированном окне — одно и то же вхождение
         last_sentence_end = max(
-            chunk_text.rfind(". "),
-            chunk_text.rfind("? "),
-            chunk_text.rfind("! ")
+            window.rfind(b". "),
+            window.rfind(b"? "),
+            window.rfind(b"! ")
         )
         
-        if last_sentence_end > len(chunk_text) * 0.7:  
-            chunk_text = chunk_text[:last_sentence_end + 1]
-            chunk_tokens = ENCODER.encode(chunk_text)
-            end = i + len(chunk_tokens)
+        if last_sentence_end != -1:
+            last_sentence_char = len(chunk_text) - len(window[last_sentence_end:].decode("utf-8", errors="replace"))
+            if last_sentence_char > len(chunk_text) * 0.7:
+                # токены, которые начинаются до конца предложения
+                cut_end = int(np.searchsorted(offsets, start_byte + last_sentence_end + 1, side="left"))
+                # обрезка, после которой окно не сдвинется дальше перекрытия, зациклила бы нарезку
+                if cut_end - overlap > i:
+                    chunk_text = chunk_text[:last_sentence_char + 1]
+                    end = cut_end
+        chunk_tokens = tokens[i:end]
 
         chunk_data = {
             "chunk_id": f"{metadata['source']}_{chunk_id}",
@@ -128,124 +123,208 @@ def split_into_chunks(text: str, metadata: Dict, max_tokens: int = MAX_TOKENS_PE
     
     return chunks
 
+def build_full_text(article: Dict, line_num: int, errors: List[str]) -> str:
+    full_text_parts = []
+    
+    if article.get("title"):
+        full_text_parts.append(f"Title: {article['title']}")
+    
+    if article.get("abstract"):
+        full_text_parts.append(f"Abstract: {article['abstract']}")
+
+    if article.get("authors"):
+        try:
+            authors_list = article["authors"]
+            if isinstance(authors_list, list) and authors_list:
+                authors_str = ", ".join(str(a) for a in authors_list[:3])  
+                full_text_parts.append(f"Authors: {authors_str}")
+        except Exception as e:
+            errors.append(f"  Ошибка обработки авторов в строке {line_num}: {e}")
+    
+    if article.get("concepts"):
+        try:
+            concepts_list = article["concepts"]
+            if isinstance(concepts_list, list) and concepts_list:
+                concepts_str = ", ".join(str(c) for c in concepts_list[:5])  # Берем первые 5
+                full_text_parts.append(f"Keywords: {concepts_str}")
+        except Exception as e:
+            errors.append(f"  Ошибка обработки концептов в строке {line_num}: {e}")
+    
+    return " ".join(full_text_parts)
+
+def process_batch(batch: List[Tuple[int, str]]) -> Dict:
+    """Выполняется в процессе-воркере: clean → tokenize → split для пачки строк raw.jsonl."""
+    started = time.perf_counter()
+    result = {
+        "pid": os.getpid(),
+        "chunks": [],
+        "errors": [],
+        "stats": {
+            "total_articles": 0,
+            "skipped_articles": 0,
+            "articles_with_year": 0,
+            "articles_with_country": 0,
+            "errors": 0,
+        },
+    }
+    stats = result["stats"]
+    
+    for line_num, line in batch:
+        try:
+            article = json.loads(line)
+            stats["total_articles"] += 1
+            
+            cleaned = clean_text(build_full_text(article, line_num, result["errors"]))
+            
+            if len(cleaned) < 200:
+                stats["skipped_articles"] += 1
+                continue
+            
+            metadata = {
+                "title": article.get("title", ""),
+                "source": article.get("source", f"unknown_{line_num}"),
+                "pdf_url": article.get("pdf_url", ""),
+                "doi": article.get("doi", ""),
+                "year": article.get("year"),
+                "country": article.get("country", ""),
+                "authors": article.get("authors", []),
+                "type": article.get("type", "research")
+            }
+            
+            if metadata["year"]:
+                stats["articles_with_year"] += 1
+            if metadata["country"] and metadata["country"] != "Unknown":
+                stats["articles_with_country"] += 1
+
+            result["chunks"].extend(split_into_chunks(cleaned, metadata))
+                
+        except json.JSONDecodeError as e:
+            stats["errors"] += 1
+            result["errors"].append(f" Ошибка JSON в строке {line_num}: {e}")
+        except Exception as e:
+            stats["errors"] += 1
+            result["errors"].append(f" Неизвестная ошибка в строке {line_num}: {e}")
+    
+    stats["busy_s"] = time.perf_counter() - started
+    return result
+
+def read_batches(path: Path, batch_size: int) -> Iterator[List[Tuple[int, str]]]:
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            batch.append((line_num, line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def process_stream(batches: Iterator[List[Tuple[int, str]]], workers: int, max_pending: int) -> Iterator[Dict]:
+    """Результаты пачек в исходном порядке.
+
+    В очереди не больше max_pending пачек: следующая строка raw.jsonl читается,
+    только когда записана самая старая пачка, поэтому память не зависит от размера дампа.
+    """
+    if workers <= 1:
+        yield from map(process_batch, batches)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(process_batch, batch))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 def main():
-    if not RAW_FILE.exists():
-        print(f"Ошибка: файл {RAW_FILE} не найден.")
+    parser = argparse.ArgumentParser(description="Очистка статей и нарезка на чанки")
+    parser.add_argument("--input", type=Path, default=RAW_FILE)
+    parser.add_argument("--output", type=Path, default=CHUNKS_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов для очистки и токенизации")
+    parser.add_argument("--batch-size", type=int, default=32, help="статей в одной задаче воркера")
+    parser.add_argument("--max-pending", type=int, default=0, help="пачек в работе одновременно (по умолчанию 4 на воркер)")
+    args = parser.parse_args()
+    
+    if not args.input.exists():
+        print(f"Ошибка: файл {args.input} не найден.")
         return
     
-    all_chunks = []
     stats = {
         "total_articles": 0,
         "skipped_articles": 0,
         "total_chunks": 0,
         "avg_tokens_per_chunk": 0,
         "articles_with_year": 0,
-        "articles_with_country": 0
+        "articles_with_country": 0,
+        "errors": 0
     }
+    worker_stats = {}
+    total_tokens = 0
+    min_tokens = None
+    max_tokens = 0
     
-    print("Чтение сырых данных...")
+    print(f"Чтение сырых данных ({args.workers} процессов)...")
+    started = time.perf_counter()
     
-    with open(RAW_FILE, "r", encoding="utf-8") as f:
-        for line_num, line in enumerate(f, 1):
-            if not line.strip():
-                continue
+    # пишем во временный файл: build_faiss не должен увидеть недописанный clean.jsonl
+    tmp_output = args.output.with_name(args.output.name + ".tmp")
+    max_pending = args.max_pending or 4 * max(1, args.workers)
+    with open(tmp_output, "w", encoding="utf-8") as out:
+        for result in process_stream(read_batches(args.input, args.batch_size), args.workers, max_pending):
+            for message in result["errors"]:
+                print(message)
+            for key, value in result["stats"].items():
+                if key in stats:
+                    stats[key] += value
             
-            try:
-                article = json.loads(line)
-                stats["total_articles"] += 1
-                
-                # Собираем полный текст
-                full_text_parts = []
-                
-                if article.get("title"):
-                    full_text_parts.append(f"Title: {article['title']}")
-                
-                if article.get("abstract"):
-                    full_text_parts.append(f"Abstract: {article['abstract']}")
-
-                if article.get("authors"):
-                    try:
-                        authors_list = article["authors"]
-                        if isinstance(authors_list, list) and authors_list:
-                            authors_str = ", ".join(str(a) for a in authors_list[:3])  
-                            full_text_parts.append(f"Authors: {authors_str}")
-                    except Exception as e:
-                        print(f"  Ошибка обработки авторов в строке {line_num}: {e}")
-                
-                if article.get("concepts"):
-                    try:
-                        concepts_list = article["concepts"]
-                        if isinstance(concepts_list, list) and concepts_list:
-                            concepts_str = ", ".join(str(c) for c in concepts_list[:5])  # Берем первые 5
-                            full_text_parts.append(f"Keywords: {concepts_str}")
-                    except Exception as e:
-                        print(f"  Ошибка обработки концептов в строке {line_num}: {e}")
-                
-                full_text = " ".join(full_text_parts)
-                cleaned = clean_text(full_text)
-                
-                if len(cleaned) < 200:
-                    stats["skipped_articles"] += 1
-                    continue
-                
-                metadata = {
-                    "title": article.get("title", ""),
-                    "source": article.get("source", f"unknown_{line_num}"),
-                    "pdf_url": article.get("pdf_url", ""),
-                    "doi": article.get("doi", ""),
-                    "year": article.get("year"),
-                    "country": article.get("country", ""),
-                    "authors": article.get("authors", []),
-                    "type": article.get("type", "research")
-                }
-                
-                if metadata["year"]:
-                    stats["articles_with_year"] += 1
-                if metadata["country"] and metadata["country"] != "Unknown":
-                    stats["articles_with_country"] += 1
-
-                chunks = split_into_chunks(cleaned, metadata)
-                
-                if chunks:
-                    all_chunks.extend(chunks)
-                    stats["total_chunks"] += len(chunks)
-
-                if line_num % 50 == 0:
-                    print(f"  Обработано {line_num} статей → {len(all_chunks)} чанков")
-                    
-            except json.JSONDecodeError as e:
-                print(f" Ошибка JSON в строке {line_num}: {e}")
-                continue
-            except Exception as e:
-                print(f" Неизвестная ошибка в строке {line_num}: {e}")
-                continue
+            worker = worker_stats.setdefault(result["pid"], {"batches": 0, "articles": 0, "chunks": 0, "busy_s": 0.0})
+            worker["batches"] += 1
+            worker["articles"] += result["stats"]["total_articles"]
+            worker["chunks"] += len(result["chunks"])
+            worker["busy_s"] += result["stats"]["busy_s"]
+            
+            for chunk in result["chunks"]:
+                out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                total_tokens += chunk["chunk_tokens"]
+                min_tokens = chunk["chunk_tokens"] if min_tokens is None else min(min_tokens, chunk["chunk_tokens"])
+                max_tokens = max(max_tokens, chunk["chunk_tokens"])
+            
+            stats["total_chunks"] += len(result["chunks"])
+            if sum(w["batches"] for w in worker_stats.values()) % 10 == 0:
+                print(f"  Обработано {stats['total_articles']} статей → {stats['total_chunks']} чанков")
     
-    if all_chunks:
-        with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
-            for chunk in all_chunks:
-                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
-
-        total_tokens = sum(c['chunk_tokens'] for c in all_chunks)
-        avg_tokens = total_tokens // len(all_chunks) if all_chunks else 0
-        stats["avg_tokens_per_chunk"] = avg_tokens
-
-        print("\n" + "="*60)
-        print("ОТЧЕТ ПО ОБРАБОТКЕ:")
-        print("="*60)
-        print(f"Всего статей обработано: {stats['total_articles']}")
-        print(f"Пропущено (слишком коротких): {stats['skipped_articles']}")
-        print(f"Создано чанков: {stats['total_chunks']}")
-        print(f"Средний размер чанка: {avg_tokens} токенов")
-        print(f"Статей с годом: {stats['articles_with_year']} ({stats['articles_with_year']/stats['total_articles']*100:.1f}%)" if stats['total_articles'] > 0 else "📅 Статей с годом: 0")
-        print(f"Статей со страной: {stats['articles_with_country']} ({stats['articles_with_country']/stats['total_articles']*100:.1f}%)" if stats['total_articles'] > 0 else "🌍 Статей со страной: 0")
-        
-        if all_chunks:
-            chunk_lengths = [c['chunk_tokens'] for c in all_chunks]
-            print(f"Диапазон длины чанков: {min(chunk_lengths)} - {max(chunk_lengths)} токенов")
-        
-        print(f"\nФайл сохранен: {CHUNKS_FILE}")
-    else:
+    if not stats["total_chunks"]:
+        tmp_output.unlink()
         print("Не удалось создать ни одного чанка!")
+        return
+    tmp_output.replace(args.output)
+    elapsed = time.perf_counter() - started
+
+    avg_tokens = total_tokens // stats["total_chunks"]
+    stats["avg_tokens_per_chunk"] = avg_tokens
+
+    print("\n" + "="*60)
+    print("ОТЧЕТ ПО ОБРАБОТКЕ:")
+    print("="*60)
+    print(f"Всего статей обработано: {stats['total_articles']}")
+    print(f"Пропущено (слишком коротких): {stats['skipped_articles']}")
+    print(f"Ошибок: {stats['errors']}")
+    print(f"Создано чанков: {stats['total_chunks']}")
+    print(f"Средний размер чанка: {avg_tokens} токенов")
+    print(f"Статей с годом: {stats['articles_with_year']} ({stats['articles_with_year']/stats['total_articles']*100:.1f}%)" if stats['total_articles'] > 0 else "📅 Статей с годом: 0")
+    print(f"Статей со страной: {stats['articles_with_country']} ({stats['articles_with_country']/stats['total_articles']*100:.1f}%)" if stats['total_articles'] > 0 else "🌍 Статей со страной: 0")
+    print(f"Диапазон длины чанков: {min_tokens} - {max_tokens} токенов")
+    print(f"Время: {elapsed:.1f} с ({stats['total_articles'] / elapsed:.0f} статей/с)")
+    
+    print("\nВоркеры:")
+    for pid, worker in sorted(worker_stats.items()):
+        print(f"  pid {pid}: пачек {worker['batches']}, статей {worker['articles']}, "
+              f"чанков {worker['chunks']}, занят {worker['busy_s']:.1f} с")
+    
+    print(f"\nФайл сохранен: {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from lexical_index import tokenize
+from settings.config import (
+    CHUNKS_FILE, DEDUP_CHUNKS_FILE, DEDUP_REPORT_FILE,
+    NEAR_DUP_SHINGLE, NEAR_DUP_PERMUTATIONS, NEAR_DUP_BANDS, NEAR_DUP_THRESHOLD
+)
+
+# Почти-дубликаты статей между clean_and_split и build_faiss.
+# Одна статья приходит из arXiv, OpenAlex и Semantic Scholar с немного разными заголовком и аннотацией,
+# и точные ключи в parse.py её не ловят. Каждая статья (все чанки одного source) превращается в множество
+# шинглов — хешей троек слов, — а оно в MinHash-сигнатуру из NEAR_DUP_PERMUTATIONS минимумов.
+# Сигнатура режется на NEAR_DUP_BANDS полос; статьи, совпавшие хотя бы в одной полосе, — кандидаты,
+# и только для них считается точный Jaccard шинглов. Пары не ниже NEAR_DUP_THRESHOLD объединяются
+# в кластеры, из кластера остаётся самая полная запись, пустые поля которой дополняются из остальных.
+
+HASH_PRIME = 4294967311  # наименьшее простое больше 2**32: хеши шинглов — crc32
+METADATA_FIELDS = ("pdf_url", "doi", "year", "country", "authors")
+
+
+def shingles(text: str, size: int = NEAR_DUP_SHINGLE) -> np.ndarray:
+    """Уникальные crc32 шинглов из size слов (uint64 для арифметики перестановок)."""
+    words = tokenize(text)
+    if len(words) < size:
+        words = words and [" ".join(words)]
+        size = 1
+    grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """h_i(x) = (a_i * x + b_i) mod p для num_perm случайных пар (a_i, b_i); сигнатура — минимумы h_i по шинглам."""
+
+    def __init__(self, num_perm: int = NEAR_DUP_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a < 2**31 и x < 2**32: произведение помещается в uint64 без переполнения
+        self.a = rng.integers(1, 1 << 31, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.full(self.num_perm, HASH_PRIME, dtype=np.uint64)
+        return ((self.a * hashes[None, :] + self.b) % HASH_PRIME).min(axis=1)
+
+
+def lsh_candidates(signatures: np.ndarray, bands: int = NEAR_DUP_BANDS) -> Iterator[Tuple[int, int]]:
+    """Пары строк signatures, совпавшие хотя бы в одной полосе; каждая пара — один раз."""
+    rows = signatures.shape[1] // bands
+    seen = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i, row in enumerate(block):
+            buckets[row.tobytes()].append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pair = (members[x], members[y])
+                    if pair not in seen:
+                        seen.add(pair)
+                        yield pair
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    if not len(a) or not len(b):
+        return 0.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+
+class UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x != root_y:
+            self.parent[max(root_x, root_y)] = min(root_x, root_y)
+
+
+def find_clusters(texts: List[str], threshold: float = NEAR_DUP_THRESHOLD, num_perm: int = NEAR_DUP_PERMUTATIONS,
+                  bands: int = NEAR_DUP_BANDS) -> Tuple[List[List[int]], Dict[Tuple[int, int], float], Dict]:
+    """Кластеры почти-дубликатов (списки номеров текстов, только размера > 1), сходство проверенных пар и статистика."""
+    started = time.perf_counter()
+    hasher = MinHasher(num_perm)
+    shingle_sets = [shingles(text) for text in texts]
+    signatures = np.stack([hasher.signature(s) for s in shingle_sets]) if texts else np.empty((0, num_perm), np.uint64)
+    signed = time.perf_counter()
+
+    union = UnionFind(len(texts))
+    similar = {}
+    candidates = 0
+    for i, j in lsh_candidates(signatures, bands):
+        candidates += 1
+        similarity = jaccard(shingle_sets[i], shingle_sets[j])
+        if similarity >= threshold:
+            similar[(i, j)] = similarity
+            union.union(i, j)
+    groups = defaultdict(list)
+    for i in range(len(texts)):
+        groups[union.find(i)].append(i)
+    clusters = [members for members in groups.values() if len(members) > 1]
+    stats = {
+        "texts": len(texts),
+        "candidate_pairs": candidates,
+        "all_pairs": len(texts) * (len(texts) - 1) // 2,
+        "similar_pairs": len(similar),
+        "signature_s": round(signed - started, 3),
+        "lsh_s": round(time.perf_counter() - signed, 3),
+    }
+    return clusters, similar, stats
+
+
+def completeness(article: Dict) -> Tuple:
+    meta = article["meta"]
+    filled = sum(1 for field in METADATA_FIELDS if meta.get(field) not in (None, "", [], "Unknown"))
+    # больше заполненных полей, затем длиннее текст, затем раньше в корпусе
+    return filled, meta.get("total_tokens") or 0, -article["order"]
+
+
+def chunk_key(chunk: Dict) -> Tuple[str, str]:
+    return chunk.get("source") or chunk.get("chunk_id"), chunk.get("chunk_id")
+
+
+def iter_chunks(path: Path, repeated: Dict = None) -> Iterator[Dict]:
+    """Чанки файла без повторов: повтор — тот же (source, chunk_id) или тот же текст в той же статье.
+
+    Такие клоны одной статьи не попадают в сравнение статей между собой, поэтому убираются здесь;
+    их число накапливается в repeated["chunks"].
+    """
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            source, chunk_id = chunk_key(chunk)
+            text_key = (source, hashlib.sha1(chunk.get("chunk_text", "").encode("utf-8")).digest())
+            if (source, chunk_id) in seen or text_key in seen:
+                if repeated is not None:
+                    repeated["chunks"] = repeated.get("chunks", 0) + 1
+                continue
+            seen.add((source, chunk_id))
+            seen.add(text_key)
+            yield chunk
+
+
+def load_articles(path: Path) -> List[Dict]:
+    """Статьи clean.jsonl: чанки, сгруппированные по source, в порядке первого появления."""
+    articles = {}
+    for chunk in iter_chunks(path):
+        source = chunk_key(chunk)[0]
+        article = articles.get(source)
+        if article is None:
+            article = articles[source] = {"source": source, "order": len(articles), "meta": chunk, "texts": []}
+        article["texts"].append(chunk.get("chunk_text", ""))
+    return list(articles.values())
+
+
+def plan_merges(articles: List[Dict], clusters: List[List[int]], similar: Dict[Tuple[int, int], float]) -> List[Dict]:
+    merges = []
+    for members in clusters:
+        keep = max(members, key=lambda i: completeness(articles[i]))
+        kept = articles[keep]
+        filled = {}
+        for i in sorted(members, key=lambda i: completeness(articles[i]), reverse=True):
+            if i == keep:
+                continue
+            for field in METADATA_FIELDS:
+                if kept["meta"].get(field) in (None, "", [], "Unknown") and \
+                        articles[i]["meta"].get(field) not in (None, "", [], "Unknown") and field not in filled:
+                    filled[field] = {"value": articles[i]["meta"][field], "from": articles[i]["source"]}
+        merges.append({
+            "kept": kept["source"],
+            "title": kept["meta"].get("title", ""),
+            "dropped": [
+                {"source": articles[i]["source"], "title": articles[i]["meta"].get("title", ""),
+                 "similarity": round(similar.get((min(i, keep), max(i, keep)), 0.0), 3)}
+                for i in members if i != keep
+            ],
+            "filled": filled,
+        })
+    return merges
+
+
+def deduplicate(input_path: Path, output_path: Path, report_path: Path,
+                threshold: float = NEAR_DUP_THRESHOLD) -> Tuple[Dict, List[Dict]]:
+    """Пишет output_path без повторных чанков и почти-дубликатов статей; возвращает статистику и склейки."""
+    started = time.perf_counter()
+    articles = load_articles(input_path)
+    clusters, similar, stats = find_clusters([" ".join(a["texts"]) for a in articles], threshold)
+    merges = plan_merges(articles, clusters, similar)
+    dropped = {d["source"] for merge in merges for d in merge["dropped"]}
+    filled = {merge["kept"]: {field: item["value"] for field, item in merge["filled"].items()} for merge in merges}
+
+    # второй проход потоком: повторы и чанки отброшенных статей пропускаются, у оставленных дополняются метаданные
+    tmp_output = output_path.with_name(output_path.name + ".tmp")
+    kept_chunks = dropped_chunks = 0
+    repeated = {"chunks": 0}
+    with open(tmp_output, "w", encoding="utf-8") as out:
+        for chunk in iter_chunks(input_path, repeated):
+            source = chunk_key(chunk)[0]
+            if source in dropped:
+                dropped_chunks += 1
+                continue
+            chunk.update(filled.get(source, {}))
+            out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            kept_chunks += 1
+    tmp_output.replace(output_path)
+
+    stats.update({
+        "articles": len(articles),
+        "clusters": len(merges),
+        "articles_dropped": len(dropped),
+        "chunks_kept": kept_chunks,
+        "chunks_dropped": dropped_chunks,
+        "chunks_repeated": repeated["chunks"],
+        "threshold": threshold,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    })
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"stats": stats, "merges": merges}, f, ensure_ascii=False, indent=2)
+    return stats, merges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Удаление почти-дубликатов статей (MinHash + LSH) перед build_faiss")
+    parser.add_argument("--input", type=Path, default=CHUNKS_FILE)
+    parser.add_argument("--output", type=Path, default=DEDUP_CHUNKS_FILE)
+    parser.add_argument("--report", type=Path, default=DEDUP_REPORT_FILE)
+    parser.add_argument("--threshold", type=float, default=NEAR_DUP_THRESHOLD, help="минимальный Jaccard шинглов")
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        print(f"Ошибка: файл {args.input} не найден. Сначала запустите clean_and_split.py")
+        return
+
+    stats, merges = deduplicate(args.input, args.output, args.report, args.threshold)
+
+    print("=" * 60)
+    print("ОТЧЕТ ПО ПОЧТИ-ДУБЛИКАТАМ:")
+    print("=" * 60)
+    print(f"Статей: {stats['articles']}, кластеров дубликатов: {stats['clusters']}, отброшено статей: {stats['articles_dropped']}")
+    print(f"Чанков оставлено: {stats['chunks_kept']}, отброшено: {stats['chunks_dropped']}, "
+          f"повторов: {stats['chunks_repeated']}")
+    print(f"Пар-кандидатов LSH: {stats['candidate_pairs']} из {stats['all_pairs']} возможных, "
+          f"похожих (Jaccard >= {args.threshold}): {stats['similar_pairs']}")
+    print(f"Время: сигнатуры {stats['signature_s']} с, LSH и проверка {stats['lsh_s']} с, всего {stats['elapsed_s']} с")
+    for merge in merges[:5]:
+        print(f"  {merge['title'][:70]!r}: оставлен {merge['kept']}, "
+              f"отброшены {[d['source'] for d in merge['dropped']]}")
+    print(f"Отчёт: {args.report}")
+    print(f"Файл: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
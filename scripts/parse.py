@@ -1,20 +1,146 @@
+import hashlib
 import json
+import os
 import time
 import requests
 import re
 import random
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict
+from typing import BinaryIO, Iterable, Iterator, List, Dict, Optional, Tuple
+import numpy as np
+from requests.adapters import HTTPAdapter
 from settings.config import RAW_FILE, DATA_DIR
 
+try:
+    # orjson приходит вместе с langsmith и разбирает ответы API почти вдвое быстрее json
+    from orjson import loads as loads_json
+except ImportError:
+    from json import loads as loads_json
+
 
 DATA_DIR.mkdir(exist_ok=True)
 RAW_OUTPUT = RAW_FILE
 
 MIN_ARTICLES = 500
-REQUEST_DELAY = (1.5, 3.5)  
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
 
+# Источники опрашиваются параллельно, каждый — в пределах своего лимита (token bucket).
+# rate — запросов в секунду, burst — сколько запросов можно сделать подряд после простоя.
+SOURCES = {
+    "arxiv": {"url": "http://export.arxiv.org/api/query", "rate": 1 / 3, "burst": 1},  # правила arXiv API: 1 запрос в 3 с
+    "openalex": {"url": "https://api.openalex.org/works", "rate": 5, "burst": 5},
+    "semantic_scholar": {"url": "https://api.semanticscholar.org/graph/v1/paper/search", "rate": 1, "burst": 1,
+                         "headers": {"User-Agent": "Mozilla/5.0"}},
+}
+HARVEST_WORKERS = 6
+REQUEST_TIMEOUT = 20
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0  # с; задержка перед n-й повторной попыткой — BACKOFF_BASE * 2**n плюс случайная добавка
+BACKOFF_MAX = 60.0
+
+# Выдача листается постранично; курсоры и зафиксированный размер raw.jsonl — в чекпоинте,
+# ключи уже собранных статей — в хеш-таблице на диске (см. DedupIndex).
+PAGE_SIZES = {"arxiv": 100, "openalex": 200, "semantic_scholar": 100}
+MAX_PAGES_PER_QUERY = 10
+SEMANTIC_SCHOLAR_MAX_OFFSET = 1000
+HARVEST_STATE_FILE = DATA_DIR / "harvest_state.json"
+DEDUP_INDEX_FILE = DATA_DIR / "dedup_index.u64"
+DEDUP_INITIAL_CAPACITY = 1 << 16
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов: не больше rate в секунду в среднем и burst подряд."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            # ждём вне блокировки, чтобы другие потоки источника могли пересчитать свою очередь
+            time.sleep(wait)
+
+
+class SourceClient:
+    """HTTP-клиент одного источника: общая сессия с пулом соединений, лимит частоты и повторы на 429/5xx."""
+
+    def __init__(self, name: str, url: str, rate: float, burst: int = 1, headers: Dict = None,
+                 timeout: float = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES, pool_size: int = HARVEST_WORKERS):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update(headers or HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests = 0
+        self.retries = 0
+
+    def _backoff(self, attempt: int, response: requests.Response = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, BACKOFF_BASE)
+
+    def get(self, params: Dict, stream: bool = False) -> requests.Response:
+        """GET с лимитом и повторами; при stream=True тело читается из resp.raw, закрыть ответ — вызывающему."""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.requests += 1
+            try:
+                resp = self.session.get(self.url, params=params, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"{self.name}: {e.__class__.__name__}, повтор через {delay:.1f} с")
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    if not resp.ok:
+                        resp.close()
+                    resp.raise_for_status()
+                    return resp
+                resp.close()
+                delay = self._backoff(attempt, resp)
+                print(f"{self.name}: HTTP {resp.status_code}, повтор через {delay:.1f} с")
+            self.retries += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+def make_clients(sources: Dict[str, Dict] = None, pool_size: int = HARVEST_WORKERS) -> Dict[str, SourceClient]:
+    sources = sources or SOURCES
+    return {
+        name: SourceClient(name, spec["url"], spec["rate"], spec.get("burst", 1), spec.get("headers"),
+                           pool_size=pool_size)
+        for name, spec in sources.items()
+    }
+
 
 KEYWORDS = [
     "steel deoxidation", "non-metallic inclusions", "titanium microalloying",
@@ -27,213 +153,535 @@ KEYWORDS = [
 ]
 
 
+# Общая нормализация записей трёх источников: каждый поиск извлекает сырые поля ответа,
+# а normalize_record приводит их к одной схеме с фиксированным набором полей и их типами.
+
+DOI_PREFIX_RE = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:)', re.IGNORECASE)
+
+# коды стран OpenAlex (ISO 3166-1 alpha-2), которые записываются названием; остальные — как есть
+COUNTRY_CODES = {'US': 'USA', 'GB': 'UK', 'CN': 'China', 'JP': 'Japan', 'DE': 'Germany', 'RU': 'Russia'}
+
+# порядок стран — приоритет, если в аффилиации встречаются несколько
+AFFILIATION_COUNTRIES = {
+    'USA': ['united states', 'usa', 'u.s.', 'america'],
+    'China': ['china', 'beijing', 'shanghai'],
+    'Japan': ['japan', 'tokyo', 'osaka'],
+    'Germany': ['germany', 'berlin', 'munich'],
+    'Russia': ['russia', 'moscow', 'saint petersburg'],
+    'India': ['india', 'delhi', 'mumbai'],
+    'South Korea': ['south korea', 'korea', 'seoul'],
+    'UK': ['united kingdom', 'uk', 'england', 'london'],
+    'Sweden': ['sweden', 'stockholm'],
+    'Finland': ['finland', 'helsinki'],
+    'Austria': ['austria', 'vienna'],
+    'Canada': ['canada', 'toronto', 'vancouver'],
+    'Australia': ['australia', 'sydney', 'melbourne'],
+    'Brazil': ['brazil', 'sao paulo', 'rio de janeiro']
+}
+# ключевое слово (одно слово или фраза) -> (приоритет, страна); фразы проверяются, только если
+# слово может их начинать
+AFFILIATION_LOOKUP = {
+    keyword: (priority, country)
+    for priority, (country, keywords) in enumerate(AFFILIATION_COUNTRIES.items())
+    for keyword in keywords
+}
+AFFILIATION_PHRASES = {}  # первое слово фразы -> длины фраз с ним в словах
+for _keyword in AFFILIATION_LOOKUP:
+    if " " in _keyword:
+        AFFILIATION_PHRASES.setdefault(_keyword.split()[0], set()).add(len(_keyword.split()))
+AFFILIATION_WORD_RE = re.compile(r'[^\W\d_]+(?:\.[^\W\d_]+)*\.?')
+
+
 def extract_arxiv_year(published_date: str) -> int:
     try:
         return int(published_date[:4])
     except:
         return None
 
+@lru_cache(maxsize=4096)
 def extract_country_from_affiliation(affiliation: str) -> str:
-    country_keywords = {
-        'USA': ['united states', 'usa', 'u.s.', 'america'],
-        'China': ['china', 'beijing', 'shanghai'],
-        'Japan': ['japan', 'tokyo', 'osaka'],
-        'Germany': ['germany', 'berlin', 'munich'],
-        'Russia': ['russia', 'moscow', 'saint petersburg'],
-        'India': ['india', 'delhi', 'mumbai'],
-        'South Korea': ['south korea', 'korea', 'seoul'],
-        'UK': ['united kingdom', 'uk', 'england', 'london'],
-        'Sweden': ['sweden', 'stockholm'],
-        'Finland': ['finland', 'helsinki'],
-        'Austria': ['austria', 'vienna'],
-        'Canada': ['canada', 'toronto', 'vancouver'],
-        'Australia': ['australia', 'sydney', 'melbourne'],
-        'Brazil': ['brazil', 'sao paulo', 'rio de janeiro']
-    }
+    """Страна по аффилиации: слова и фразы из 2–3 слов ищутся в AFFILIATION_LOOKUP.
+
+    Совпадают только целые слова, поэтому 'uk' не находится в 'Ukraine', а 'india' — в 'Indiana'.
+    """
     if not affiliation:
         return "Unknown"
-    affiliation_lower = affiliation.lower()
-    for country, keywords in country_keywords.items():
-        if any(keyword in affiliation_lower for keyword in keywords):
-            return country
-    return "Other"
+    words = AFFILIATION_WORD_RE.findall(affiliation.lower())
+    matches = [AFFILIATION_LOOKUP[word] for word in words if word in AFFILIATION_LOOKUP]
+    for i, word in enumerate(words):
+        for length in AFFILIATION_PHRASES.get(word, ()):
+            match = AFFILIATION_LOOKUP.get(" ".join(words[i:i + length]))
+            if match:
+                matches.append(match)
+    return min(matches)[1] if matches else "Other"
+
+def rebuild_inverted_abstract(inverted_index: Dict[str, List[int]]) -> str:
+    """Текст аннотации из abstract_inverted_index OpenAlex (слово -> позиции)."""
+    if not inverted_index:
+        return ""
+    # обычно позиции — ровно 0..n-1: раскладываем слова по местам за один проход без поиска максимума
+    words = [None] * sum(map(len, inverted_index.values()))
+    try:
+        for word, positions in inverted_index.items():
+            for position in positions:
+                words[position] = word
+    except IndexError:
+        words = None
+    if words is not None and None not in words:
+        return " ".join(words)
+    # пропуски или повторы позиций: одна сортировка пар (позиция, слово)
+    pairs = sorted(
+        ((position, word) for word, positions in inverted_index.items() for position in positions),
+        key=itemgetter(0)
+    )
+    return " ".join(word for _, word in pairs)
+
+def normalize_doi(doi: Optional[str]) -> str:
+    return DOI_PREFIX_RE.sub("", (doi or "").strip()).lower()
+
+def normalize_record(query: str, title: Optional[str], abstract: Optional[str], source: str,
+                     pdf_url: Optional[str] = None, year=None, country: Optional[str] = None,
+                     authors: Iterable[Optional[str]] = (), doi: Optional[str] = None) -> Dict:
+    """Запись raw.jsonl: все поля всегда есть, строки вместо None, год — int или None, DOI без префикса."""
+    try:
+        year = int(year) if year is not None else None
+    except (TypeError, ValueError):
+        year = None
+    return {
+        "title": (title or "").strip().replace("\n", " "),
+        "abstract": (abstract or "").strip().replace("\n", " "),
+        "source": source or "",
+        "pdf_url": pdf_url or "",
+        "year": year,
+        "country": country or "Unknown",
+        "authors": [author.strip() for author in authors if author],
+        "doi": normalize_doi(doi),
+        "query": query,
+    }
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ARXIV_NS = "{http://arxiv.org/schemas/atom}"
+ARXIV_ID_RE = re.compile(r'^https?://arxiv\.org/abs/')
+ARXIV_FIELDS = {
+    f"{ATOM_NS}id": "id",
+    f"{ATOM_NS}title": "title",
+    f"{ATOM_NS}summary": "abstract",
+    f"{ATOM_NS}published": "published",
+    f"{ARXIV_NS}doi": "doi",
+}
 
-def search_arxiv(query: str, max_results: int = 50) -> List[Dict]:
+
+def iter_arxiv_feed(stream: BinaryIO, query: str) -> Iterator[Dict]:
+    """Записи Atom-ленты arXiv по мере чтения потока — по одной на каждый <entry>.
+
+    Разобранные элементы сразу удаляются из дерева, поэтому память не зависит от размера страницы.
+    У записи без id, заголовка или аннотации соответствующее поле пустое — отбрасывает её вызывающий.
+    Оборванная или испорченная лента приводит к ET.ParseError.
+    """
+    root = None
+    entry = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            elif elem.tag == f"{ATOM_NS}entry":
+                entry = {"authors": []}
+            continue
+        if entry is None:
+            continue
+        field = ARXIV_FIELDS.get(elem.tag)
+        if field:
+            entry[field] = elem.text
+        elif elem.tag == f"{ATOM_NS}name":
+            entry["authors"].append(elem.text)
+        elif elem.tag == f"{ATOM_NS}entry":
+            entry_id = (entry.get("id") or "").strip()
+            arxiv_id = ARXIV_ID_RE.sub("", entry_id) if ARXIV_ID_RE.match(entry_id) else ""
+            yield normalize_record(
+                query, entry.get("title"), entry.get("abstract"),
+                source=f"arxiv:{arxiv_id}" if arxiv_id else "",
+                pdf_url=f"https://arxiv.org/pdf/{arxiv_id}.pdf" if arxiv_id else "",
+                year=extract_arxiv_year(entry["published"]) if entry.get("published") else None,
+                country="Unknown",  # ArXiv не даёт страну
+                authors=entry["authors"][:5],
+                doi=entry.get("doi"),
+            )
+            entry = None
+            root.clear()
+
+
+def search_arxiv(client: SourceClient, query: str, cursor: int = None,
+                 page_size: int = PAGE_SIZES["arxiv"]) -> Tuple[List[Dict], Optional[int]]:
+    """Страница выдачи arXiv: (статьи, смещение следующей страницы или None)."""
     articles = []
-    base_url = "http://export.arxiv.org/api/query"
+    start = cursor or 0
     params = {
         "search_query": f'all:"{query}"',
-        "start": 0,
-        "max_results": max_results,
+        "start": start,
+        "max_results": page_size,
         "sortBy": "relevance",
         "sortOrder": "descending"
     }
+    entries = 0
+    resp = client.get(params, stream=True)
     try:
-        resp = requests.get(base_url, params=params, timeout=15)
-        resp.raise_for_status()
-        content = resp.text
-        entries = re.findall(r'<entry>(.*?)</entry>', content, re.DOTALL)
-        for entry in entries:
-            try:
-                title = re.search(r'<title>(.*?)</title>', entry, re.DOTALL)
-                abstract = re.search(r'<summary>(.*?)</summary>', entry, re.DOTALL)
-                arxiv_id = re.search(r'<id>http://arxiv.org/abs/([^<]+)</id>', entry)
-                published = re.search(r'<published>([^<]+)</published>', entry)
-                authors = re.findall(r'<name>([^<]+)</name>', entry)
-                if title and abstract and arxiv_id:
-                    year = extract_arxiv_year(published.group(1)) if published else None
-                    articles.append({
-                        "title": title.group(1).strip().replace("\n", " "),
-                        "abstract": abstract.group(1).strip().replace("\n", " "),
-                        "source": f"arxiv:{arxiv_id.group(1)}",
-                        "pdf_url": f"https://arxiv.org/pdf/{arxiv_id.group(1)}.pdf",
-                        "year": year,
-                        "country": "Unknown",  # ArXiv не даёт страну
-                        "authors": authors[:5],
-                        "query": query
-                    })
-            except:
-                continue
-        print(f"ArXiv: найдено {len(articles)} статей")
-        return articles
-    except Exception as e:
-        print(f"ArXiv ошибка: {e}")
-        return []
+        resp.raw.decode_content = True
+        for record in iter_arxiv_feed(resp.raw, query):
+            entries += 1
+            if record["title"] and record["abstract"] and record["source"]:
+                articles.append(record)
+    finally:
+        resp.close()
+    skipped = f", без id/заголовка/аннотации: {entries - len(articles)}" if entries > len(articles) else ""
+    print(f"ArXiv: найдено {len(articles)} статей ('{query}', с {start}{skipped})")
+    # пустая или неполная страница — выдача закончилась
+    return articles, (start + page_size if entries == page_size else None)
 
-def search_openalex(query: str, max_results: int = 50) -> List[Dict]:
+def parse_openalex_page(data: Dict, query: str) -> List[Dict]:
     articles = []
-    url = "https://api.openalex.org/works"
+    for work in data.get("results", []):
+        country = "Unknown"
+        for authorship in work.get("authorships", [])[:3]:
+            if authorship.get("institutions"):
+                code = authorship["institutions"][0].get("country_code") or ""
+                country = COUNTRY_CODES.get(code, code)
+                break
+        articles.append(normalize_record(
+            query, work.get("display_name"), rebuild_inverted_abstract(work.get("abstract_inverted_index")),
+            source=work.get("id"),
+            pdf_url=(work.get("primary_location") or {}).get("pdf_url"),
+            year=work.get("publication_year"),
+            country=country,
+            authors=[(a.get("author") or {}).get("display_name") for a in work.get("authorships", [])[:5]],
+            doi=work.get("doi"),
+        ))
+    return articles
+
+def search_openalex(client: SourceClient, query: str, cursor: str = None,
+                    page_size: int = PAGE_SIZES["openalex"]) -> Tuple[List[Dict], Optional[str]]:
+    """Страница выдачи OpenAlex: (статьи, курсор следующей страницы или None)."""
     params = {
         "search": query,
-        "per_page": min(max_results, 50),
+        "per_page": page_size,
+        "cursor": cursor or "*",
         "filter": "type:article",
         "select": "id,display_name,abstract_inverted_index,publication_year,authorships,primary_location,doi"
     }
-    try:
-        resp = requests.get(url, params=params, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        for work in data.get("results", []):
-            abstract = ""
-            if work.get("abstract_inverted_index"):
-                inv_idx = work["abstract_inverted_index"]
-                max_pos = max(max(positions) for positions in inv_idx.values())
-                words = [""] * (max_pos + 1)
-                for word, positions in inv_idx.items():
-                    for pos in positions:
-                        words[pos] = word
-                abstract = " ".join(words)
-            countries = []
-            for authorship in work.get("authorships", [])[:3]:
-                if authorship.get("institutions"):
-                    country_code = authorship["institutions"][0].get("country_code", "")
-                    country_map = {'US': 'USA', 'GB': 'UK', 'CN': 'China', 'JP': 'Japan', 'DE': 'Germany', 'RU': 'Russia'}
-                    countries.append(country_map.get(country_code, country_code))
-            articles.append({
-                "title": work.get("display_name", ""),
-                "abstract": abstract,
-                "source": work.get("id", ""),
-                "pdf_url": work.get("primary_location", {}).get("pdf_url", ""),
-                "year": work.get("publication_year"),
-                "country": countries[0] if countries else "Unknown",
-                "authors": [a["author"]["display_name"] for a in work.get("authorships", [])[:5]],
-                "query": query
-            })
-        print(f"OpenAlex: найдено {len(articles)} статей")
-        return articles
-    except Exception as e:
-        print(f"OpenAlex ошибка: {e}")
-        return []
-
-def search_semantic_scholar(query: str, max_results: int = 30) -> List[Dict]:
+    resp = client.get(params)
+    data = loads_json(resp.content)
+    results = data.get("results", [])
+    articles = parse_openalex_page(data, query)
+    print(f"OpenAlex: найдено {len(articles)} статей ('{query}')")
+    next_cursor = data.get("meta", {}).get("next_cursor")
+    return articles, (next_cursor if results and next_cursor else None)
+
+def parse_semantic_scholar_page(data: Dict, query: str) -> List[Dict]:
     articles = []
-    url = "https://api.semanticscholar.org/graph/v1/paper/search"
+    for paper in data.get("data", []):
+        country = "Unknown"
+        for author in paper.get("authors", [])[:2]:
+            if author.get("affiliation"):
+                country = extract_country_from_affiliation(author["affiliation"])
+                break
+        articles.append(normalize_record(
+            query, paper.get("title"), paper.get("abstract"),
+            source=f"semanticscholar:{paper.get('paperId', '')}",
+            pdf_url=(paper.get("openAccessPdf") or {}).get("url"),
+            year=paper.get("year"),
+            country=country,
+            authors=[a.get("name") for a in paper.get("authors", [])[:3]],
+            doi=(paper.get("externalIds") or {}).get("DOI"),
+        ))
+    return articles
+
+def search_semantic_scholar(client: SourceClient, query: str, cursor: int = None,
+                            page_size: int = PAGE_SIZES["semantic_scholar"]) -> Tuple[List[Dict], Optional[int]]:
+    """Страница выдачи Semantic Scholar: (статьи, смещение следующей страницы или None)."""
+    offset = cursor or 0
     params = {
         "query": query,
-        "limit": max_results,
-        "fields": "title,abstract,year,authors,venue,url,openAccessPdf"
+        "offset": offset,
+        "limit": page_size,
+        "fields": "title,abstract,year,authors,venue,url,openAccessPdf,externalIds"
     }
-    try:
-        resp = requests.get(url, params=params, headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        for paper in data.get("data", []):
-            countries = []
-            for author in paper.get("authors", [])[:2]:
-                if author.get("affiliation"):
-                    country = extract_country_from_affiliation(author["affiliation"])
-                    if country != "Unknown":
-                        countries.append(country)
-            articles.append({
-                "title": paper.get("title", ""),
-                "abstract": paper.get("abstract", ""),
-                "source": f"semanticscholar:{paper.get('paperId', '')}",
-                "pdf_url": paper.get("openAccessPdf", {}).get("url", ""),
-                "year": paper.get("year"),
-                "country": countries[0] if countries else "Unknown",
-                "authors": [a["name"] for a in paper.get("authors", [])[:3]],
-                "query": query
-            })
-        print(f"Semantic Scholar: найдено {len(articles)} статей")
-        return articles
-    except Exception as e:
-        print(f"Semantic Scholar ошибка: {e}")
-        return []
-
-def save_jsonl(articles: List[Dict], filepath: Path):
-    seen = set()
-    unique = []
-    for art in articles:
-        if not art.get("title") or not art.get("abstract"):
-            continue
-        key = f"{art['title'].lower().strip()}:{art['abstract'][:100].lower().strip()}"
-        if key not in seen:
-            seen.add(key)
-            unique.append(art)
-    with open(filepath, "a" if filepath.exists() else "w", encoding="utf-8") as f:
-        for art in unique:
-            f.write(json.dumps(art, ensure_ascii=False) + "\n")
-    print(f"Сохранено {len(unique)} уникальных статей")
+    resp = client.get(params)
+    data = loads_json(resp.content)
+    articles = parse_semantic_scholar_page(data, query)
+    print(f"Semantic Scholar: найдено {len(articles)} статей ('{query}', с {offset})")
+    next_offset = data.get("next")
+    # поиск по релевантности отдаёт не больше SEMANTIC_SCHOLAR_MAX_OFFSET результатов
+    if next_offset is None or next_offset + page_size > SEMANTIC_SCHOLAR_MAX_OFFSET:
+        return articles, None
+    return articles, next_offset
+
+def dedup_keys(article: Dict) -> List[str]:
+    """Ключи дубликата: заголовок + начало аннотации и DOI; совпадение любого — дубль."""
+    keys = [f"title:{article['title'].lower().strip()}:{article['abstract'][:100].lower().strip()}"]
+    doi = normalize_doi(article.get("doi"))
+    if doi:
+        keys.append(f"doi:{doi}")
+    return keys
+
+
+class DedupIndex:
+    """Множество ключей уже собранных статей в memory-mapped хеш-таблице на диске.
+
+    Файл — массив uint64 размера степени двойки с открытой адресацией (линейное пробирование);
+    в ячейке — 64-битный отпечаток blake2b ключа, 0 — пустая ячейка. Проверка и вставка — O(1)
+    без чтения raw.jsonl; при заполнении больше чем на половину таблица пересобирается вдвое больше.
+    """
+
+    def __init__(self, path: Path, capacity: int = DEDUP_INITIAL_CAPACITY):
+        self.path = Path(path)
+        if not self.path.exists():
+            self._create(self.path, capacity)
+        self._table = np.memmap(self.path, dtype=np.uint64, mode="r+")
+        self._mask = len(self._table) - 1
+        self.size = int(np.count_nonzero(self._table))
+
+    @staticmethod
+    def _create(path: Path, capacity: int):
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        np.zeros(capacity, dtype=np.uint64).tofile(path)
+
+    @staticmethod
+    def fingerprint(key: str) -> int:
+        value = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        return value or 1
+
+    def _slot(self, fingerprint: int) -> Tuple[int, bool]:
+        """(ячейка, найден ли отпечаток): ячейка с отпечатком или первая пустая на его пути."""
+        slot = fingerprint & self._mask
+        while True:
+            value = int(self._table[slot])
+            if value == fingerprint:
+                return slot, True
+            if value == 0:
+                return slot, False
+            slot = (slot + 1) & self._mask
+
+    def __contains__(self, key: str) -> bool:
+        return self._slot(self.fingerprint(key))[1]
+
+    def _insert(self, fingerprint: int) -> bool:
+        slot, found = self._slot(fingerprint)
+        if found:
+            return False
+        self._table[slot] = fingerprint
+        self.size += 1
+        if self.size * 2 > len(self._table):
+            self._grow()
+        return True
+
+    def add(self, keys: List[str]) -> bool:
+        """Добавляет ключи статьи; True, если ни одного из них ещё не было."""
+        fingerprints = [self.fingerprint(key) for key in keys]
+        new = not any(self._slot(fp)[1] for fp in fingerprints)
+        for fp in fingerprints:
+            self._insert(fp)
+        return new
+
+    def _grow(self):
+        values = np.array(self._table[self._table != 0])
+        tmp_path = self.path.with_suffix(".tmp")
+        self._create(tmp_path, len(self._table) * 2)
+        del self._table
+        self._table = np.memmap(tmp_path, dtype=np.uint64, mode="r+")
+        self._mask = len(self._table) - 1
+        self.size = 0
+        for value in values.tolist():
+            self._table[self._slot(value)[0]] = value
+            self.size += 1
+        self.flush()
+        del self._table
+        tmp_path.replace(self.path)
+        self._table = np.memmap(self.path, dtype=np.uint64, mode="r+")
+
+    def flush(self):
+        self._table.flush()
+
+
+class HarvestState:
+    """Чекпоинт сбора: курсор каждой пары (источник, ключевое слово) и зафиксированный размер raw.jsonl.
+
+    Сохраняется после каждой записанной страницы, поэтому прерванный сбор продолжается с места
+    остановки. Если raw.jsonl длиннее зафиксированного (сбой между записью статей и чекпоинтом),
+    хвост дочитывается в индекс дублей, а оборванная последняя строка отрезается.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.data = {"raw_bytes": None, "articles": None, "streams": {}}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    def stream(self, source: str, keyword: str) -> Dict:
+        return self.data["streams"].setdefault(source, {}).setdefault(
+            keyword, {"cursor": None, "pages": 0, "done": False}
+        )
+
+    def advance(self, source: str, keyword: str, next_cursor, max_pages: int):
+        stream = self.stream(source, keyword)
+        stream["pages"] += 1
+        stream["cursor"] = next_cursor
+        stream["done"] = next_cursor is None or stream["pages"] >= max_pages
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        tmp_path.replace(self.path)
+
+
+class ArticleStore:
+    """raw.jsonl с индексом дублей: дописывает только статьи, которых ещё нет в корпусе."""
+
+    def __init__(self, raw_path: Path, index_path: Path, state: HarvestState):
+        self.raw_path = Path(raw_path)
+        self.state = state
+        rebuild = not Path(index_path).exists()
+        self.index = DedupIndex(index_path)
+        committed = state.data["raw_bytes"]
+        if rebuild or committed is None or state.data["articles"] is None:
+            # первый запуск с индексом: один проход по корпусу, дальше он не читается
+            self.articles = self._scan(0, index_new=True)
+        else:
+            self.articles = state.data["articles"] + self._scan(committed, index_new=True)
+        self._commit()
+
+    def _scan(self, offset: int, index_new: bool) -> int:
+        if not self.raw_path.exists():
+            return 0
+        count = 0
+        good_bytes = offset
+        with open(self.raw_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                good_bytes += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    article = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                count += 1
+                if index_new and article.get("title") and article.get("abstract"):
+                    self.index.add(dedup_keys(article))
+        if good_bytes < self.raw_path.stat().st_size:
+            # оборванная при сбое последняя строка
+            with open(self.raw_path, "r+b") as f:
+                f.truncate(good_bytes)
+        return count
+
+    def _commit(self):
+        self.index.flush()
+        self.state.data["raw_bytes"] = self.raw_path.stat().st_size if self.raw_path.exists() else 0
+        self.state.data["articles"] = self.articles
+        self.state.save()
+
+    def add(self, articles: List[Dict]) -> int:
+        unique = []
+        page_keys = []
+        seen = set()
+        for art in articles:
+            if not (art.get("title") and art.get("abstract")):
+                continue
+            keys = dedup_keys(art)
+            if not any(key in seen or key in self.index for key in keys):
+                unique.append(art)
+            seen.update(keys)
+            page_keys.append(keys)
+        # сначала статьи на диск, потом их ключи в индекс: при сбое между ними хвост raw.jsonl
+        # дочитается в индекс при следующем запуске, а ключ без записанной статьи не появится никогда
+        if unique:
+            with open(self.raw_path, "a", encoding="utf-8") as f:
+                for art in unique:
+                    f.write(json.dumps(art, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        for keys in page_keys:
+            self.index.add(keys)
+        self.articles += len(unique)
+        return len(unique)
+
+    def commit_page(self, source: str, keyword: str, articles: List[Dict], next_cursor, max_pages: int) -> int:
+        """Записывает страницу и продвигает курсор — именно в этом порядке."""
+        saved = self.add(articles)
+        self.state.advance(source, keyword, next_cursor, max_pages)
+        self._commit()
+        return saved
+
+
+SEARCHES = {
+    "arxiv": search_arxiv,
+    "openalex": search_openalex,
+    "semantic_scholar": search_semantic_scholar,
+}
+
+
+def harvest(keywords: List[str], clients: Dict[str, SourceClient], store: ArticleStore,
+            target: int = None, workers: int = HARVEST_WORKERS, max_pages: int = MAX_PAGES_PER_QUERY):
+    """Листает выдачу всех источников по всем ключевым словам параллельно, продолжая с чекпоинта.
+
+    Частоту запросов к каждому источнику ограничивает его TokenBucket, поэтому потоков может быть больше,
+    чем источников: пока один ждёт ответа, другой уже отправляет следующий запрос. Страницы записываются
+    в основном потоке, после каждой следующая страница той же пары ставится в очередь. Пара, на которой
+    запрос так и не удался, остаётся на своём курсоре до следующего запуска. Сбор останавливается,
+    когда в корпусе target статей.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="harvest") as executor:
+        pending = {}
+
+        def submit(name: str, keyword: str):
+            cursor = store.state.stream(name, keyword)["cursor"]
+            pending[executor.submit(SEARCHES[name], clients[name], keyword, cursor)] = (name, keyword)
+
+        for keyword in keywords:
+            for name in clients:
+                if not store.state.stream(name, keyword)["done"]:
+                    submit(name, keyword)
+        try:
+            while pending and (target is None or store.articles < target):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, keyword = pending.pop(future)
+                    try:
+                        articles, next_cursor = future.result()
+                    except Exception as e:
+                        print(f"{name} '{keyword}': ошибка {e}; продолжим с этой страницы при следующем запуске")
+                        continue
+                    saved = store.commit_page(name, keyword, articles, next_cursor, max_pages)
+                    print(f"{name} '{keyword}': новых {saved} из {len(articles)}, всего {store.articles}")
+                    if not store.state.stream(name, keyword)["done"]:
+                        submit(name, keyword)
+        finally:
+            for future in pending:
+                future.cancel()
+
 
 def main():
     print("Запуск парсинга металлургических статей.")
     print(f"Цель: собрать минимум {MIN_ARTICLES} статей")
-    
-    existing_articles = []
-    if RAW_OUTPUT.exists():
-        with open(RAW_OUTPUT, "r", encoding="utf-8") as f:
-            existing_articles = [json.loads(line) for line in f if line.strip()]
-        print(f"Уже собрано: {len(existing_articles)} статей")
-    
-    all_articles = existing_articles.copy()
-    
-    for keyword in KEYWORDS:
-        if len(all_articles) >= MIN_ARTICLES * 2:
-            break
-        print(f"\nПоиск: '{keyword}'")
-        
-        # ArXiv
-        arxiv = search_arxiv(keyword)
-        save_jsonl(arxiv, RAW_OUTPUT)
-        all_articles.extend(arxiv)
-        time.sleep(random.uniform(*REQUEST_DELAY))
-        
-        # OpenAlex
-        openalex = search_openalex(keyword)
-        save_jsonl(openalex, RAW_OUTPUT)
-        all_articles.extend(openalex)
-        time.sleep(random.uniform(*REQUEST_DELAY))
-        
-        # Semantic Scholar
-        ss = search_semantic_scholar(keyword)
-        save_jsonl(ss, RAW_OUTPUT)
-        all_articles.extend(ss)
-        time.sleep(random.uniform(*REQUEST_DELAY))
-        
-        print(f"Текущий итог: {len(all_articles)} статей")
-    
-    print(f"\nСобрано: {len(all_articles)} статей")
+
+    store = ArticleStore(RAW_OUTPUT, DEDUP_INDEX_FILE, HarvestState(HARVEST_STATE_FILE))
+    print(f"Уже собрано: {store.articles} статей")
+
+    clients = make_clients()
+    start = time.perf_counter()
+    try:
+        harvest(KEYWORDS, clients, store, target=MIN_ARTICLES * 2)
+    finally:
+        for client in clients.values():
+            client.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nСобрано: {store.articles} статей за {elapsed:.0f} с")
+    for client in clients.values():
+        print(f"  {client.name}: запросов {client.requests}, повторов {client.retries}")
     print(f"Файл: {RAW_OUTPUT}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
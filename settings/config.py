@@ -9,9 +9,76 @@ DATA_DIR = BASE_DIR / "data"
 FAISS_DIR = BASE_DIR / "faiss_index"
 RAW_FILE = DATA_DIR / "raw.jsonl"
 CHUNKS_FILE = DATA_DIR / "clean.jsonl"
+DEDUP_CHUNKS_FILE = DATA_DIR / "clean_dedup.jsonl"
+DEDUP_REPORT_FILE = DATA_DIR / "dedup_report.json"
 RAW_OUTPUT = DATA_DIR / "raw.jsonl"
+# история чатов (SQLite в режиме WAL); chat_history.json прежнего формата переносится при первом запуске
+CHAT_DB_FILE = Path("chat_history.db")
+CHAT_LEGACY_FILE = Path("chat_history.json")
 
 
 
 
 
+# кэш эмбеддингов запросов (память + диск)
+QUERY_CACHE_DIR = Path("cache") / "query_embeddings"
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_DISK_SIZE = 100_000  # векторов на диске; файл растёт по мере записи
+QUERY_CACHE_POLICY = "lru"  # lru | lfu | fifo
+
+# пул клиентов GigaChat (None — адреса по умолчанию из SDK; для тестов можно указать локальный mock-сервер)
+GIGACHAT_BASE_URL = None
+GIGACHAT_AUTH_URL = None
+GIGACHAT_SCOPE = "GIGACHAT_API_PERS"
+GIGACHAT_TIMEOUT = 120
+GIGACHAT_VERIFY_SSL = False
+GIGACHAT_MAX_IN_FLIGHT = 4  # одновременных запросов на одну модель
+GIGACHAT_TOKEN_REFRESH_MARGIN = 60  # секунд до истечения токена, когда он обновляется заранее
+
+# фоновые задачи генерации (поверх конвейера rag.pipeline)
+JOB_WORKERS = 4  # задач, выполняющихся одновременно; остальные ждут в очереди
+JOB_QUEUE_SIZE = 16
+JOB_TIMEOUT = 300  # секунд на одну задачу
+JOB_HISTORY_SIZE = 100  # сколько завершённых задач хранить для опроса
+JOB_POLL_INTERVAL = 1.0  # секунд между опросами статуса в UI
+
+# кэш ответов GigaChat
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 24 * 3600  # секунд
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.7  # при большей температуре кэш не используется
+# порог косинусной близости вопросов при тех же chunk_id контекста; None — только точное совпадение.
+# e5 даёт разным коротким вопросам на одну тему близость 0.95 и выше, поэтому порог выше — почти перефразировка
+RESPONSE_CACHE_SIMILARITY = 0.98
+
+# тип FAISS индекса: flat | hnsw:M=..,efConstruction=..,efSearch=.. | ivf:nlist=..,nprobe=.. | ivfpq:nlist=..,m=..,nbits=..,nprobe=..
+# (ivfpq обучается минимум на 2**nbits векторах)
+INDEX_SPEC = "flat"
+INDEX_MMAP = True  # открывать index.faiss через memory-map (общая копия в page cache для всех процессов)
+
+# гибридный поиск: dense (FAISS) + лексический (BM25), слияние reciprocal rank fusion
+RETRIEVAL_MODE = "hybrid"  # hybrid | dense | lexical
+RETRIEVAL_CANDIDATES = 30  # кандидатов из каждого списка перед слиянием
+RRF_K = 60
+LEXICAL_FALLBACK = True  # пока модель эмбеддингов загружается, отвечать только по BM25
+
+# сборка контекста для GigaChat под бюджет токенов
+QA_CONTEXT_TOKENS = 4000
+HYPOTHESES_CONTEXT_TOKENS = 6000
+CONTEXT_MMR_LAMBDA = 0.7  # 1 — только релевантность, 0 — только разнообразие
+CONTEXT_MIN_FRAGMENT_TOKENS = 200  # остаток бюджета меньше этого не добиваем обрезанным фрагментом
+
+# переранжирование кандидатов cross-encoder (нужен sentence-transformers)
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # многоязычный: русский запрос, английские статьи
+RERANK_CANDIDATES = 30  # сколько кандидатов поиска оценивать
+RERANK_BATCH_SIZE = 16
+RERANK_TIME_BUDGET = 1.5  # секунд на запрос; при превышении остаётся порядок поиска
+RERANK_CACHE_SIZE = 10_000  # оценок (запрос, chunk_id) в памяти
+RERANK_MAX_LENGTH = 512  # токенов на пару запрос + чанк
+RERANK_PAIR_TIME = 0.02  # с на пару до первого замера; дальше — измеренное на батчах
+
+# Почти-дубликаты статей (scripts/near_duplicates.py)
+NEAR_DUP_SHINGLE = 3  # слов в шингле
+NEAR_DUP_PERMUTATIONS = 128  # длина MinHash-сигнатуры
+NEAR_DUP_BANDS = 32  # полос LSH: 128 / 32 = 4 строки, кандидатом становится пара с Jaccard от ~0.4
+NEAR_DUP_THRESHOLD = 0.7  # минимальный Jaccard шинглов для склейки
@@ -0,0 +1,8 @@
+import tempfile
+from pathlib import Path
+import settings.config as config
+
+# Пути в settings/config.py указывают на рабочую машину, а scripts.parse создаёт DATA_DIR при импорте:
+# на время тестов каталог данных переносится во временный.
+config.DATA_DIR = Path(tempfile.mkdtemp(prefix="ai-agent-data-"))
+config.RAW_FILE = config.RAW_OUTPUT = config.DATA_DIR / "raw.jsonl"
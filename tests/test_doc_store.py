@@ -0,0 +1,19 @@
+import pytest
+from langchain_core.documents import Document
+from doc_store import MmapDocstore, ReadOnlyDocstoreError, write_docstore
+
+
+def test_docstore_round_trip_and_is_read_only(tmp_path):
+    docs = [Document(page_content=f"текст {i}", metadata={"chunk_id": f"c{i}", "year": 2020 + i, "authors": ["A"],
+                                                          "total_tokens": 10 * i, "is_full_text": i % 2 == 1})
+            for i in range(3)]
+    write_docstore(docs, tmp_path / "docstore")
+    store = MmapDocstore(tmp_path / "docstore")
+    assert len(store) == 3
+    assert store.search("2").page_content == "текст 2"
+    assert store.get_field(1, "year") == 2021 and store.get_field(1, "is_full_text") is True
+    assert store.search("3") == "ID 3 not found."
+    with pytest.raises(ReadOnlyDocstoreError):
+        store.add({"3": docs[0]})
+    with pytest.raises(ReadOnlyDocstoreError):
+        store.delete(["0"])
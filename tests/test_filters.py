@@ -0,0 +1,70 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import rag
+from doc_store import DOCSTORE_DIRNAME, write_docstore
+
+DIM = 8
+ROWS = 21  # не кратно 8: последний байт битовой карты заполнен не целиком
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0] * DIM
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def make_docs(n):
+    return [Document(page_content=f"chunk {i}", metadata={
+        "chunk_id": f"c{i}", "year": 2000 + i % 3, "country": "Germany" if i % 2 else "Japan",
+        "source": f"https://openalex.org/W{i}"}) for i in range(n)]
+
+
+def write_index(index_dir, docs):
+    vectors = np.random.default_rng(0).random((len(docs), DIM), dtype=np.float32)
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors)
+    store = InMemoryDocstore({str(i): doc for i, doc in enumerate(docs)})
+    FAISS(FakeEmbeddings(), index, store, {i: str(i) for i in range(len(docs))}).save_local(str(index_dir))
+
+
+@pytest.fixture
+def make_resources(tmp_path, monkeypatch):
+    def make(docs, docstore_docs=None):
+        write_index(tmp_path, docs)
+        write_docstore(docs if docstore_docs is None else docstore_docs, tmp_path / DOCSTORE_DIRNAME)
+        resources = rag.RetrievalResources(tmp_path)
+        resources._embeddings = FakeEmbeddings()
+        monkeypatch.setattr(rag, "resources", resources)
+        return resources
+    return make
+
+
+def expected_rows(docs, year, country):
+    return {i for i, doc in enumerate(docs) if doc.metadata["year"] == year and doc.metadata["country"] == country}
+
+
+def test_filtered_search_returns_only_selected_rows(make_resources):
+    docs = make_docs(ROWS)
+    make_resources(docs)
+    filters = rag.normalize_filters({"year": (2001, 2001), "country": ["Germany"]})
+    rows = rag._dense_rows("steel", ROWS, filters)
+    assert set(rows) == expected_rows(docs, 2001, "Germany")
+
+
+def test_stale_filters_are_rebuilt_for_loaded_index(make_resources):
+    # index.faiss пересобран на 21 чанк, а хранилище чанков и filters.npz остались от сборки на 13:
+    # индекс читается из index.pkl, битовые карты строятся по нему заново
+    docs = make_docs(ROWS)
+    resources = make_resources(docs, docstore_docs=docs[:13])
+    assert resources.filter_index.size == 13
+    filters = rag.normalize_filters({"year": (2002, 2002), "country": ["Japan"]})
+    rows = rag._dense_rows("steel", ROWS, filters)
+    assert resources.filter_index.size == ROWS
+    assert set(rows) == expected_rows(docs, 2002, "Japan")
+    assert max(rows) >= 13
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from gigachat.context import authorization_cvar
+from gigachat.exceptions import AuthenticationError
+from rag import GigaChatClientPool, GigaChatTokenCache
+
+CREDENTIALS = "Y2xpZW50OnNlY3JldA=="
+
+
+class AuthServer:
+    """Заглушка OAuth GigaChat: выдаёт токены token-1, token-2, ... со сроком lifetime секунд."""
+
+    def __init__(self, lifetime: float, latency: float = 0.0):
+        self.lifetime = lifetime
+        self.latency = latency
+        self.status = 200
+        self.issued = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(server.latency)
+                with server.lock:
+                    server.issued += 1
+                    body = {"access_token": f"token-{server.issued}",
+                            "expires_at": int((time.time() + server.lifetime) * 1000)}
+                data = json.dumps(body).encode() if server.status == 200 else b"{}"
+                self.send_response(server.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/oauth"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def test_token_is_reused_until_refresh_margin():
+    with AuthServer(lifetime=1.5) as server:
+        cache = GigaChatTokenCache(CREDENTIALS, auth_url=server.url, refresh_margin=1.0)
+        assert cache.get() == "token-1"
+        assert cache.get() == "token-1"
+        # до истечения остаётся меньше refresh_margin — токен обновляется заранее
+        time.sleep(0.6)
+        assert cache.get() == "token-2"
+    assert cache.refreshes == 2
+
+
+def test_concurrent_callers_share_one_refresh():
+    with AuthServer(lifetime=600, latency=0.2) as server:
+        cache = GigaChatTokenCache(CREDENTIALS, auth_url=server.url, refresh_margin=60)
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(cache.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert tokens == ["token-1"] * 8
+    assert server.issued == 1
+
+
+def test_invalidate_forces_new_token():
+    with AuthServer(lifetime=600) as server:
+        cache = GigaChatTokenCache(CREDENTIALS, auth_url=server.url, refresh_margin=60)
+        assert cache.get() == "token-1"
+        cache.invalidate()
+        assert cache.get() == "token-2"
+
+
+def test_rejected_credentials_are_not_cached():
+    with AuthServer(lifetime=600) as server:
+        cache = GigaChatTokenCache(CREDENTIALS, auth_url=server.url, refresh_margin=60)
+        server.status = 401
+        with pytest.raises(AuthenticationError):
+            cache.get()
+        server.status = 200
+        assert cache.get() == "token-2"
+    assert cache.refreshes == 1
+
+
+def test_lease_sets_token_and_drops_it_after_auth_error():
+    async def lease_twice(pool):
+        async with pool.alease("GigaChat", 0.1):
+            first = authorization_cvar.get()
+        with pytest.raises(AuthenticationError):
+            async with pool.alease("GigaChat", 0.1):
+                raise AuthenticationError("/chat/completions", 401, b"", {})
+        async with pool.alease("GigaChat", 0.1):
+            second = authorization_cvar.get()
+        return first, second
+
+    with AuthServer(lifetime=600) as server:
+        pool = GigaChatClientPool(credentials=CREDENTIALS, auth_url=server.url)
+        assert asyncio.run(lease_twice(pool)) == ("Bearer token-1", "Bearer token-2")
+    assert pool.stats()["token_refreshes"] == 2
@@ -0,0 +1,71 @@
+import time
+import pytest
+import requests
+from scripts import parse
+from scripts.benchmark_harvest import StubServer
+from scripts.parse import SourceClient
+
+PARAMS = {"search": "steel", "per_page": 5}
+
+
+def stub(rate, burst=1, error_rate=0.0):
+    return StubServer({"openalex": {"rate": rate, "burst": burst}}, latency=0.0, error_rate=error_rate,
+                      results_per_query=20)
+
+
+def client(server, rate, burst=1, max_retries=parse.MAX_RETRIES):
+    return SourceClient("openalex", f"{server.base_url}/openalex", rate, burst, max_retries=max_retries)
+
+
+def test_requests_are_spaced_by_rate_limit():
+    with stub(rate=10, burst=2) as server:
+        source = client(server, rate=10, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            assert len(source.get(PARAMS).json()["results"]) == 5
+        elapsed = time.monotonic() - started
+        source.close()
+    # два запроса подряд из запаса, остальные четыре — по одному в 0.1 с
+    assert elapsed >= 0.35
+    assert server.counts == {("openalex", 200): 6}
+    assert source.retries == 0
+
+
+def test_429_waits_for_retry_after():
+    with stub(rate=1) as server:
+        # клиент настроен чаще, чем разрешает сервер, и упирается в 429
+        source = client(server, rate=100)
+        source.get(PARAMS)
+        started = time.monotonic()
+        resp = source.get(PARAMS)
+        elapsed = time.monotonic() - started
+        source.close()
+    assert resp.ok
+    assert server.counts[("openalex", 429)] == 1
+    assert source.retries == 1
+    # заглушка отвечает Retry-After: 1, случайная добавка экспоненциальной паузы к нему не прибавляется
+    assert 0.95 <= elapsed < 1.5
+
+
+def test_retries_are_capped(monkeypatch):
+    monkeypatch.setattr(parse, "BACKOFF_BASE", 0.01)
+    with stub(rate=100, burst=100, error_rate=1.0) as server:
+        source = client(server, rate=100, burst=100, max_retries=2)
+        with pytest.raises(requests.HTTPError) as error:
+            source.get(PARAMS)
+        source.close()
+    assert error.value.response.status_code == 503
+    assert server.counts == {("openalex", 503): 3}
+    assert source.requests == 3 and source.retries == 2
+
+
+def test_connection_errors_are_retried_then_raised(monkeypatch):
+    monkeypatch.setattr(parse, "BACKOFF_BASE", 0.01)
+    with stub(rate=100) as server:
+        url = server.base_url
+    # сервер остановлен: соединение отклоняется на каждой попытке
+    source = SourceClient("openalex", f"{url}/openalex", 100, 100, max_retries=1, timeout=1)
+    with pytest.raises(requests.ConnectionError):
+        source.get(PARAMS)
+    source.close()
+    assert source.requests == 2 and source.retries == 1
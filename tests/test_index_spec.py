@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from index_spec import build_index, parse_spec
+
+
+def vectors(n, dim=16):
+    return np.random.default_rng(0).random((n, dim), dtype=np.float32)
+
+
+def test_ivfpq_needs_enough_training_vectors():
+    with pytest.raises(ValueError, match="не меньше 256 векторов"):
+        build_index(parse_spec("ivfpq:nlist=64,m=4,nbits=8"), vectors(200))
+
+
+def test_small_corpus_builds_with_clamped_nlist_and_smaller_nbits():
+    assert build_index(parse_spec("ivfpq:nlist=64,m=4,nbits=6"), vectors(100)).ntotal == 100
+    assert build_index(parse_spec("ivf:nlist=64"), vectors(20)).ntotal == 20
@@ -0,0 +1,51 @@
+import json
+from scripts.near_duplicates import deduplicate
+
+ABSTRACT = ("The phenomenon of solid inclusion nucleation and growth during the liquid steel deoxidation process "
+            "is studied numerically. It is shown that the diffusion of atoms, the Ostwald ripening effect and "
+            "Brownian movement together control the growth of small size particles.")
+
+
+def chunk(source, index, text, **meta):
+    return {"chunk_id": f"{source}_{index}", "source": source, "title": "Inclusion growth", "chunk_text": text,
+            "total_tokens": len(text.split()), **meta}
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def run(tmp_path, rows):
+    write_jsonl(tmp_path / "clean.jsonl", rows)
+    stats, merges = deduplicate(tmp_path / "clean.jsonl", tmp_path / "clean_dedup.jsonl", tmp_path / "report.json")
+    return stats, merges, read_jsonl(tmp_path / "clean_dedup.jsonl")
+
+
+def test_verbatim_duplicate_chunk_is_written_once(tmp_path):
+    original = chunk("openalex:W1", 0, ABSTRACT, year=2003)
+    other = chunk("openalex:W2", 0, "Quantitative study of carbonitride precipitation in microalloyed hot strip steel.")
+    stats, _, rows = run(tmp_path, [original, other, dict(original)])
+    assert [row["chunk_id"] for row in rows] == ["openalex:W1_0", "openalex:W2_0"]
+    assert stats["chunks_repeated"] == 1
+
+
+def test_same_text_under_new_chunk_id_is_dropped(tmp_path):
+    stats, _, rows = run(tmp_path, [chunk("openalex:W1", 0, ABSTRACT), chunk("openalex:W1", 1, ABSTRACT)])
+    assert len(rows) == 1
+    assert stats["chunks_repeated"] == 1
+
+
+def test_near_duplicate_article_keeps_most_complete_record(tmp_path):
+    sparse = chunk("arxiv:1", 0, ABSTRACT + " Authors: L. Zhang", year=2003)
+    complete = chunk("openalex:W1", 0, "Abstract " + ABSTRACT, year=2003, doi="10.1/x", pdf_url="http://x/pdf")
+    stats, merges, rows = run(tmp_path, [sparse, complete])
+    assert [row["source"] for row in rows] == ["openalex:W1"]
+    assert merges[0]["dropped"][0]["source"] == "arxiv:1"
+    assert stats["articles_dropped"] == 1
@@ -0,0 +1,58 @@
+import json
+import pytest
+from scripts import parse
+from scripts.parse import ArticleStore, HarvestState, dedup_keys
+
+
+def article(n, **extra):
+    return {"title": f"Article {n}", "abstract": f"Abstract of article {n}.", "source": "openalex", **extra}
+
+
+def open_store(tmp_path):
+    state = HarvestState(tmp_path / "state.json")
+    return ArticleStore(tmp_path / "raw.jsonl", tmp_path / "index.u64", state)
+
+
+def raw_titles(tmp_path):
+    with open(tmp_path / "raw.jsonl", "r", encoding="utf-8") as f:
+        return [json.loads(line)["title"] for line in f]
+
+
+def test_store_skips_duplicates_within_page_and_corpus(tmp_path):
+    store = open_store(tmp_path)
+    assert store.add([article(1), article(1), article(2, doi="10.1/x")]) == 2
+    assert store.add([article(3, doi="https://doi.org/10.1/X"), article(2), article(4)]) == 1
+    assert raw_titles(tmp_path) == ["Article 1", "Article 2", "Article 4"]
+    assert store.articles == 3
+
+
+def test_failed_write_leaves_articles_unindexed(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+
+    def fail(fd):
+        raise OSError("диск переполнен")
+
+    monkeypatch.setattr(parse.os, "fsync", fail)
+    with pytest.raises(OSError):
+        store.add([article(1)])
+    assert not any(key in store.index for key in dedup_keys(article(1)))
+
+    monkeypatch.undo()
+    (tmp_path / "raw.jsonl").unlink()
+    assert store.add([article(1)]) == 1
+    assert raw_titles(tmp_path) == ["Article 1"]
+
+
+def test_uncommitted_tail_is_indexed_on_restart(tmp_path):
+    store = open_store(tmp_path)
+    store.commit_page("openalex", "steel", [article(1)], next_cursor="c1", max_pages=10)
+    # сбой после записи страницы, но до чекпоинта и сброса индекса
+    store.add([article(2)])
+    with open(tmp_path / "raw.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"title": "оборванная')
+    del store
+
+    restarted = open_store(tmp_path)
+    assert restarted.articles == 2
+    assert restarted.add([article(2), article(3)]) == 1
+    assert raw_titles(tmp_path) == ["Article 1", "Article 2", "Article 3"]
@@ -0,0 +1,73 @@
+import threading
+import time
+from langchain_core.documents import Document
+from reranker import CrossEncoderReranker
+
+
+class SlowModel:
+    """Оценка пары — длина чанка; каждая пара занимает pair_time секунд."""
+
+    def __init__(self, pair_time: float):
+        self.pair_time = pair_time
+        self.calls = 0
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.calls += 1
+        time.sleep(self.pair_time * len(pairs))
+        return [len(text) for _, text in pairs]
+
+
+def make_reranker(model, time_budget, pair_time):
+    reranker = CrossEncoderReranker(batch_size=4, time_budget=time_budget, pair_time=pair_time)
+    reranker._model = model
+    return reranker
+
+
+def make_docs(n):
+    return [Document(page_content="x" * (i + 1), metadata={"chunk_id": f"c{i}"}) for i in range(n)]
+
+
+def test_reranks_and_caches_scores():
+    model = SlowModel(0.0)
+    reranker = make_reranker(model, time_budget=1.0, pair_time=0.001)
+    docs = make_docs(6)
+    assert [d.metadata["chunk_id"] for d in reranker.rerank("q", docs, 3)] == ["c5", "c4", "c3"]
+    calls = model.calls
+    assert reranker.rerank("Q ", docs, 3) == reranker.rerank("q", docs, 3)
+    assert model.calls == calls and reranker.fallbacks == 0
+
+
+def test_first_batch_is_skipped_when_estimate_exceeds_budget():
+    model = SlowModel(0.1)
+    reranker = make_reranker(model, time_budget=0.2, pair_time=0.1)
+    docs = make_docs(8)
+    started = time.monotonic()
+    assert reranker.rerank("q", docs, 5) == docs[:5]
+    assert time.monotonic() - started < 0.05
+    assert model.calls == 0 and reranker.fallbacks == 1
+
+
+def test_measured_pair_time_stops_later_batches():
+    model = SlowModel(0.05)
+    reranker = make_reranker(model, time_budget=0.3, pair_time=0.001)
+    docs = make_docs(12)
+    started = time.monotonic()
+    assert reranker.rerank("q", docs, 5) == docs[:5]
+    assert time.monotonic() - started < 0.3
+    assert model.calls == 1 and reranker.pair_time > 0.02
+
+
+def test_waiting_for_busy_model_counts_against_budget():
+    model = SlowModel(0.0)
+    reranker = make_reranker(model, time_budget=0.2, pair_time=0.001)
+    reranker._predict_lock.acquire()
+    release = threading.Timer(1.0, reranker._predict_lock.release)
+    release.start()
+    try:
+        started = time.monotonic()
+        docs = make_docs(4)
+        assert reranker.rerank("q", docs, 2) == docs[:2]
+        assert time.monotonic() - started < 0.3
+        assert model.calls == 0 and reranker.fallbacks == 1
+    finally:
+        release.join()
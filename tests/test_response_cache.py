@@ -0,0 +1,40 @@
+import numpy as np
+from response_cache import ResponseCache
+
+ARGS = ("qa-template", "GigaChat", 0.1)
+CHUNKS = ["c1", "c2", "c3"]
+
+
+def vector_at(base: np.ndarray, cosine: float, seed: int) -> np.ndarray:
+    """Единичный вектор с заданной косинусной близостью к base."""
+    noise = np.random.default_rng(seed).standard_normal(len(base))
+    noise -= noise @ base * base
+    noise /= np.linalg.norm(noise)
+    return cosine * base + np.sqrt(1 - cosine ** 2) * noise
+
+
+BASE = vector_at(np.eye(1024)[0], 1.0, 0)
+
+
+def test_different_questions_on_same_topic_do_not_share_answer():
+    cache = ResponseCache()
+    cache.store(*ARGS, CHUNKS, {"question": "Как кальций модифицирует включения Al2O3?"}, "ответ про кальций",
+                query_vector=BASE)
+    # разные вопросы на одну тему: e5 даёт им близость около 0.95–0.97, а поиск — те же чанки
+    other = vector_at(BASE, 0.965, 1)
+    assert cache.lookup(*ARGS, CHUNKS, {"question": "Как титан влияет на включения Al2O3?"},
+                        query_vector=other) is None
+    assert cache.stats()["hits_semantic"] == 0
+
+
+def test_paraphrase_with_same_context_is_served_from_cache():
+    cache = ResponseCache()
+    cache.store(*ARGS, CHUNKS, {"question": "Как кальций модифицирует включения Al2O3?"}, "ответ про кальций",
+                query_vector=BASE)
+    paraphrase = vector_at(BASE, 0.99, 2)
+    assert cache.lookup(*ARGS, CHUNKS, {"question": "Каким образом кальций модифицирует включения Al2O3?"},
+                        query_vector=paraphrase) == "ответ про кальций"
+    assert cache.stats()["hits_semantic"] == 1
+    # тот же вопрос, но другой контекст — ответ не переиспользуется
+    assert cache.lookup(*ARGS, ["c1", "c4"], {"question": "Как кальций модифицирует включения Al2O3?"},
+                        query_vector=BASE) is None
@@ -0,0 +1,70 @@
+import random
+import pytest
+from truncation import truncate_to_tokens
+
+# Маленький BPE-подобный токенизатор: жадно берёт самую длинную пару букв/пробела из словаря,
+# иначе один байт. Как и у настоящего BPE, токены у края обрезанного текста могут отличаться
+# от токенов полного текста.
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz ."
+
+
+class FakeBPE:
+    name = "fake-bpe"
+
+    def __init__(self):
+        self.vocab = [bytes([b]) for b in range(256)]
+        self.vocab += [(a + b).encode() for a in ALPHABET for b in ALPHABET]
+        self.ids = {token: i for i, token in enumerate(self.vocab)}
+        self.max_token_value = len(self.vocab) - 1
+
+    def encode(self, text, disallowed_special=()):
+        data = text.encode("utf-8")
+        tokens, i = [], 0
+        while i < len(data):
+            pair = self.ids.get(data[i:i + 2]) if i + 1 < len(data) else None
+            if pair is not None:
+                tokens.append(pair)
+                i += 2
+            else:
+                tokens.append(data[i])
+                i += 1
+        return tokens
+
+    def decode_single_token_bytes(self, token):
+        return self.vocab[token]
+
+
+ENCODER = FakeBPE()
+WORDS = ["сталь", "steel", "inclusion", "deoxidation", "Al2O3", "nucleation", "growth", "a", "of", "—", "ultra-long-compound-word"]
+
+
+def random_text(rng: random.Random) -> str:
+    sentences = []
+    for _ in range(rng.randint(1, 12)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 40))]
+        sentences.append(" ".join(words) + rng.choice([".", "!", "?"]))
+    return rng.choice([" ", "  ", "\n"]).join(sentences)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_result_fits_budget(seed):
+    rng = random.Random(seed)
+    for _ in range(80):
+        text = random_text(rng)
+        max_tokens = rng.randint(1, 120)
+        result, tokens = truncate_to_tokens(text, max_tokens, ENCODER)
+        assert len(ENCODER.encode(result)) <= max_tokens
+        assert tokens == len(ENCODER.encode(result))
+
+
+def test_word_fallback_counts_ellipsis():
+    text = " ".join(["deoxidation"] * 50) + "."
+    result, tokens = truncate_to_tokens(text, 10, ENCODER)
+    assert result.endswith("...")
+    assert tokens == len(ENCODER.encode(result)) <= 10
+
+
+def test_short_text_is_unchanged():
+    text = "Steel. Inclusion growth."
+    assert truncate_to_tokens(text, 1000, ENCODER) == (text, len(ENCODER.encode(text)))
@@ -0,0 +1,106 @@
+import re
+from typing import Tuple
+import numpy as np
+import tiktoken
+
+# Обрезка текста до бюджета токенов по границам предложений (или слов, если не влезает
+# даже первое предложение). Текст токенизируется одним вызовом, а число токенов до каждой
+# границы берётся из префиксных сумм байтовых длин токенов — без вызова токенизатора на
+# каждое предложение или слово. Выбранный результат кодируется ещё раз, чтобы число токенов
+# было точным: токены у границы в отдельном тексте могут отличаться от токенов полного.
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+WORD_RE = re.compile(r'\S+')
+# токены у правого края обрезанного префикса могут отличаться от токенов полного текста
+PREFIX_MARGIN_TOKENS = 16
+ELLIPSIS = "..."
+_encoder = None
+_token_byte_lengths = {}
+
+
+def get_encoder():
+    # тот же токенизатор, которым clean_and_split считает chunk_tokens
+    global _encoder
+    if _encoder is None:
+        _encoder = tiktoken.encoding_for_model("gpt-4o")
+    return _encoder
+
+
+def token_byte_lengths(encoder=None) -> np.ndarray:
+    """Длина в байтах каждого токена словаря; строится один раз на процесс."""
+    encoder = encoder or get_encoder()
+    lengths = _token_byte_lengths.get(encoder.name)
+    if lengths is None:
+        lengths = np.zeros(encoder.max_token_value + 1, dtype=np.int64)
+        for token in range(len(lengths)):
+            try:
+                lengths[token] = len(encoder.decode_single_token_bytes(token))
+            except KeyError:
+                continue
+        _token_byte_lengths[encoder.name] = lengths
+    return lengths
+
+
+def _char_byte_offsets(text: str) -> np.ndarray:
+    """Байтовое смещение в UTF-8 для каждой позиции символа (len(text) + 1 значение)."""
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    sizes = 1 + (codepoints >= 0x80) + (codepoints >= 0x800) + (codepoints >= 0x10000)
+    offsets = np.zeros(len(text) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return offsets
+
+
+def _encode_prefix(text: str, max_tokens: int, encoder) -> Tuple[str, np.ndarray]:
+    """Кодирует начало текста, достаточное для выбора границы; возвращает его и концы токенов в байтах."""
+    limit = max(256, max_tokens * 8)
+    while True:
+        prefix = text[:limit]
+        tokens = encoder.encode(prefix, disallowed_special=())
+        if len(prefix) == len(text) or len(tokens) > max_tokens + PREFIX_MARGIN_TOKENS:
+            return prefix, np.cumsum(token_byte_lengths(encoder)[tokens])
+        limit *= 2
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoder=None) -> Tuple[str, int]:
+    """Возвращает (обрезанный текст, число токенов в нём)."""
+    encoder = encoder or get_encoder()
+    prefix, token_ends = _encode_prefix(text, max_tokens, encoder)
+    char_bytes = _char_byte_offsets(prefix)
+
+    def tokens_before(positions) -> np.ndarray:
+        # токены, целиком лежащие до позиции; пробел после границы уходит в следующий токен
+        return np.searchsorted(token_ends, char_bytes[np.asarray(positions, dtype=np.int64)], side="right")
+
+    boundaries = [m.start() for m in SENTENCE_SPLIT_RE.finditer(prefix)]
+    if len(prefix) == len(text):
+        boundaries.append(len(prefix))
+    if boundaries:
+        counts = tokens_before(boundaries)
+        n = int(np.searchsorted(counts, max_tokens, side="right"))
+        while n:
+            # токен на границе и пробелы, склеенные join, кодируются иначе, чем в полном тексте,
+            # поэтому итог кодируется заново: он не длиннее max_tokens токенов
+            result = " ".join(SENTENCE_SPLIT_RE.split(prefix, maxsplit=n)[:n])
+            tokens = len(encoder.encode(result, disallowed_special=()))
+            if tokens <= max_tokens:
+                return result, tokens
+            n -= 1
+
+    # не влезает даже первое предложение — режем его по словам, оставляя место под многоточие
+    sentence = prefix[:boundaries[0]] if boundaries else prefix
+    words = list(WORD_RE.finditer(sentence))
+    if words:
+        counts = tokens_before([m.end() for m in words])
+        n = int(np.searchsorted(counts, max_tokens - len(encoder.encode(ELLIPSIS)), side="right"))
+        while n:
+            # многоточие может слиться с последним словом в другие токены
+            result = " ".join(m.group() for m in words[:n]) + ELLIPSIS
+            tokens = len(encoder.encode(result, disallowed_special=()))
+            if tokens <= max_tokens:
+                return result, tokens
+            n -= 1
+    return "", 0
+
+
+def smart_truncate(text: str, max_tokens: int, encoder=None) -> str:
+    return truncate_to_tokens(text, max_tokens, encoder)[0]